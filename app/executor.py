@@ -0,0 +1,316 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional
+from weakref import WeakValueDictionary
+
+from app.models import (
+    EventRequest,
+    MicroCheck,
+    MicroCheckRequest,
+    MicroCheckResult,
+    RefreshTrace,
+    StartSessionRequest,
+    UIMutation,
+)
+from app.pipeline.engine import PipelineEngine
+from app.pipeline.session import Session
+from app.state import SessionStore
+
+
+EXECUTOR_MODES = ("inline", "thread", "process")
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+# Engine calls waiting for or holding a worker, plus requests waiting for a session
+# lock; past this the API answers 503.
+DEFAULT_MAX_PENDING = 64
+# Requests queued behind one session's lock; past this that session answers 503.
+DEFAULT_MAX_SESSION_WAITERS = 8
+WORKER_KB_RELOAD_INTERVAL_SECONDS = 5.0
+
+
+class ExecutorBusy(RuntimeError):
+    """Raised instead of queueing past max_pending calls in flight, or max_session_waiters on one session."""
+
+
+class EngineExecutor:
+    """Runs CPU-bound engine work off the event loop.
+
+    "thread" runs engine calls on a bounded thread pool against the app's engine.
+    "process" runs them on a process pool; each worker builds its own engine (KB,
+    flow packs, glossary) once, and sessions travel to it and back by pickling, so
+    the app's copy stays the one of record. "inline" runs them on the loop itself,
+    which is only sensible for tests and single-user demos.
+
+    Work that reads state only this process has (KB search rankings and cursors)
+    goes through run_local(), which uses the thread pool in every mode.
+    """
+
+    def __init__(
+        self,
+        engine: PipelineEngine,
+        mode: str = "thread",
+        workers: int = DEFAULT_WORKERS,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        max_session_waiters: int = DEFAULT_MAX_SESSION_WAITERS,
+    ) -> None:
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Unknown executor mode {mode!r}; expected one of {EXECUTOR_MODES}.")
+        self.engine = engine
+        self.mode = mode
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.max_session_waiters = max(1, max_session_waiters)
+        self._pending = 0
+        self._threads = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="engine")
+        self._processes: Optional[ProcessPoolExecutor] = None
+        if mode == "process":
+            self._processes = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(engine.tracing,),
+            )
+        self._session_locks: WeakValueDictionary[str, _SessionLock] = WeakValueDictionary()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def session_lock(self, session_id: str) -> "_SessionLock":
+        """Serializes mutations of one session; held across the engine call.
+
+        Entering it raises ExecutorBusy when max_session_waiters requests already wait
+        for the session, or when max_pending calls are in flight; waiting counts as pending.
+        """
+        lock = self._session_locks.get(session_id)
+        if lock is None:
+            lock = _SessionLock(self)
+            self._session_locks[session_id] = lock
+        return lock
+
+    async def start_session(self, request: StartSessionRequest) -> tuple[Session, list[MicroCheck], UIMutation]:
+        session, checks, mutation, traces = await self._run_engine(op_start_session, request)
+        self._record(session, traces)
+        return session, checks, mutation
+
+    async def apply_events(
+        self,
+        session: Session,
+        events: list[EventRequest],
+        budget_ms: Optional[float] = None,
+        defer_optional: bool = False,
+    ) -> tuple[Session, UIMutation]:
+        session, mutation, traces = await self._run_engine(op_apply_events, session, events, budget_ms, defer_optional)
+        self._record(session, traces)
+        return session, mutation
+
+    async def apply_micro_check(
+        self,
+        session: Session,
+        request: MicroCheckRequest,
+        budget_ms: Optional[float] = None,
+        defer_optional: bool = False,
+    ) -> tuple[Session, MicroCheckResult, UIMutation]:
+        session, result, mutation, traces = await self._run_engine(
+            op_apply_micro_check, session, request, budget_ms, defer_optional
+        )
+        self._record(session, traces)
+        return session, result, mutation
+
+    async def refresh_stale(self, session: Session) -> Session:
+        session, traces = await self._run_engine(op_refresh_stale, session)
+        self._record(session, traces)
+        return session
+
+    async def build_packet(self, session: Session) -> tuple[Session, str]:
+        return await self._run_engine(op_build_packet, session)
+
+    async def run_local(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """fn(*args, **kwargs) on the thread pool (inline in "inline" mode), within the pending bound."""
+        with self._slot():
+            if self.mode == "inline":
+                return fn(*args, **kwargs)
+            return await asyncio.get_running_loop().run_in_executor(self._threads, partial(fn, *args, **kwargs))
+
+    def shutdown(self) -> None:
+        self._threads.shutdown(wait=False, cancel_futures=True)
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
+
+    async def _run_engine(self, op: Callable[..., Any], *args: Any) -> Any:
+        with self._slot():
+            if self.mode == "inline":
+                return op(self.engine, *args)
+            loop = asyncio.get_running_loop()
+            if self._processes is not None:
+                return await loop.run_in_executor(self._processes, partial(_worker_op, op, *args))
+            return await loop.run_in_executor(self._threads, partial(op, self.engine, *args))
+
+    def _record(self, session: Session, traces: list[RefreshTrace]) -> None:
+        # Thread and inline calls ran on this engine, which already recorded them.
+        if self._processes is not None:
+            self.engine.record_refresh_traces(session.session_id, traces)
+
+    def _slot(self) -> "_PendingSlot":
+        if self._pending >= self.max_pending:
+            raise ExecutorBusy(f"{self._pending} engine calls already pending")
+        return _PendingSlot(self)
+
+
+class StaleRefresher:
+    """Runs sessions' deferred stages (session.stale) in the background, after their responses.
+
+    Jobs are keyed by session and coalesce: while one waits for the session's lock,
+    scheduling it again is a no-op, and once it has the lock it copies the session
+    as the latest call left it. The stages run on that copy without the lock, so
+    events on the session do not wait for them. The result is taken under the lock
+    only if no event or micro-check came in meanwhile; otherwise it is dropped, and
+    the job that call scheduled runs on the newer state. A job that finds nothing
+    stale (a later call caught up, or the session is gone) or no executor capacity
+    is dropped too; the stages stay in session.stale for the next call or job.
+    """
+
+    def __init__(self, executor: EngineExecutor, store: SessionStore) -> None:
+        self._executor = executor
+        self._store = store
+        # Latest job per session, and the sessions whose job has not started yet.
+        self._jobs: dict[str, asyncio.Task] = {}
+        self._queued: set[str] = set()
+
+    def schedule(self, session_id: str) -> None:
+        if session_id in self._queued:
+            return
+        self._queued.add(session_id)
+        job = asyncio.get_running_loop().create_task(self._run(session_id))
+        self._jobs[session_id] = job
+        job.add_done_callback(partial(self._finished, session_id))
+
+    async def wait(self, session_id: str) -> None:
+        """Until the session's latest job, if any, has finished (or been dropped)."""
+        job = self._jobs.get(session_id)
+        if job is not None:
+            # asyncio.wait() neither raises the job's error nor cancels it with the caller.
+            await asyncio.wait([job])
+
+    def shutdown(self) -> None:
+        for job in list(self._jobs.values()):
+            job.cancel()
+
+    async def _run(self, session_id: str) -> None:
+        engine = self._executor.engine
+        try:
+            async with self._executor.session_lock(session_id):
+                self._queued.discard(session_id)
+                session = self._store.get(session_id)
+                if session is None or not session.stale:
+                    return
+                snapshot = engine.stale_snapshot(session)
+            refreshed = await self._executor.refresh_stale(snapshot)
+            async with self._executor.session_lock(session_id):
+                session = self._store.get(session_id)
+                if session is not None and engine.adopt_stale(session, refreshed):
+                    self._store.save(session)
+        except ExecutorBusy:
+            self._queued.discard(session_id)
+
+    def _finished(self, session_id: str, job: asyncio.Task) -> None:
+        if self._jobs.get(session_id) is job:
+            del self._jobs[session_id]
+
+
+class _SessionLock:
+    # Only touched from the event loop, like _PendingSlot.
+    def __init__(self, executor: EngineExecutor) -> None:
+        self._executor = executor
+        self._lock = asyncio.Lock()
+        self._waiting = 0
+
+    async def __aenter__(self) -> None:
+        if self._waiting >= self._executor.max_session_waiters:
+            raise ExecutorBusy(f"{self._waiting} requests already waiting for this session")
+        with self._executor._slot():
+            self._waiting += 1
+            try:
+                await self._lock.acquire()
+            finally:
+                self._waiting -= 1
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        self._lock.release()
+
+
+class _PendingSlot:
+    # Only touched from the event loop, so a plain counter is enough.
+    def __init__(self, executor: EngineExecutor) -> None:
+        self._executor = executor
+
+    def __enter__(self) -> None:
+        self._executor._pending += 1
+
+    def __exit__(self, *exc_info: object) -> None:
+        self._executor._pending -= 1
+
+
+# Engine operations. Each returns everything it changed, so it gives the same result
+# whether it ran on the app's engine or on a process worker's.
+
+
+def op_start_session(
+    engine: PipelineEngine,
+    request: StartSessionRequest,
+) -> tuple[Session, list[MicroCheck], UIMutation, list[RefreshTrace]]:
+    session, checks, mutation = engine.start_session(request)
+    return session, checks, mutation, engine.refresh_traces(session.session_id)[-1:]
+
+
+def op_apply_events(
+    engine: PipelineEngine,
+    session: Session,
+    events: list[EventRequest],
+    budget_ms: Optional[float] = None,
+    defer_optional: bool = False,
+) -> tuple[Session, UIMutation, list[RefreshTrace]]:
+    mutation = engine.apply_events(session, events, budget_ms=budget_ms, defer_optional=defer_optional)
+    return session, mutation, engine.refresh_traces(session.session_id)[-1:]
+
+
+def op_apply_micro_check(
+    engine: PipelineEngine,
+    session: Session,
+    request: MicroCheckRequest,
+    budget_ms: Optional[float] = None,
+    defer_optional: bool = False,
+) -> tuple[Session, MicroCheckResult, UIMutation, list[RefreshTrace]]:
+    result, mutation = engine.apply_micro_check(session, request, budget_ms=budget_ms, defer_optional=defer_optional)
+    return session, result, mutation, engine.refresh_traces(session.session_id)[-1:]
+
+
+def op_refresh_stale(engine: PipelineEngine, session: Session) -> tuple[Session, list[RefreshTrace]]:
+    engine.refresh_stale(session)
+    return session, engine.refresh_traces(session.session_id)[-1:]
+
+
+def op_build_packet(engine: PipelineEngine, session: Session) -> tuple[Session, str]:
+    packet = engine.build_packet(session)
+    return session, packet
+
+
+_worker_engine: Optional[PipelineEngine] = None
+
+
+def _init_worker(tracing: bool) -> None:
+    global _worker_engine
+    # Forked workers inherit the server's signal handlers, which would only flag the
+    # server's copy to exit; the parent handles Ctrl-C and shuts the pool down.
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker_engine = PipelineEngine(tracing=tracing)
+    _worker_engine.kb.start_auto_reload(WORKER_KB_RELOAD_INTERVAL_SECONDS)
+
+
+def _worker_op(op: Callable[..., Any], *args: Any) -> Any:
+    assert _worker_engine is not None, "process worker was not initialized"
+    return op(_worker_engine, *args)
@@ -1,23 +1,43 @@
 from __future__ import annotations
 
 import json
+from contextlib import asynccontextmanager
 from pathlib import Path
+import time
+from threading import Lock
+from typing import Optional
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
-
+from pydantic import BaseModel
+
+from app.executor import (
+    DEFAULT_MAX_PENDING,
+    DEFAULT_MAX_SESSION_WAITERS,
+    DEFAULT_WORKERS,
+    EngineExecutor,
+    ExecutorBusy,
+    StaleRefresher,
+)
 from app.models import (
+    CitationsResponse,
+    EventBatchRequest,
     EventRequest,
     EventResponse,
     MicroCheckRequest,
     MicroCheckResponse,
     PacketResponse,
+    RefreshDebugResponse,
+    SearchResponse,
+    SessionState,
     StartSessionRequest,
     StartSessionResponse,
 )
 from app.pipeline.engine import PipelineEngine
+from app.pipeline.kb_search import MAX_PAGE_SIZE, KBSearch
+from app.pipeline.tracing import server_timing
 from app.state import store
 
 
@@ -25,11 +45,62 @@ ROOT = Path(__file__).resolve().parent.parent
 STATIC_DIR = ROOT / "static"
 SOURCE_INDEX = ROOT / "app" / "data" / "source_map.json"
 SCENARIOS_INDEX = ROOT / "data" / "scenarios" / "demo_cases.json"
+KB_RELOAD_INTERVAL_SECONDS = 5.0
+# Where engine work runs: "thread", "process" or "inline" (see app/executor.py).
+ENGINE_EXECUTOR_MODE = "thread"
+# Time pipeline spans and return them as a Server-Timing header on session routes.
+# Set before configure_executor(): process workers take it when their pool starts.
+PIPELINE_TRACING = False
+# Default engine time budget (ms) for event and micro-check calls; None runs every
+# stage. Stages that would overrun it (citations) are deferred: see session.stale.
+LATENCY_BUDGET_MS: Optional[float] = None
+# Answer events and micro-checks without retrieving citations, then retrieve them in a
+# background job per session; clients fetch them from /api/session/{id}/citations.
+BACKGROUND_CITATIONS = False
+
+engine = PipelineEngine(tracing=PIPELINE_TRACING)
+kb_search = KBSearch(engine.kb)
+executor = EngineExecutor(engine, mode=ENGINE_EXECUTOR_MODE)
+refresher = StaleRefresher(executor, store)
+
+
+def configure_executor(
+    mode: str = ENGINE_EXECUTOR_MODE,
+    workers: int = DEFAULT_WORKERS,
+    max_pending: int = DEFAULT_MAX_PENDING,
+    max_session_waiters: int = DEFAULT_MAX_SESSION_WAITERS,
+) -> EngineExecutor:
+    """Replace the engine executor; call before serving (e.g. from a launcher script)."""
+    global executor, refresher
+    executor.shutdown()
+    executor = EngineExecutor(
+        engine,
+        mode=mode,
+        workers=workers,
+        max_pending=max_pending,
+        max_session_waiters=max_session_waiters,
+    )
+    refresher = StaleRefresher(executor, store)
+    return executor
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    # Pick up a rebuilt knowledge_chunks.jsonl without a restart (which would drop sessions).
+    engine.kb.start_auto_reload(KB_RELOAD_INTERVAL_SECONDS)
+    try:
+        yield
+    finally:
+        engine.kb.stop_auto_reload()
+        refresher.shutdown()
+        executor.shutdown()
+
 
 app = FastAPI(
     title="VisaFlow OS",
     version="0.1.0",
     description="Adaptive visa workflow interface prototype (not legal advice).",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -42,27 +113,122 @@ app.add_middleware(
 
 app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
 
-engine = PipelineEngine()
+
+@app.exception_handler(ExecutorBusy)
+async def executor_busy(_: Request, exc: ExecutorBusy) -> JSONResponse:
+    return JSONResponse({"detail": f"Server busy: {exc}"}, status_code=503, headers={"Retry-After": "1"})
+
+
+_json_files: dict[Path, tuple[tuple[int, int], dict]] = {}
+_json_files_lock = Lock()
+
+
+def _json_file(path: Path, default: dict) -> dict:
+    """Parsed JSON file, re-read only when its size or mtime changes."""
+    stat = path.stat() if path.exists() else None
+    stamp = (stat.st_size, stat.st_mtime_ns) if stat else (0, 0)
+    with _json_files_lock:
+        cached = _json_files.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    payload = json.loads(path.read_text()) if path.exists() else default
+    with _json_files_lock:
+        _json_files[path] = (stamp, payload)
+    return payload
+
+
+async def _json_response(model: BaseModel, spans: Optional[dict[str, float]] = None) -> Response:
+    # Session payloads are large; encode them off the event loop.
+    if spans is None:
+        body = await executor.run_local(model.model_dump_json)
+        return Response(body, media_type="application/json")
+    body, serialize_ms = await executor.run_local(_timed_dump, model)
+    headers = {"Server-Timing": server_timing({**spans, "serialize": serialize_ms})}
+    return Response(body, media_type="application/json", headers=headers)
+
+
+def _timed_dump(model: BaseModel) -> tuple[str, float]:
+    started = time.perf_counter()
+    body = model.model_dump_json()
+    return body, (time.perf_counter() - started) * 1000
+
+
+def _budget(budget_ms: Optional[float]) -> Optional[float]:
+    return LATENCY_BUDGET_MS if budget_ms is None else budget_ms
+
+
+def _engine_spans(session_id: str) -> Optional[dict[str, float]]:
+    """Span timings of the session's latest engine call, or None when tracing is off."""
+    if not engine.tracing:
+        return None
+    traces = engine.refresh_traces(session_id)
+    return dict(traces[-1].spans) if traces else {}
 
 
 @app.get("/")
-def root() -> FileResponse:
+async def root() -> FileResponse:
     return FileResponse(STATIC_DIR / "index.html")
 
 
 @app.get("/api/health")
-def health() -> dict[str, str]:
-    return {"status": "ok", "product": "VisaFlow OS"}
+async def health() -> dict[str, str]:
+    return {"status": "ok", "product": "VisaFlow OS", "kb_version": engine.kb.version}
+
+
+@app.get("/api/kb/cache")
+async def kb_cache_stats() -> dict[str, int]:
+    return engine.kb.cache_stats()
+
+
+@app.post("/api/kb/reload", status_code=202)
+async def kb_reload() -> dict:
+    started = engine.kb.reload_in_background()
+    return {
+        "started": started,
+        "kb_version": engine.kb.version,
+        "last_error": engine.kb.last_reload_error,
+        "last_load": engine.kb.last_load,
+    }
+
+
+@app.get("/api/search", response_model=SearchResponse)
+async def search(
+    q: str = Query(min_length=1),
+    flow_id: str = "",
+    source_type: str = "",
+    school: str = Query(default="", description="School name or id; its sources are searched with USCIS"),
+    mode: str = "",
+    page_size: int = Query(default=10, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str = "",
+) -> Response:
+    try:
+        response = await executor.run_local(
+            kb_search.search,
+            q,
+            flow_id=flow_id,
+            source_type=source_type,
+            school=engine.school_resolver.resolve(school),
+            mode=mode or None,
+            page_size=page_size,
+            cursor=cursor,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return await _json_response(response)
 
 
 @app.get("/api/sources")
-def sources() -> dict:
-    payload = json.loads(SOURCE_INDEX.read_text()) if SOURCE_INDEX.exists() else {"sources": []}
-    return payload
+async def sources() -> dict:
+    return _json_file(SOURCE_INDEX, {"sources": []})
+
+
+@app.get("/api/glossary")
+async def glossary() -> dict:
+    return {"terms": engine.glossary.terms}
 
 
 @app.get("/api/flows")
-def flows() -> dict:
+async def flows() -> dict:
     return {
         "flows": [
             {
@@ -76,58 +242,130 @@ def flows() -> dict:
 
 
 @app.get("/api/scenarios")
-def scenarios() -> dict:
-    payload = (
-        json.loads(SCENARIOS_INDEX.read_text())
-        if SCENARIOS_INDEX.exists()
-        else {"scenarios": []}
-    )
-    return payload
+async def scenarios() -> dict:
+    return _json_file(SCENARIOS_INDEX, {"scenarios": []})
 
 
 @app.post("/api/session/start", response_model=StartSessionResponse)
-def start_session(request: StartSessionRequest) -> StartSessionResponse:
-    session, checks, _ = engine.start_session(request)
+async def start_session(request: StartSessionRequest) -> Response:
+    session, checks, _ = await executor.start_session(request)
     store.create(session)
-    return StartSessionResponse(session=session, micro_checks=checks)
+    return await _json_response(
+        StartSessionResponse(session=session.to_model(), micro_checks=checks),
+        spans=_engine_spans(session.session_id),
+    )
 
 
 @app.get("/api/session/{session_id}")
-def get_session(session_id: str):
-    session = store.get(session_id)
-    if not session:
+async def get_session(session_id: str) -> Response:
+    async with executor.session_lock(session_id):
+        session = store.get(session_id)
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found")
+        model = session.to_model()
+    return await _json_response(model)
+
+
+@app.get("/api/session/{session_id}/debug/refresh", response_model=RefreshDebugResponse)
+async def session_refresh_debug(session_id: str) -> RefreshDebugResponse:
+    if not store.get(session_id):
         raise HTTPException(status_code=404, detail="Session not found")
-    return session
+    return RefreshDebugResponse(session_id=session_id, traces=engine.refresh_traces(session_id))
 
 
-@app.post("/api/session/{session_id}/event", response_model=EventResponse)
-def post_event(session_id: str, request: EventRequest) -> EventResponse:
-    session = store.get(session_id)
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
+BUDGET_QUERY = Query(
+    default=None,
+    gt=0,
+    description="Engine time budget in ms; optional stages that would overrun it are deferred (see session.stale)",
+)
+
 
-    mutation = engine.apply_event(session, request)
-    store.save(session)
-    return EventResponse(session=session, mutation=mutation)
+@app.post("/api/session/{session_id}/event", response_model=EventResponse)
+async def post_event(
+    session_id: str,
+    request: EventRequest,
+    budget_ms: Optional[float] = BUDGET_QUERY,
+) -> Response:
+    return await _apply_events(session_id, [request], budget_ms)
+
+
+@app.post("/api/session/{session_id}/events", response_model=EventResponse)
+async def post_events(
+    session_id: str,
+    request: EventBatchRequest,
+    budget_ms: Optional[float] = BUDGET_QUERY,
+) -> Response:
+    return await _apply_events(session_id, request.events, budget_ms)
+
+
+async def _apply_events(session_id: str, events: list[EventRequest], budget_ms: Optional[float]) -> Response:
+    async with executor.session_lock(session_id):
+        session = store.get(session_id)
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found")
+
+        session, mutation = await executor.apply_events(
+            session, events, _budget(budget_ms), defer_optional=BACKGROUND_CITATIONS
+        )
+        store.save(session)
+        response = EventResponse(session=session.to_model(), mutation=mutation)
+        spans = _engine_spans(session_id)
+    _refresh_stale_later(response.session)
+    return await _json_response(response, spans=spans)
 
 
 @app.post("/api/session/{session_id}/micro-check", response_model=MicroCheckResponse)
-def post_micro_check(session_id: str, request: MicroCheckRequest) -> MicroCheckResponse:
-    session = store.get(session_id)
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
-
-    result, mutation = engine.apply_micro_check(session, request)
-    store.save(session)
-    return MicroCheckResponse(result=result, session=session, mutation=mutation)
+async def post_micro_check(
+    session_id: str,
+    request: MicroCheckRequest,
+    budget_ms: Optional[float] = BUDGET_QUERY,
+) -> Response:
+    async with executor.session_lock(session_id):
+        session = store.get(session_id)
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found")
+
+        session, result, mutation = await executor.apply_micro_check(
+            session, request, _budget(budget_ms), defer_optional=BACKGROUND_CITATIONS
+        )
+        store.save(session)
+        response = MicroCheckResponse(result=result, session=session.to_model(), mutation=mutation)
+        spans = _engine_spans(session_id)
+    _refresh_stale_later(response.session)
+    return await _json_response(response, spans=spans)
+
+
+@app.get("/api/session/{session_id}/citations", response_model=CitationsResponse)
+async def session_citations(
+    session_id: str,
+    wait: bool = Query(default=False, description="First wait for the session's pending background refresh"),
+) -> Response:
+    if wait:
+        await refresher.wait(session_id)
+    async with executor.session_lock(session_id):
+        session = store.get(session_id)
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found")
+        response = CitationsResponse(
+            session_id=session_id,
+            citations=[citation.to_model() for citation in session.citations],
+            stale="citations" in session.stale,
+        )
+    return await _json_response(response)
+
+
+def _refresh_stale_later(state: SessionState) -> None:
+    if BACKGROUND_CITATIONS and state.stale:
+        refresher.schedule(state.session_id)
 
 
 @app.post("/api/session/{session_id}/packet", response_model=PacketResponse)
-def build_packet(session_id: str) -> PacketResponse:
-    session = store.get(session_id)
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
-
-    packet = engine.build_packet(session)
-    store.save(session)
+async def build_packet(session_id: str) -> PacketResponse:
+    async with executor.session_lock(session_id):
+        session = store.get(session_id)
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found")
+
+        session, packet = await executor.build_packet(session)
+        store.save(session)
     return PacketResponse(session_id=session_id, packet_markdown=packet)
@@ -45,11 +45,28 @@ class SessionProfile(BaseModel):
     role: str = Field(default="student", pattern=r"^(student|caregiver|advisor_helper)$")
 
 
+class CitationFragment(BaseModel):
+    text: str
+    highlights: list[tuple[int, int]] = Field(
+        default_factory=list,
+        description="[start, end) character offsets of query-term hits within text",
+    )
+
+
+class GlossarySpan(BaseModel):
+    start: int
+    end: int
+    term_key: str = Field(description="Key of the term in data/shared/glossary.json")
+
+
 class Citation(BaseModel):
     source_id: str
     title: str
     url: str
     snippet: str
+    fragments: list[CitationFragment] = Field(default_factory=list)
+    kb_version: str = Field(default="", description="Version of the KB snapshot the citation came from")
+    glossary: list[GlossarySpan] = Field(default_factory=list, description="Glossary terms within snippet")
 
 
 class WorkflowStep(BaseModel):
@@ -62,6 +79,7 @@ class WorkflowStep(BaseModel):
     status: StepStatus = StepStatus.pending
     manually_completed: bool = False
     source_ids: list[str] = Field(default_factory=list)
+    glossary: list[GlossarySpan] = Field(default_factory=list, description="Glossary terms within description")
 
 
 class FlowCandidate(BaseModel):
@@ -159,6 +177,10 @@ class SessionState(BaseModel):
     doc_requirements: list[str] = Field(default_factory=list)
     common_confusions: list[str] = Field(default_factory=list)
     flow_warnings: list[str] = Field(default_factory=list)
+    flow_warning_glossary: list[list[GlossarySpan]] = Field(
+        default_factory=list,
+        description="Glossary terms within each entry of flow_warnings",
+    )
     flow_disclaimer: str = "Workflow preparation assistant only. Not legal advice."
 
     required_entities: list[str] = Field(default_factory=list)
@@ -176,6 +198,10 @@ class SessionState(BaseModel):
     micro_checks: dict[str, MicroCheckResult] = Field(default_factory=dict)
 
     advisor_packet_markdown: Optional[str] = None
+    stale: list[str] = Field(
+        default_factory=list,
+        description="Parts (e.g. citations) not yet recomputed for the latest events, served from an earlier one",
+    )
 
 
 class StartSessionRequest(BaseModel):
@@ -200,6 +226,10 @@ class UIMutation(BaseModel):
     reason: str
 
 
+class EventBatchRequest(BaseModel):
+    events: list[EventRequest] = Field(min_length=1, max_length=200, description="Applied in order")
+
+
 class EventResponse(BaseModel):
     session: SessionState
     mutation: UIMutation
@@ -227,6 +257,7 @@ class SourceDocument(BaseModel):
     url: str
     fetched_at: str
     source_type: str
+    school_id: str = ""
     flows: list[str] = Field(default_factory=list)
     text: str
 
@@ -237,5 +268,63 @@ class SourceChunk(BaseModel):
     title: str
     url: str
     source_type: str
+    school_id: str = Field(default="", description="School partition; empty for global (USCIS) sources")
     flows: list[str] = Field(default_factory=list)
     text: str
+    tokens: list[str] = Field(default_factory=list, description="Lowercase index tokens of text, in order")
+    token_count: int = 0
+
+
+class SearchHit(BaseModel):
+    chunk_id: str
+    source_id: str
+    title: str
+    url: str
+    source_type: str
+    school_id: str = ""
+    score: float
+    snippet: CitationFragment
+
+
+class SearchTiming(BaseModel):
+    rank_ms: float = Field(description="Scoring and sorting; 0 when the page came from a cached ranking")
+    page_ms: float
+    total_ms: float
+
+
+class SearchResponse(BaseModel):
+    query: str
+    total: int
+    hits: list[SearchHit]
+    next_cursor: Optional[str] = Field(default=None, description="Opaque; pass back with the same query and filters")
+    cached: bool = False
+    kb_version: str
+    timing: SearchTiming
+
+
+class RefreshTrace(BaseModel):
+    trigger: str = Field(description="Event type, batch, micro_check, session_start, or stale (deferred stages)")
+    event_count: int = Field(default=1, description="Events applied before this refresh")
+    dirty: list[str] = Field(default_factory=list, description="Session inputs the trigger changed")
+    ran: list[str] = Field(default_factory=list, description="Derived stages recomputed, in order")
+    skipped: list[str] = Field(default_factory=list, description="Stages not run: nothing they read changed, or deferred")
+    deferred: list[str] = Field(
+        default_factory=list,
+        description="Stages left stale because they would have overrun the latency budget",
+    )
+    elapsed_ms: float = 0.0
+    spans: dict[str, float] = Field(
+        default_factory=dict,
+        description="Milliseconds per pipeline span of the engine call, when tracing is on",
+    )
+
+
+class RefreshDebugResponse(BaseModel):
+    session_id: str
+    traces: list[RefreshTrace] = Field(description="Most recent last")
+
+
+class CitationsResponse(BaseModel):
+    session_id: str
+    citations: list[Citation]
+    stale: bool = Field(description="Citations are from before the latest events; a background refresh is pending")
@@ -1,10 +1,11 @@
 from __future__ import annotations
 
-from app.models import AdaptationEvent, EventType, InterfaceMode, SessionState, UIMutation
+from app.models import AdaptationEvent, EventType, InterfaceMode, UIMutation
+from app.pipeline.session import Session
 
 
 def compute_adaptation(
-    session: SessionState,
+    session: Session,
     trigger_event: EventType | None = None,
 ) -> UIMutation:
     previous_mode = session.current_mode
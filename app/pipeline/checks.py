@@ -3,7 +3,8 @@ from __future__ import annotations
 import json
 from pathlib import Path
 
-from app.models import MicroCheck, MicroCheckResult, SessionState
+from app.models import MicroCheck, MicroCheckResult
+from app.pipeline.session import Session
 
 
 SHARED_CHECKS_PATH = Path("data/shared/micro_checks.json")
@@ -28,7 +29,7 @@ def _load_shared_checks() -> dict[str, MicroCheck]:
 SHARED_CHECKS = _load_shared_checks()
 
 
-def build_micro_checks(session: SessionState) -> list[MicroCheck]:
+def build_micro_checks(session: Session) -> list[MicroCheck]:
     checks: list[MicroCheck] = []
 
     for check_id in session.active_check_ids:
@@ -45,7 +46,7 @@ def build_micro_checks(session: SessionState) -> list[MicroCheck]:
 
 
 def evaluate_micro_check(
-    session: SessionState,
+    session: Session,
     check_id: str,
     selected_option: str,
 ) -> MicroCheckResult:
@@ -74,7 +75,7 @@ def evaluate_micro_check(
     )
 
 
-def _build_missing_item_check(session: SessionState) -> MicroCheck:
+def _build_missing_item_check(session: Session) -> MicroCheck:
     missing = session.missing_items or ["status_type"]
     top_missing = missing[0]
 
@@ -101,7 +102,7 @@ def _build_missing_item_check(session: SessionState) -> MicroCheck:
     )
 
 
-def _build_disambiguation_check(session: SessionState) -> MicroCheck:
+def _build_disambiguation_check(session: Session) -> MicroCheck:
     parsed_options = [_parse_option(option) for option in session.disambiguation_card.options]
     labels = [label for _, label in parsed_options]
     correct_label = labels[0] if labels else "Top ranked flow"
@@ -1,31 +1,52 @@
 from __future__ import annotations
 
+import time
+from dataclasses import replace
+from collections import OrderedDict, deque
+from functools import partial
+from threading import Lock
 from typing import Optional
 
 from app.models import (
+    Citation,
     DisambiguationCard,
     EventRequest,
     EventType,
+    GlossarySpan,
     InterfaceMode,
     MicroCheck,
     MicroCheckRequest,
     MicroCheckResult,
-    SessionState,
+    RefreshTrace,
     StartSessionRequest,
     UIMutation,
 )
 from app.pipeline.adaptation import compute_adaptation
 from app.pipeline.checks import build_micro_checks, evaluate_micro_check
-from app.pipeline.flow_packs import FlowPack, FlowPackStore, build_case_graph, graph_to_workflow
+from app.pipeline.flow_packs import FlowPack, FlowPackStore, FlowTemplate, compile_flow_template
+from app.pipeline.glossary import GlossaryAnnotator
 from app.pipeline.packet import build_advisor_packet
+from app.pipeline.refresh import INPUTS, RefreshPass
+from app.pipeline.schools import SchoolResolver
 from app.pipeline.scoring import recompute_scores
-from app.pipeline.uscis_knowledge import USCISKnowledgeBase
-from app.pipeline.workflow import (
-    compute_missing_items,
-    mark_step,
-    refresh_workflow_step_statuses,
-    sync_graph_from_workflow,
-)
+from app.pipeline.session import Session, SessionCitation, SessionEvent, interned_keys
+from app.pipeline.tracing import current_spans, span, traced
+from app.pipeline.uscis_knowledge import StableScores, USCISKnowledgeBase
+from app.pipeline.workflow import compute_missing_items, mark_step, refresh_workflow_step_statuses
+
+
+# Sessions whose stable citation-query scores are kept for incremental retrieval.
+STABLE_SCORE_SESSIONS = 256
+# Refresh traces kept for the debug view: the last events of the most recent sessions.
+REFRESH_TRACE_SESSIONS = 256
+REFRESH_TRACE_EVENTS = 20
+# Citation snippets whose glossary spans are kept; sessions on the same flow share most.
+SNIPPET_GLOSSARY_CACHE_SIZE = 1024
+# Weight of the latest run in each stage's moving-average cost, used against latency budgets.
+STAGE_ESTIMATE_WEIGHT = 0.2
+# Each deferral for the budget shrinks the stage's estimate by this factor, so one slow
+# run cannot keep the stage deferred (and unmeasured) for good.
+STAGE_ESTIMATE_DECAY = 0.5
 
 
 class PipelineEngine:
@@ -33,24 +54,50 @@ class PipelineEngine:
         self,
         kb: Optional[USCISKnowledgeBase] = None,
         flow_store: Optional[FlowPackStore] = None,
+        school_resolver: Optional[SchoolResolver] = None,
+        glossary: Optional[GlossaryAnnotator] = None,
+        tracing: bool = False,
+        latency_budget_ms: Optional[float] = None,
     ) -> None:
         self.kb = kb or USCISKnowledgeBase()
         self.flow_store = flow_store or FlowPackStore()
-
-    def start_session(self, request: StartSessionRequest) -> tuple[SessionState, list[MicroCheck], UIMutation]:
+        self.school_resolver = school_resolver or SchoolResolver()
+        self.glossary = glossary or GlossaryAnnotator()
+        # Time pipeline spans into each refresh trace (see app/pipeline/tracing.py).
+        self.tracing = tracing
+        # Default milliseconds an event or micro-check may spend before optional stages
+        # (see app/pipeline/refresh.py) are deferred; None runs everything.
+        self.latency_budget_ms = latency_budget_ms
+        self._stage_estimates: dict[str, float] = {}
+        self._estimates_lock = Lock()
+        self._stable_scores: OrderedDict[str, tuple[tuple[str, str, str], StableScores]] = OrderedDict()
+        self._stable_lock = Lock()
+        self._refresh_traces: OrderedDict[str, deque[RefreshTrace]] = OrderedDict()
+        self._traces_lock = Lock()
+        self._templates: dict[str, tuple[FlowPack, FlowTemplate]] = {}
+        self._templates_lock = Lock()
+        self._snippet_spans: OrderedDict[str, list[GlossarySpan]] = OrderedDict()
+        self._snippet_spans_lock = Lock()
+
+    def start_session(self, request: StartSessionRequest) -> tuple[Session, list[MicroCheck], UIMutation]:
+        with traced(self.tracing):
+            return self._start_session(request)
+
+    def _start_session(self, request: StartSessionRequest) -> tuple[Session, list[MicroCheck], UIMutation]:
         initial_fields = {
             key: str(value).strip()
             for key, value in request.initial_fields.items()
             if str(value).strip()
         }
-        candidates, flags, extracted = self.flow_store.rank(
-            intent=request.intent,
-            fields=initial_fields,
-        )
+        with span("rank"):
+            candidates, flags, extracted = self.flow_store.rank(
+                intent=request.intent,
+                fields=initial_fields,
+            )
         selected_flow_id = candidates[0].flow_id if candidates else "f1_work_basics"
         selected_pack = self._get_pack_or_fallback(selected_flow_id)
 
-        session = SessionState(
+        session = Session(
             intent=request.intent,
             profile=request.profile,
             selected_flow_id=selected_pack.flow_id,
@@ -60,159 +107,398 @@ class PipelineEngine:
             current_mode=request.profile.preferred_mode,
             candidate_flows=candidates,
             ambiguity_flags=flags,
-            fields={**self._entity_fields(extracted), **initial_fields},
+            fields=interned_keys({**self._entity_fields(extracted), **initial_fields}),
         )
 
-        self._apply_pack_state(session, selected_pack, preserve_fields=True)
-        self._refresh_session_state(session)
+        with span("flow_pack"):
+            self._apply_pack_state(session, selected_pack, preserve_fields=True)
+        refresh = self._refresh_pass(session, "session_start")
+        refresh.run(set(INPUTS))
+        self._record_trace(session, refresh)
 
         mutation = UIMutation(
             new_mode=session.current_mode,
             reason="Session initialized using user preferred mode.",
             ui_changes=["Baseline metrics and checklist loaded"],
         )
-        session.available_micro_checks = build_micro_checks(session)
         return session, session.available_micro_checks, mutation
 
-    def apply_event(self, session: SessionState, event: EventRequest) -> UIMutation:
-        session.events.append(session_event(event))
+    def apply_event(
+        self,
+        session: Session,
+        event: EventRequest,
+        budget_ms: Optional[float] = None,
+        defer_optional: bool = False,
+    ) -> UIMutation:
+        return self.apply_events(session, [event], budget_ms=budget_ms, defer_optional=defer_optional)
+
+    def apply_events(
+        self,
+        session: Session,
+        events: list[EventRequest],
+        budget_ms: Optional[float] = None,
+        defer_optional: bool = False,
+    ) -> UIMutation:
+        """Apply events in order, then refresh and adapt once for all of them.
+
+        Every event is logged and applied to the session's inputs as it would be on
+        its own; only the derived state is recomputed, once, at the end. The batch
+        counts as one interaction for adaptation: a mode change anywhere in it pins
+        the chosen mode, otherwise the last event is the trigger.
+
+        budget_ms (default: the engine's latency_budget_ms) bounds the call; optional
+        stages that would overrun it keep their previous output and are listed in
+        session.stale until a later call has time for them. defer_optional defers
+        them outright, for refresh_stale() to run after the response.
+        """
+        if not events:
+            return UIMutation(new_mode=session.current_mode, reason="No events to apply.")
+        deadline = self._deadline(budget_ms)
+        with traced(self.tracing):
+            dirty: set[str] = set()
+            for event in events:
+                dirty |= self._apply_event_inputs(session, event)
+
+            event_types = [event.event_type for event in events]
+            trigger_event = EventType.mode_change if EventType.mode_change in event_types else event_types[-1]
+            trigger = trigger_event.value if len(events) == 1 else "batch"
+            return self._refresh_and_adapt(
+                session,
+                trigger,
+                dirty,
+                trigger_event=trigger_event,
+                event_count=len(events),
+                deadline=deadline,
+                defer_optional=defer_optional,
+            )
+
+    def _apply_event_inputs(self, session: Session, event: EventRequest) -> set[str]:
+        """Log the event and apply it to the session's inputs; returns the inputs it changed."""
+        session.events.append(SessionEvent(event.event_type, interned_keys(event.payload)))
+        dirty = {"events"}
 
         if event.event_type == EventType.select_flow:
             requested = str(event.payload.get("flow_id", "")).split("|", 1)[0].strip()
             if requested:
                 self._select_flow(session, requested)
+                dirty.add("flow")
 
         elif event.event_type == EventType.field_update:
             field_name = str(event.payload.get("field", "")).strip()
             value = str(event.payload.get("value", "")).strip()
-            if field_name:
-                session.fields[field_name] = value
+            if field_name and session.fields.get(field_name) != value:
+                session.set_field(field_name, value)
+                dirty.add("fields")
+                if field_name == "school_name":
+                    dirty.add("school")
 
         elif event.event_type == EventType.mark_step:
             step_id = str(event.payload.get("step_id", "")).strip()
             if step_id:
-                mark_step(session.workflow, step_id=step_id, complete=True)
+                mark_step(session.flow_template, session.step_state, step_id=step_id, complete=True)
+                dirty.add("steps")
 
         elif event.event_type in {EventType.unmark_step, EventType.step_reopen}:
             step_id = str(event.payload.get("step_id", "")).strip()
             if step_id:
-                mark_step(session.workflow, step_id=step_id, complete=False)
+                mark_step(session.flow_template, session.step_state, step_id=step_id, complete=False)
+                dirty.add("steps")
 
         elif event.event_type == EventType.mode_change:
             mode_value = str(event.payload.get("mode", "")).strip()
             valid_modes = {mode.value for mode in InterfaceMode}
-            if mode_value in valid_modes:
+            if mode_value in valid_modes and session.current_mode != InterfaceMode(mode_value):
                 session.current_mode = InterfaceMode(mode_value)
+                dirty.add("mode")
 
-        self._refresh_session_state(session)
-        mutation = compute_adaptation(session, trigger_event=event.event_type)
-        session.scores = recompute_scores(
-            session=session,
-            required_fields=session.required_entities,
-            flow_id=session.selected_flow_id,
-        )
-        session.available_micro_checks = build_micro_checks(session)
-        return mutation
+        return dirty
 
     def apply_micro_check(
         self,
-        session: SessionState,
+        session: Session,
         request: MicroCheckRequest,
+        budget_ms: Optional[float] = None,
+        defer_optional: bool = False,
     ) -> tuple[MicroCheckResult, UIMutation]:
-        result = evaluate_micro_check(
-            session=session,
-            check_id=request.check_id,
-            selected_option=request.selected_option,
-        )
-        session.micro_checks[result.check_id] = result
-
-        self._refresh_session_state(session)
-        mutation = compute_adaptation(session, trigger_event=None)
-        session.scores = recompute_scores(
-            session=session,
-            required_fields=session.required_entities,
-            flow_id=session.selected_flow_id,
-        )
-        session.available_micro_checks = build_micro_checks(session)
+        deadline = self._deadline(budget_ms)
+        with traced(self.tracing):
+            with span("micro_check_eval"):
+                result = evaluate_micro_check(
+                    session=session,
+                    check_id=request.check_id,
+                    selected_option=request.selected_option,
+                )
+            session.micro_checks[result.check_id] = result
+
+            mutation = self._refresh_and_adapt(
+                session,
+                "micro_check",
+                {"micro_checks"},
+                trigger_event=None,
+                deadline=deadline,
+                defer_optional=defer_optional,
+            )
         return result, mutation
 
-    def build_packet(self, session: SessionState) -> str:
+    def build_packet(self, session: Session) -> str:
         session.advisor_packet_markdown = build_advisor_packet(session)
         return session.advisor_packet_markdown
 
-    def _refresh_session_state(self, session: SessionState) -> None:
-        selected_pack = self._get_pack_or_fallback(session.selected_flow_id)
-        session.required_entities = selected_pack.required_entities
-        session.active_check_ids = selected_pack.micro_checks
+    def stale_snapshot(self, session: Session) -> Session:
+        """A copy of session that refresh_stale() can run on while later calls change session.
+
+        The containers the optional stages read are copied; they only replace, never
+        mutate, the attributes they write.
+        """
+        return replace(
+            session,
+            fields=dict(session.fields),
+            missing_items=list(session.missing_items),
+            ambiguity_flags=list(session.ambiguity_flags),
+            stale=list(session.stale),
+        )
 
-        # Keep inferred entities, but do not overwrite user-provided values.
-        candidates, flags, inferred = self.flow_store.rank(intent=session.intent, fields=session.fields)
-        session.candidate_flows = candidates
-        session.ambiguity_flags = flags
-        for field, value in inferred.items():
-            if not str(session.fields.get(field, "")).strip():
-                session.fields[field] = value
+    def adopt_stale(self, session: Session, refreshed: Session) -> bool:
+        """Take refresh_stale()'s output on a stale_snapshot() of session, unless session changed since."""
+        if refreshed.revision != session.revision:
+            return False
+        session.citations = refreshed.citations
+        session.stale = refreshed.stale
+        return True
+
+    def refresh_stale(self, session: Session) -> None:
+        """Run the stages earlier calls deferred (session.stale), e.g. from a background job."""
+        with traced(self.tracing):
+            refresh = self._refresh_pass(session, "stale")
+            refresh.trace.event_count = 0
+            refresh.run(self._kb_dirty(session), stale=frozenset(session.stale))
+            session.stale = refresh.trace.deferred
+            self._record_trace(session, refresh)
+
+    def refresh_traces(self, session_id: str) -> list[RefreshTrace]:
+        """Which stages recent events of a session recomputed, oldest first."""
+        with self._traces_lock:
+            return list(self._refresh_traces.get(session_id, ()))
+
+    def _refresh_and_adapt(
+        self,
+        session: Session,
+        trigger: str,
+        dirty: set[str],
+        trigger_event: Optional[EventType],
+        event_count: int = 1,
+        deadline: Optional[float] = None,
+        defer_optional: bool = False,
+    ) -> UIMutation:
+        session.revision += 1
+        refresh = self._refresh_pass(session, trigger, deadline=deadline, defer_optional=defer_optional)
+        refresh.trace.event_count = event_count
+        refresh.run(dirty | self._kb_dirty(session), stale=frozenset(session.stale))
+
+        previous_mode = session.current_mode
+        with span("adaptation"):
+            mutation = compute_adaptation(session, trigger_event=trigger_event)
+        refresh.trace.ran.append("adaptation")
+        if session.current_mode != previous_mode:
+            # Only the scores read the mode.
+            refresh.run({"mode"})
+        session.stale = refresh.trace.deferred
+        self._record_trace(session, refresh)
+        return mutation
 
-        self._merge_entity_defaults(session)
-        session.missing_items = compute_missing_items(session.required_entities, session.fields)
-        refresh_workflow_step_statuses(session.workflow, session.fields)
-        sync_graph_from_workflow(session.case_graph, session.workflow)
+    def _kb_dirty(self, session: Session) -> set[str]:
+        # The session may predate a KB reload; its citations then need the new snapshot.
+        if any(citation.kb_version != self.kb.version for citation in session.citations):
+            return {"kb"}
+        return set()
 
-        session.disambiguation_card = self._build_disambiguation_card(session)
-        session.citations = self.kb.retrieve(
-            query=self._citation_query(session),
-            top_k=5,
-            flow_id=session.selected_flow_id,
-            include_ucsd=self._should_include_ucsd_sources(session),
+    def _deadline(self, budget_ms: Optional[float]) -> Optional[float]:
+        budget_ms = self.latency_budget_ms if budget_ms is None else budget_ms
+        return time.perf_counter() + budget_ms / 1000 if budget_ms is not None else None
+
+    def _refresh_pass(
+        self,
+        session: Session,
+        trigger: str,
+        deadline: Optional[float] = None,
+        defer_optional: bool = False,
+    ) -> RefreshPass:
+        return RefreshPass(
+            trigger,
+            {
+                "rank": partial(self._refresh_rank, session),
+                "missing": partial(self._refresh_missing, session),
+                "workflow": partial(self._refresh_workflow, session),
+                "disambiguation": partial(self._refresh_disambiguation, session),
+                "citations": partial(self._refresh_citations, session),
+                "scores": partial(self._refresh_scores, session),
+                "checks": partial(self._refresh_checks, session),
+            },
+            deadline=deadline,
+            estimates=self._stage_estimates_now(),
+            defer_optional=defer_optional,
         )
-        if not session.citations:
-            session.citations = self.kb.retrieve(
-                query=self._citation_query(session),
-                top_k=5,
-                flow_id="",
-                include_ucsd=self._should_include_ucsd_sources(session),
+
+    def record_refresh_traces(self, session_id: str, traces: list[RefreshTrace]) -> None:
+        """Keep traces of refreshes that ran elsewhere (e.g. on a process-pool worker's engine)."""
+        with self._traces_lock:
+            kept = self._refresh_traces.get(session_id)
+            if kept is None:
+                kept = self._refresh_traces[session_id] = deque(maxlen=REFRESH_TRACE_EVENTS)
+            self._refresh_traces.move_to_end(session_id)
+            kept.extend(traces)
+            if len(self._refresh_traces) > REFRESH_TRACE_SESSIONS:
+                self._refresh_traces.popitem(last=False)
+
+    def _record_trace(self, session: Session, refresh: RefreshPass) -> None:
+        refresh.trace.spans = current_spans()
+        with self._estimates_lock:
+            for name, elapsed_ms in refresh.stage_ms.items():
+                previous = self._stage_estimates.get(name)
+                self._stage_estimates[name] = (
+                    elapsed_ms if previous is None else previous + STAGE_ESTIMATE_WEIGHT * (elapsed_ms - previous)
+                )
+            for name in refresh.over_budget:
+                if name in self._stage_estimates:
+                    self._stage_estimates[name] *= STAGE_ESTIMATE_DECAY
+        self.record_refresh_traces(session.session_id, [refresh.trace])
+
+    def _stage_estimates_now(self) -> dict[str, float]:
+        with self._estimates_lock:
+            return dict(self._stage_estimates)
+
+    def _refresh_rank(self, session: Session) -> set[str]:
+        # Keep inferred entities, but do not overwrite user-provided values.
+        with span("rank"):
+            candidates, flags, inferred = self.flow_store.rank(intent=session.intent, fields=session.fields)
+        changed: set[str] = set()
+        if candidates != session.candidate_flows or flags != session.ambiguity_flags:
+            changed.add("rank")
+        session.candidate_flows = candidates
+        session.ambiguity_flags = flags
+        with span("entity_merge"):
+            for field, value in inferred.items():
+                if not str(session.fields.get(field, "")).strip() and session.fields.get(field) != value:
+                    session.set_field(field, value)
+                    changed.add("fields")
+                    if field == "school_name":
+                        changed.add("school")
+        return changed
+
+    def _refresh_missing(self, session: Session) -> set[str]:
+        with span("missing"):
+            missing = compute_missing_items(session.required_entities, session.fields)
+        changed = missing != session.missing_items
+        session.missing_items = missing
+        return {"missing"} if changed else set()
+
+    def _refresh_workflow(self, session: Session) -> set[str]:
+        with span("workflow"):
+            refresh_workflow_step_statuses(session.flow_template, session.step_state, session.fields)
+        # Marking a step already changed statuses before this ran.
+        return {"workflow"}
+
+    def _refresh_disambiguation(self, session: Session) -> set[str]:
+        with span("disambiguation"):
+            card = self._build_disambiguation_card(session)
+        changed = card != session.disambiguation_card
+        session.disambiguation_card = card
+        return {"disambiguation"} if changed else set()
+
+    def _refresh_citations(self, session: Session) -> set[str]:
+        with span("retrieval"):
+            citations = self._retrieve_citations(session)
+        if not citations:
+            # Nothing for the flow: retry across all flows.
+            with span("retrieval_fallback"):
+                citations = self.kb.retrieve(
+                    query=self._citation_query(session),
+                    top_k=5,
+                    flow_id="",
+                    school=self._school_partition(session),
+                )
+        # The KB result cache shares citation objects between sessions, so the spans go alongside.
+        with span("citation_glossary"):
+            session.citations = [
+                SessionCitation(citation, self._snippet_glossary(citation.snippet)) for citation in citations
+            ]
+        return set()
+
+    def _refresh_scores(self, session: Session) -> set[str]:
+        with span("scoring"):
+            session.scores = recompute_scores(
+                session=session,
+                required_fields=session.required_entities,
+                flow_id=session.selected_flow_id,
             )
-        session.scores = recompute_scores(
-            session=session,
-            required_fields=session.required_entities,
-            flow_id=session.selected_flow_id,
-        )
+        return set()
 
-    def _select_flow(self, session: SessionState, flow_id: str) -> None:
+    def _refresh_checks(self, session: Session) -> set[str]:
+        with span("micro_checks"):
+            session.available_micro_checks = build_micro_checks(session)
+        return set()
+
+    def _select_flow(self, session: Session, flow_id: str) -> None:
         pack = self._get_pack_or_fallback(flow_id)
-        self._apply_pack_state(session, pack, preserve_fields=True)
+        with span("flow_pack"):
+            self._apply_pack_state(session, pack, preserve_fields=True)
         session.flow_locked = True
         session.disambiguation_card = None
         session.ambiguity_flags = [flag for flag in session.ambiguity_flags if flag != "top_flows_close"]
 
-    def _apply_pack_state(self, session: SessionState, pack: FlowPack, preserve_fields: bool = True) -> None:
+    def _apply_pack_state(self, session: Session, pack: FlowPack, preserve_fields: bool = True) -> None:
         existing_fields = dict(session.fields) if preserve_fields else {}
-        graph = build_case_graph(pack)
-        workflow = graph_to_workflow(graph)
+        template = self._flow_template(pack)
+        pack_glossary = self.glossary.annotate_pack(pack)
 
         session.selected_flow_id = pack.flow_id
         session.selected_flow_title = pack.title
         session.scenario = pack.title
         session.required_entities = pack.required_entities
         session.active_check_ids = pack.micro_checks
-        session.case_graph = graph
-        session.workflow = workflow
+        session.flow_template = template
+        session.step_state = template.new_step_state()
         session.flow_description = pack.description
         session.doc_requirements = pack.doc_requirements
         session.common_confusions = pack.common_confusions
         session.flow_warnings = pack.warnings
+        session.flow_warning_glossary = pack_glossary.warnings
         session.flow_disclaimer = pack.disclaimer
         session.fields = existing_fields
         self._merge_entity_defaults(session)
 
-    def _merge_entity_defaults(self, session: SessionState) -> None:
+    def _flow_template(self, pack: FlowPack) -> FlowTemplate:
+        """The pack's compiled template, shared by every session on it until the pack object is replaced."""
+        with self._templates_lock:
+            cached = self._templates.get(pack.flow_id)
+            if cached is not None and cached[0] is pack:
+                return cached[1]
+        template = compile_flow_template(pack, self.glossary.annotate_pack(pack).steps)
+        with self._templates_lock:
+            self._templates[pack.flow_id] = (pack, template)
+        return template
+
+    def _snippet_glossary(self, snippet: str) -> list[GlossarySpan]:
+        with self._snippet_spans_lock:
+            spans = self._snippet_spans.get(snippet)
+            if spans is not None:
+                self._snippet_spans.move_to_end(snippet)
+                return spans
+        spans = self.glossary.annotate(snippet)
+        with self._snippet_spans_lock:
+            self._snippet_spans[snippet] = spans
+            if len(self._snippet_spans) > SNIPPET_GLOSSARY_CACHE_SIZE:
+                self._snippet_spans.popitem(last=False)
+        return spans
+
+    def _merge_entity_defaults(self, session: Session) -> None:
         for entity in session.required_entities:
             session.fields.setdefault(entity, "")
 
     def _entity_fields(self, entities: dict[str, str]) -> dict[str, str]:
         return {key: value for key, value in entities.items() if value is not None}
 
-    def _needs_disambiguation(self, session: SessionState) -> bool:
+    def _needs_disambiguation(self, session: Session) -> bool:
         if session.flow_locked:
             return False
         flags = set(session.ambiguity_flags)
@@ -222,7 +508,7 @@ class PipelineEngine:
             return True
         return False
 
-    def _build_disambiguation_card(self, session: SessionState) -> DisambiguationCard | None:
+    def _build_disambiguation_card(self, session: Session) -> DisambiguationCard | None:
         if not self._needs_disambiguation(session):
             return None
 
@@ -238,21 +524,61 @@ class PipelineEngine:
             options=options,
         )
 
-    def _citation_query(self, session: SessionState) -> str:
-        missing = ", ".join(session.missing_items[:3]) if session.missing_items else "no missing fields"
-        school = str(session.fields.get("school_name", "")).strip()
-        return (
-            f"{session.intent} {session.selected_flow_title} "
-            f"school: {school or 'unspecified'} "
-            f"missing: {missing} "
-            f"confusions: {'; '.join(session.ambiguity_flags[:2])}"
+    def _retrieve_citations(self, session: Session) -> list[Citation]:
+        """Citations for the session's flow, rescoring only the per-event part of the query.
+
+        Queries go through the KB result cache first. On a miss, the stable part (intent,
+        flow title, school) is scored once per session and kept; each event only adds
+        the postings of the missing-item and flag tokens.
+        """
+        school = self._school_partition(session)
+        if self.kb.mode != "lexical":
+            return self.kb.retrieve(
+                query=self._citation_query(session),
+                top_k=5,
+                flow_id=session.selected_flow_id,
+                school=school,
+            )
+
+        stable_query = self._citation_query_stable(session)
+        return self.kb.retrieve_incremental(
+            stable_query,
+            self._citation_query_delta(session),
+            partial(self._session_stable_scores, session.session_id, stable_query, session.selected_flow_id, school),
+            top_k=5,
+            flow_id=session.selected_flow_id,
+            school=school,
         )
 
-    def _should_include_ucsd_sources(self, session: SessionState) -> bool:
-        school = str(session.fields.get("school_name", "")).strip().lower()
-        if not school:
-            return False
-        return "ucsd" in school or "san diego" in school
+    def _session_stable_scores(self, session_id: str, stable_query: str, flow_id: str, school: str) -> StableScores:
+        key = (stable_query, flow_id, school)
+        with self._stable_lock:
+            entry = self._stable_scores.get(session_id)
+            if entry is not None:
+                self._stable_scores.move_to_end(session_id)
+        if entry is not None and entry[0] == key and entry[1].kb_version == self.kb.version:
+            return entry[1]
+        stable = self.kb.stable_scores(stable_query, flow_id=flow_id, school=school)
+        with self._stable_lock:
+            self._stable_scores[session_id] = (key, stable)
+            self._stable_scores.move_to_end(session_id)
+            if len(self._stable_scores) > STABLE_SCORE_SESSIONS:
+                self._stable_scores.popitem(last=False)
+        return stable
+
+    def _citation_query(self, session: Session) -> str:
+        return f"{self._citation_query_stable(session)} {self._citation_query_delta(session)}"
+
+    def _citation_query_stable(self, session: Session) -> str:
+        school = str(session.fields.get("school_name", "")).strip()
+        return f"{session.intent} {session.selected_flow_title} school: {school or 'unspecified'}"
+
+    def _citation_query_delta(self, session: Session) -> str:
+        missing = ", ".join(session.missing_items[:3]) if session.missing_items else "no missing fields"
+        return f"missing: {missing} confusions: {'; '.join(session.ambiguity_flags[:2])}"
+
+    def _school_partition(self, session: Session) -> str:
+        return self.school_resolver.resolve(str(session.fields.get("school_name", "")))
 
     def _get_pack_or_fallback(self, flow_id: str) -> FlowPack:
         pack = self.flow_store.get(flow_id)
@@ -268,9 +594,3 @@ class PipelineEngine:
             return packs[0]
 
         raise ValueError("No flow packs available. Add JSON files under data/flows.")
-
-
-def session_event(event: EventRequest):
-    from app.models import UserEvent
-
-    return UserEvent(event_type=event.event_type, payload=event.payload)
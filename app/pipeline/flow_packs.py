@@ -1,16 +1,31 @@
 from __future__ import annotations
 
+import hashlib
 import json
 import re
+from collections import OrderedDict
 from pathlib import Path
+from threading import Lock
 from typing import Optional
+from weakref import WeakValueDictionary
 
 from pydantic import BaseModel, Field
 
-from app.models import CaseGraph, CaseGraphEdge, CaseGraphNode, FlowCandidate, StepStatus, WorkflowStep
+from app.models import (
+    CaseGraph,
+    CaseGraphEdge,
+    CaseGraphNode,
+    FlowCandidate,
+    GlossarySpan,
+    StepStatus,
+    WorkflowStep,
+)
+from app.pipeline.workflow import MANUAL, STATUS_MASK, STEP_STATUSES
 
 
 TOKEN_RE = re.compile(r"[a-zA-Z0-9\-_/]{2,}")
+# Distinct step states per flow whose workflow and case-graph views are kept.
+TEMPLATE_VIEW_CACHE_SIZE = 64
 
 
 class FlowAppliesIf(BaseModel):
@@ -299,6 +314,103 @@ def graph_to_workflow(graph: CaseGraph) -> list[WorkflowStep]:
     ]
 
 
+class FlowTemplate:
+    """A flow pack's workflow steps and case graph, compiled once and shared by its sessions.
+
+    Nothing here is mutated after compile_flow_template(). A session holds only a
+    step state (see app/pipeline/workflow.py) indexed like steps, and workflow() and
+    case_graph() combine the two for responses. Sessions in the same state get the
+    same (read-only) objects; a flow has few distinct states in practice.
+    """
+
+    __slots__ = (
+        "flow_id",
+        "steps",
+        "graph",
+        "step_index",
+        "dependency_indexes",
+        "digest",
+        "_views",
+        "_views_lock",
+        "__weakref__",
+    )
+
+    def __init__(self, flow_id: str, steps: list[WorkflowStep], graph: CaseGraph) -> None:
+        self.flow_id = flow_id
+        self.steps = tuple(steps)
+        self.graph = graph
+        self.step_index = {step.step_id: index for index, step in enumerate(self.steps)}
+        self.dependency_indexes = tuple(
+            tuple(self.step_index[dep] for dep in step.dependencies if dep in self.step_index)
+            for step in self.steps
+        )
+        content = json.dumps([flow_id, [step.model_dump(mode="json") for step in self.steps]], sort_keys=True)
+        self.digest = hashlib.blake2b(content.encode("utf-8"), digest_size=12).hexdigest()
+        # Least recently used first; engine threads share it.
+        self._views: OrderedDict[bytes, tuple[list[WorkflowStep], CaseGraph]] = OrderedDict()
+        self._views_lock = Lock()
+
+    def new_step_state(self) -> bytearray:
+        return bytearray(len(self.steps))
+
+    def workflow(self, step_state: bytearray) -> list[WorkflowStep]:
+        return self._view(step_state)[0]
+
+    def case_graph(self, step_state: bytearray) -> CaseGraph:
+        return self._view(step_state)[1]
+
+    def _view(self, step_state: bytearray) -> tuple[list[WorkflowStep], CaseGraph]:
+        key = bytes(step_state)
+        with self._views_lock:
+            view = self._views.get(key)
+            if view is not None:
+                self._views.move_to_end(key)
+                return view
+        steps = [
+            step.model_copy(
+                update={"status": STEP_STATUSES[value & STATUS_MASK], "manually_completed": bool(value & MANUAL)}
+            )
+            for step, value in zip(self.steps, key)
+        ]
+        nodes = [
+            node.model_copy(update={"status": STEP_STATUSES[value & STATUS_MASK]})
+            for node, value in zip(self.graph.nodes, key)
+        ]
+        view = (steps, CaseGraph(flow_id=self.flow_id, nodes=nodes, edges=self.graph.edges))
+        with self._views_lock:
+            # Another thread may have built the same view meanwhile; keep the first.
+            view = self._views.setdefault(key, view)
+            self._views.move_to_end(key)
+            if len(self._views) > TEMPLATE_VIEW_CACHE_SIZE:
+                self._views.popitem(last=False)
+        return view
+
+    def __reduce__(self):
+        # Sessions pickled to and from process-pool workers come back to the shared copy.
+        return _shared_template, (self.digest, self.flow_id, list(self.steps), self.graph)
+
+
+_templates: WeakValueDictionary[str, FlowTemplate] = WeakValueDictionary()
+
+
+def _shared_template(digest: str, flow_id: str, steps: list[WorkflowStep], graph: CaseGraph) -> FlowTemplate:
+    template = _templates.get(digest)
+    if template is None:
+        template = FlowTemplate(flow_id, steps, graph)
+        _templates[template.digest] = template
+    return template
+
+
+def compile_flow_template(pack: FlowPack, step_glossary: dict[str, list[GlossarySpan]]) -> FlowTemplate:
+    """The pack's steps (with glossary spans for their descriptions) and case graph, all pending."""
+    graph = build_case_graph(pack)
+    steps = graph_to_workflow(graph)
+    for step in steps:
+        step.glossary = step_glossary.get(step.step_id, [])
+    template = FlowTemplate(pack.flow_id, steps, graph)
+    return _templates.setdefault(template.digest, template)
+
+
 def _tokenize(text: str) -> set[str]:
     return {token.lower() for token in TOKEN_RE.findall(text)}
 
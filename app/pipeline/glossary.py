@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import json
+import re
+from collections import deque
+from pathlib import Path
+from threading import Lock
+
+from app.models import GlossarySpan
+from app.pipeline.flow_packs import FlowPack
+
+
+# Lowercases ASCII only, so offsets in the folded text are offsets in the original.
+ASCII_FOLD = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+PARENTHETICAL_RE = re.compile(r"^(.*?)\s*\(([^)]+)\)\s*$")
+
+
+def glossary_patterns(term: dict) -> set[str]:
+    """Folded surface forms of a term: its key, its label, and the label's parts.
+
+    "stem_opt" also matches "stem opt" and "stem-opt"; "Curricular Practical
+    Training (CPT)" also matches "Curricular Practical Training" and "CPT".
+    """
+    key = str(term.get("key", "")).translate(ASCII_FOLD).strip()
+    label = str(term.get("label", "")).translate(ASCII_FOLD).strip()
+    patterns = {key, key.replace("_", " "), key.replace("_", "-"), label}
+    parenthetical = PARENTHETICAL_RE.match(label)
+    if parenthetical:
+        patterns.update(part.strip() for part in parenthetical.groups())
+    return {pattern for pattern in patterns if pattern}
+
+
+class GlossaryAutomaton:
+    """Aho-Corasick automaton over folded glossary patterns.
+
+    One left-to-right pass over a text reports every pattern occurrence, however
+    many terms the glossary has.
+    """
+
+    def __init__(self, patterns: dict[str, str]) -> None:
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        # (pattern length, term key) ending at each state, longest first.
+        self._outputs: list[list[tuple[int, str]]] = [[]]
+
+        for pattern, term_key in patterns.items():
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._outputs.append([])
+                    self._goto[state][char] = next_state
+                state = next_state
+            self._outputs[state].append((len(pattern), term_key))
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._outputs[next_state] = sorted(
+                    self._outputs[next_state] + self._outputs[self._fail[next_state]],
+                    reverse=True,
+                )
+
+    def matches(self, folded: str) -> list[tuple[int, int, str]]:
+        """(start, end, term key) of every pattern occurrence, in order of end offset."""
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        found: list[tuple[int, int, str]] = []
+        state = 0
+        for position, char in enumerate(folded):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, term_key in outputs[state]:
+                found.append((position + 1 - length, position + 1, term_key))
+        return found
+
+
+class PackGlossary:
+    """Glossary spans for the static text of one flow pack."""
+
+    def __init__(self, steps: dict[str, list[GlossarySpan]], warnings: list[list[GlossarySpan]]) -> None:
+        self.steps = steps
+        self.warnings = warnings
+
+
+class GlossaryAnnotator:
+    """Marks glossary term spans in text with a precompiled automaton.
+
+    Matches are case-insensitive whole words; where terms overlap the leftmost, then
+    longest, wins ("STEM OPT Extension" over "OPT"). Flow-pack text never changes
+    between requests, so its spans are computed once per pack and shared.
+    """
+
+    def __init__(self, glossary_path: str = "data/shared/glossary.json") -> None:
+        path = Path(glossary_path)
+        payload = json.loads(path.read_text()) if path.exists() else {}
+        self.terms: list[dict] = payload.get("terms", [])
+
+        patterns: dict[str, str] = {}
+        for term in self.terms:
+            for pattern in glossary_patterns(term):
+                patterns.setdefault(pattern, str(term["key"]))
+        self._automaton = GlossaryAutomaton(patterns)
+        self._packs: dict[str, tuple[FlowPack, PackGlossary]] = {}
+        self._packs_lock = Lock()
+
+    def annotate(self, text: str) -> list[GlossarySpan]:
+        folded = text.translate(ASCII_FOLD)
+        spans: list[GlossarySpan] = []
+        covered_until = 0
+        for start, end, term_key in sorted(self._automaton.matches(folded), key=lambda match: (match[0], -match[1])):
+            if start < covered_until:
+                continue
+            if (start > 0 and folded[start - 1].isalnum()) or (end < len(folded) and folded[end].isalnum()):
+                continue
+            spans.append(GlossarySpan(start=start, end=end, term_key=term_key))
+            covered_until = end
+        return spans
+
+    def annotate_pack(self, pack: FlowPack) -> PackGlossary:
+        """Spans for a pack's step descriptions and warnings, cached until the pack object is replaced."""
+        with self._packs_lock:
+            cached = self._packs.get(pack.flow_id)
+        if cached is not None and cached[0] is pack:
+            return cached[1]
+
+        annotations = PackGlossary(
+            steps={node.node_id: self.annotate(node.description) for node in pack.step_nodes},
+            warnings=[self.annotate(warning) for warning in pack.warnings],
+        )
+        with self._packs_lock:
+            self._packs[pack.flow_id] = (pack, annotations)
+        return annotations
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+
+from app.pipeline.kb_index import KBIndex, _source_stamp
+from app.pipeline.kb_vectors import VectorIndex
+
+
+DELTA_VERSION = 1
+# scripts/build_uscis_kb.py rewrites the base artifacts instead of a delta once the
+# delta touches more than this share of the base chunks.
+DELTA_COMPACT_RATIO = 0.25
+
+
+def write_delta(
+    delta_path: Path,
+    base: KBIndex,
+    removed_ids: Iterable[str],
+    added_chunks: Iterable[dict],
+    target_path: Path,
+) -> None:
+    """Write the change from the base index's chunk set to target_path's, atomically.
+
+    JSONL: a header line (base and target stamps, removed chunk ids), then one line
+    per added chunk as it appears in the chunks JSONL.
+    """
+    target_size, target_mtime_ns = _source_stamp(target_path)
+    header = {
+        "delta_version": DELTA_VERSION,
+        "base_source_size": base.source_size,
+        "base_source_mtime_ns": base.source_mtime_ns,
+        "target_source_size": target_size,
+        "target_source_mtime_ns": target_mtime_ns,
+        "removed": sorted(removed_ids),
+    }
+    tmp_path = delta_path.with_suffix(delta_path.suffix + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as handle:
+        handle.write(json.dumps(header) + "\n")
+        for chunk in added_chunks:
+            handle.write(json.dumps(chunk) + "\n")
+    os.replace(tmp_path, delta_path)
+
+
+class KBDelta:
+    """Chunks added and removed since the base binary index was built.
+
+    Chunk ids are content hashes, so an id present in both the base and the target
+    is the same text, term offsets and vector; only added chunks need tokens read
+    and embeddings computed.
+    """
+
+    def __init__(self, header: dict, added: list[dict]) -> None:
+        self.header = header
+        self.removed = frozenset(header.get("removed", []))
+        self.added = added
+
+    @classmethod
+    def read(cls, path: Path) -> "KBDelta":
+        with path.open(encoding="utf-8") as handle:
+            header = json.loads(handle.readline() or "{}")
+            if header.get("delta_version") != DELTA_VERSION:
+                raise ValueError(f"{path} has an unsupported delta version")
+            added = [json.loads(line) for line in handle if line.strip()]
+        return cls(header, added)
+
+    def applies_to(self, base: KBIndex, chunks_path: Path) -> bool:
+        """True when the delta was computed against this base and leads to the current chunks file."""
+        return (self.header.get("base_source_size"), self.header.get("base_source_mtime_ns")) == (
+            base.source_size,
+            base.source_mtime_ns,
+        ) and (self.header.get("target_source_size"), self.header.get("target_source_mtime_ns")) == _source_stamp(
+            chunks_path
+        )
+
+    def apply(self, base: KBIndex, base_vectors: Optional[VectorIndex] = None) -> tuple[KBIndex, Optional[VectorIndex]]:
+        """In-memory index (and vectors, when the base has them) for base - removed + added.
+
+        Kept chunks come from the base index with their term offsets, so nothing is
+        re-tokenized; BM25 statistics are recomputed over the result, as in a full build.
+        Kept vectors are reused row by row and only added chunks are embedded, with
+        the base IDF weights (the next full build refreshes them).
+        """
+        added_ids = {chunk["chunk_id"] for chunk in self.added}
+        records = [
+            base.chunk_record(doc_index)
+            for doc_index in range(base.doc_count)
+            if base.chunk_id(doc_index) not in self.removed and base.chunk_id(doc_index) not in added_ids
+        ]
+        records.extend(self.added)
+        index = KBIndex.from_chunks(records)
+
+        vectors: Optional[VectorIndex] = None
+        if base_vectors is not None and base_vectors.doc_count == base.doc_count:
+            base_rows = {base.chunk_id(doc_index): doc_index for doc_index in range(base.doc_count)}
+            rows = np.empty((index.doc_count, base_vectors.vectors.shape[1]), dtype=np.float32)
+            for doc_index in range(index.doc_count):
+                base_row = base_rows.get(index.chunk_id(doc_index))
+                if base_row is not None and index.chunk_id(doc_index) not in added_ids:
+                    rows[doc_index] = base_vectors.vectors[base_row]
+                else:
+                    rows[doc_index] = base_vectors.embed(f"{index.chunk_title(doc_index)} {index.chunk_text(doc_index)}")
+            vectors = VectorIndex(rows, base_vectors.idf)
+        return index, vectors
@@ -0,0 +1,463 @@
+from __future__ import annotations
+
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from typing import Iterator, Optional
+
+
+TOKEN_RE = re.compile(r"[a-zA-Z0-9\-]{3,}")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+INDEX_MAGIC = b"VFKB"
+INDEX_VERSION = 2
+# Partition 0 holds the chunks shared by every school (USCIS); each school gets its own.
+GLOBAL_PARTITION = ""
+
+# (section name, array typecode). Sections are laid out in this order, 8-byte aligned.
+SECTIONS: list[tuple[str, str]] = [
+    ("str_ptr", "Q"),
+    ("str_data", "B"),
+    ("chunk_ids", "I"),
+    ("chunk_sources", "I"),
+    ("chunk_titles", "I"),
+    ("chunk_urls", "I"),
+    ("chunk_types", "I"),
+    ("chunk_texts", "I"),
+    ("chunk_partitions", "I"),
+    ("doc_lengths", "I"),
+    ("chunk_flow_ptr", "I"),
+    ("chunk_flows", "I"),
+    ("partition_names", "I"),
+    ("partition_ptr", "I"),
+    ("partition_sources", "I"),
+    ("flow_names", "I"),
+    ("flow_ptr", "I"),
+    ("flow_docs", "I"),
+    ("term_names", "I"),
+    ("term_ptr", "I"),
+    ("post_docs", "I"),
+    ("post_tfs", "I"),
+    ("post_impacts", "d"),
+    ("upper_bounds", "d"),
+    ("idf", "d"),
+    ("pos_ptr", "I"),
+    ("positions", "I"),
+    ("doc_term_ptr", "I"),
+    ("doc_terms", "I"),
+    ("doc_slots", "I"),
+]
+
+# magic, version, byte order, doc count, partition count, source count,
+# avg doc length, source JSON size, source JSON mtime_ns
+HEADER = struct.Struct("<4sIBxxxIIIdQQ")
+SECTION_ENTRY = struct.Struct("<QQ")
+
+
+def build_index(chunks: list[dict], source_size: int = 0, source_mtime_ns: int = 0) -> bytes:
+    """Serialize chunks into the binary KB layout read by KBIndex.
+
+    Chunks are stored grouped by school partition (global first), so each partition is
+    one contiguous chunk range and, since postings are sorted by chunk, one contiguous
+    slice of every posting list.
+    """
+    partition_names = [GLOBAL_PARTITION] + sorted(
+        {str(chunk.get("school_id", "")) for chunk in chunks} - {GLOBAL_PARTITION}
+    )
+    partition_of = {name: position for position, name in enumerate(partition_names)}
+    chunks = sorted(chunks, key=lambda chunk: partition_of[str(chunk.get("school_id", ""))])
+
+    strings: list[str] = []
+    string_ids: dict[str, int] = {}
+
+    def intern(value: str) -> int:
+        string_id = string_ids.get(value)
+        if string_id is None:
+            string_id = len(strings)
+            string_ids[value] = string_id
+            strings.append(value)
+        return string_id
+
+    columns: dict[str, array] = {name: array(typecode) for name, typecode in SECTIONS}
+    chunk_offsets: list[dict[str, list[int]]] = []
+    flow_members: dict[str, list[int]] = {}
+    columns["chunk_flow_ptr"].append(0)
+
+    for doc_index, chunk in enumerate(chunks):
+        text = " ".join(str(chunk.get("text", "")).split())
+        source_type = str(chunk.get("source_type", ""))
+        flows = [str(flow) for flow in chunk.get("flows", [])]
+
+        columns["chunk_ids"].append(intern(str(chunk.get("chunk_id", ""))))
+        columns["chunk_sources"].append(intern(str(chunk.get("source_id", ""))))
+        columns["chunk_titles"].append(intern(str(chunk.get("title", ""))))
+        columns["chunk_urls"].append(intern(str(chunk.get("url", ""))))
+        columns["chunk_types"].append(intern(source_type))
+        columns["chunk_texts"].append(intern(text))
+        columns["chunk_partitions"].append(partition_of[str(chunk.get("school_id", ""))])
+        for flow in flows:
+            columns["chunk_flows"].append(intern(flow))
+            flow_members.setdefault(flow, []).append(doc_index)
+        columns["chunk_flow_ptr"].append(len(columns["chunk_flows"]))
+
+        offsets = chunk.get("offsets") or _token_offsets(text, chunk.get("tokens"))
+        chunk_offsets.append(offsets)
+        columns["doc_lengths"].append(sum(len(starts) for starts in offsets.values()))
+
+    doc_count = len(chunks)
+    avg_length = (sum(columns["doc_lengths"]) / doc_count) if doc_count else 0.0
+    norm_base = avg_length or 1.0
+    doc_norms = [
+        BM25_K1 * (1.0 - BM25_B + BM25_B * length / norm_base) for length in columns["doc_lengths"]
+    ]
+
+    term_docs: dict[str, list[int]] = {}
+    for doc_index, offsets in enumerate(chunk_offsets):
+        for term in offsets:
+            term_docs.setdefault(term, []).append(doc_index)
+
+    columns["term_ptr"].append(0)
+    columns["pos_ptr"].append(0)
+    doc_term_slots: list[list[tuple[int, int]]] = [[] for _ in chunks]
+    for term_index, term in enumerate(sorted(term_docs)):
+        doc_ids = term_docs[term]
+        idf = math.log(1.0 + (doc_count - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+        upper_bound = 0.0
+        for doc_index in doc_ids:
+            starts = chunk_offsets[doc_index][term]
+            tf = len(starts)
+            # Query terms are deduplicated, so each posting's BM25 contribution is fixed here.
+            impact = idf * tf * (BM25_K1 + 1.0) / (tf + doc_norms[doc_index])
+            upper_bound = max(upper_bound, impact)
+            doc_term_slots[doc_index].append((term_index, len(columns["post_docs"])))
+            columns["post_docs"].append(doc_index)
+            columns["post_tfs"].append(tf)
+            columns["post_impacts"].append(impact)
+            columns["positions"].extend(starts)
+            columns["pos_ptr"].append(len(columns["positions"]))
+        columns["term_names"].append(intern(term))
+        columns["term_ptr"].append(len(columns["post_docs"]))
+        columns["upper_bounds"].append(upper_bound)
+        columns["idf"].append(idf)
+
+    # Forward table: per chunk, (term index, posting slot) pairs in term order.
+    columns["doc_term_ptr"].append(0)
+    for pairs in doc_term_slots:
+        for term_index, slot in pairs:
+            columns["doc_terms"].append(term_index)
+            columns["doc_slots"].append(slot)
+        columns["doc_term_ptr"].append(len(columns["doc_terms"]))
+
+    partition_sizes = [0] * len(partition_names)
+    partition_sources: list[set[str]] = [set() for _ in partition_names]
+    for chunk, partition in zip(chunks, columns["chunk_partitions"]):
+        partition_sizes[partition] += 1
+        partition_sources[partition].add(str(chunk.get("source_id", "")))
+    columns["partition_ptr"].append(0)
+    for name, size, sources in zip(partition_names, partition_sizes, partition_sources):
+        columns["partition_names"].append(intern(name))
+        columns["partition_ptr"].append(columns["partition_ptr"][-1] + size)
+        columns["partition_sources"].append(len(sources))
+
+    columns["flow_ptr"].append(0)
+    for flow in sorted(flow_members):
+        columns["flow_names"].append(intern(flow))
+        columns["flow_docs"].extend(flow_members[flow])
+        columns["flow_ptr"].append(len(columns["flow_docs"]))
+
+    encoded = [value.encode("utf-8") for value in strings]
+    columns["str_ptr"].append(0)
+    for blob in encoded:
+        columns["str_ptr"].append(columns["str_ptr"][-1] + len(blob))
+    columns["str_data"] = array("B", b"".join(encoded))
+
+    header = HEADER.pack(
+        INDEX_MAGIC,
+        INDEX_VERSION,
+        0 if sys.byteorder == "little" else 1,
+        doc_count,
+        len(partition_names),
+        len({chunk.get("source_id", "") for chunk in chunks}),
+        avg_length,
+        source_size,
+        source_mtime_ns,
+    )
+
+    table_size = len(SECTIONS) * SECTION_ENTRY.size
+    offset = _align(len(header) + table_size)
+    entries: list[bytes] = []
+    payloads: list[tuple[int, bytes]] = []
+    for name, _ in SECTIONS:
+        data = columns[name].tobytes()
+        entries.append(SECTION_ENTRY.pack(offset, len(columns[name])))
+        payloads.append((offset, data))
+        offset = _align(offset + len(data))
+
+    buffer = bytearray(offset)
+    buffer[: len(header)] = header
+    buffer[len(header) : len(header) + table_size] = b"".join(entries)
+    for start, data in payloads:
+        buffer[start : start + len(data)] = data
+    return bytes(buffer)
+
+
+def iter_records(path: Path, key: str = "chunks") -> Iterator[dict]:
+    """Records of a JSONL file one line at a time, or the key list of a JSON payload."""
+    if path.suffix == ".jsonl":
+        with path.open(encoding="utf-8") as handle:
+            for line in handle:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        yield from json.loads(path.read_text()).get(key, [])
+
+
+def _token_offsets(text: str, tokens: Optional[list[str]] = None) -> dict[str, list[int]]:
+    """Start offsets of each lowercase token in whitespace-normalized text.
+
+    Chunks built by scripts/build_uscis_kb.py carry their TOKEN_RE tokens in order.
+    Tokens are maximal runs of token characters, so each one is the first occurrence
+    of its string after the previous token and str.find locates it without running
+    the regex again. Anything that does not line up falls back to the regex.
+    """
+    offsets: dict[str, list[int]] = {}
+    lowered = text.lower()
+    if tokens and len(lowered) == len(text):
+        cursor = 0
+        for token in tokens:
+            start = lowered.find(token, cursor)
+            if start < 0:
+                break
+            offsets.setdefault(token, []).append(start)
+            cursor = start + len(token)
+        else:
+            return offsets
+        offsets = {}
+
+    for match in TOKEN_RE.finditer(text):
+        offsets.setdefault(match.group().lower(), []).append(match.start())
+    return offsets
+
+
+def write_index(chunks: list[dict], index_path: Path, source_path: Optional[Path] = None) -> None:
+    """Write the binary index atomically, stamped with the chunks JSON it was built from."""
+    source_size, source_mtime_ns = _source_stamp(source_path)
+    payload = build_index(chunks, source_size=source_size, source_mtime_ns=source_mtime_ns)
+    tmp_path = index_path.with_suffix(index_path.suffix + ".tmp")
+    tmp_path.write_bytes(payload)
+    os.replace(tmp_path, index_path)
+
+
+class KBIndex:
+    """Read-only view over the binary KB layout.
+
+    Opened from a file, the arrays are memoryviews over a shared read-only mmap, so
+    every worker process maps the same page-cache copy. Strings (including chunk text)
+    are only decoded when asked for.
+    """
+
+    def __init__(self, buffer, mapping: Optional[mmap.mmap] = None) -> None:
+        self._mapping = mapping
+        view = memoryview(buffer)
+        (
+            magic,
+            version,
+            byte_order,
+            self.doc_count,
+            self.partition_count,
+            self.source_count,
+            self.avg_doc_length,
+            self.source_size,
+            self.source_mtime_ns,
+        ) = HEADER.unpack_from(view, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError("Unsupported KB index format.")
+        if byte_order != (0 if sys.byteorder == "little" else 1):
+            raise ValueError("KB index was built with a different byte order.")
+
+        for position, (name, typecode) in enumerate(SECTIONS):
+            offset, count = SECTION_ENTRY.unpack_from(view, HEADER.size + position * SECTION_ENTRY.size)
+            itemsize = array(typecode).itemsize
+            setattr(self, name, view[offset : offset + count * itemsize].cast(typecode))
+
+        # The term and flow dictionaries are tiny next to postings; decode them once.
+        self.terms = [self.string(string_id) for string_id in self.term_names]
+        self.term_ids = {term: index for index, term in enumerate(self.terms)}
+        self.flow_ids = {self.string(string_id): index for index, string_id in enumerate(self.flow_names)}
+        self.partition_ids = {
+            self.string(string_id): index for index, string_id in enumerate(self.partition_names)
+        }
+        self._flow_sets: dict[str, frozenset[int]] = {}
+        self._type_ids: Optional[dict[str, int]] = None
+
+    @classmethod
+    def open(cls, path: Path) -> "KBIndex":
+        with path.open("rb") as handle:
+            mapping = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(mapping, mapping=mapping)
+
+    @classmethod
+    def from_chunks(cls, chunks: list[dict]) -> "KBIndex":
+        return cls(build_index(chunks))
+
+    def is_built_from(self, source_path: Path) -> bool:
+        return (self.source_size, self.source_mtime_ns) == _source_stamp(source_path)
+
+    def string(self, string_id: int) -> str:
+        return str(self.str_data[self.str_ptr[string_id] : self.str_ptr[string_id + 1]], "utf-8")
+
+    def postings(self, term: str):
+        """(chunk indexes, impacts) for a term, as zero-copy views, or None."""
+        term_index = self.term_ids.get(term)
+        if term_index is None:
+            return None
+        start, end = self.term_ptr[term_index], self.term_ptr[term_index + 1]
+        return self.post_docs[start:end], self.post_impacts[start:end]
+
+    def partition_ranges(self, school: str) -> list[tuple[int, int]]:
+        """[start, end) chunk ranges a query for this school searches: global, then the school's."""
+        partitions = [0]
+        school_index = self.partition_ids.get(school) if school else None
+        if school_index:
+            partitions.append(school_index)
+        ptr = self.partition_ptr
+        return [(ptr[partition], ptr[partition + 1]) for partition in partitions if ptr[partition] < ptr[partition + 1]]
+
+    def partition_source_count(self, school: str) -> int:
+        count = self.partition_sources[0] if self.partition_count else 0
+        school_index = self.partition_ids.get(school) if school else None
+        if school_index:
+            count += self.partition_sources[school_index]
+        return count
+
+    def partition_slots(self, term_index: int, ranges: list[tuple[int, int]]) -> list[tuple[int, int]]:
+        """[start, end) posting slots of a term that fall inside each chunk range."""
+        start, end = self.term_ptr[term_index], self.term_ptr[term_index + 1]
+        slots: list[tuple[int, int]] = []
+        for range_start, range_end in ranges:
+            low = bisect_left(self.post_docs, range_start, start, end)
+            high = bisect_left(self.post_docs, range_end, low, end)
+            if low < high:
+                slots.append((low, high))
+        return slots
+
+    def partition_postings(self, term: str, ranges: list[tuple[int, int]]):
+        """(chunk indexes, impacts) views of a term's postings inside each chunk range."""
+        term_index = self.term_ids.get(term)
+        if term_index is None:
+            return []
+        return [
+            (self.post_docs[low:high], self.post_impacts[low:high])
+            for low, high in self.partition_slots(term_index, ranges)
+        ]
+
+    def upper_bound(self, term: str) -> float:
+        return self.upper_bounds[self.term_ids[term]]
+
+    def flow_docs_set(self, flow_id: str) -> frozenset[int]:
+        cached = self._flow_sets.get(flow_id)
+        if cached is None:
+            flow_index = self.flow_ids.get(flow_id)
+            if flow_index is None:
+                cached = frozenset()
+            else:
+                cached = frozenset(self.flow_docs[self.flow_ptr[flow_index] : self.flow_ptr[flow_index + 1]])
+            self._flow_sets[flow_id] = cached
+        return cached
+
+    def source_type_id(self, source_type: str) -> Optional[int]:
+        """String id shared by every chunk of this source type, or None if no chunk has it."""
+        if self._type_ids is None:
+            self._type_ids = {self.string(string_id): string_id for string_id in set(self.chunk_types)}
+        return self._type_ids.get(source_type)
+
+    def term_hits(self, doc_index: int, term_indexes: dict[int, int]) -> list[tuple[int, int]]:
+        """Sorted (start, end) character spans of the given terms in one chunk.
+
+        term_indexes maps term index -> term length. Walks whichever side is shorter:
+        the query terms (bisecting their postings) or the chunk's forward term table.
+        """
+        hits: list[tuple[int, int]] = []
+        positions, pos_ptr = self.positions, self.pos_ptr
+        doc_start, doc_end = self.doc_term_ptr[doc_index], self.doc_term_ptr[doc_index + 1]
+        if len(term_indexes) < doc_end - doc_start:
+            post_docs, term_ptr = self.post_docs, self.term_ptr
+            for term_index, length in term_indexes.items():
+                start, end = term_ptr[term_index], term_ptr[term_index + 1]
+                slot = bisect_left(post_docs, doc_index, start, end)
+                if slot < end and post_docs[slot] == doc_index:
+                    hits.extend((offset, offset + length) for offset in positions[pos_ptr[slot] : pos_ptr[slot + 1]])
+        else:
+            for term_index, slot in zip(self.doc_terms[doc_start:doc_end], self.doc_slots[doc_start:doc_end]):
+                length = term_indexes.get(term_index)
+                if length is not None:
+                    hits.extend((offset, offset + length) for offset in positions[pos_ptr[slot] : pos_ptr[slot + 1]])
+        hits.sort()
+        return hits
+
+    def chunk_id(self, doc_index: int) -> str:
+        return self.string(self.chunk_ids[doc_index])
+
+    def chunk_flow_names(self, doc_index: int) -> list[str]:
+        start, end = self.chunk_flow_ptr[doc_index], self.chunk_flow_ptr[doc_index + 1]
+        return [self.string(string_id) for string_id in self.chunk_flows[start:end]]
+
+    def chunk_record(self, doc_index: int) -> dict:
+        """The chunk as build_index input, with its term offsets taken from the index.
+
+        Rebuilding from records like this skips JSON parsing and tokenization.
+        """
+        offsets: dict[str, list[int]] = {}
+        positions, pos_ptr = self.positions, self.pos_ptr
+        doc_start, doc_end = self.doc_term_ptr[doc_index], self.doc_term_ptr[doc_index + 1]
+        for term_index, slot in zip(self.doc_terms[doc_start:doc_end], self.doc_slots[doc_start:doc_end]):
+            offsets[self.terms[term_index]] = list(positions[pos_ptr[slot] : pos_ptr[slot + 1]])
+        return {
+            "chunk_id": self.chunk_id(doc_index),
+            "source_id": self.chunk_source(doc_index),
+            "title": self.chunk_title(doc_index),
+            "url": self.chunk_url(doc_index),
+            "source_type": self.chunk_type(doc_index),
+            "school_id": self.chunk_school(doc_index),
+            "flows": self.chunk_flow_names(doc_index),
+            "text": self.chunk_text(doc_index),
+            "offsets": offsets,
+        }
+
+    def chunk_source(self, doc_index: int) -> str:
+        return self.string(self.chunk_sources[doc_index])
+
+    def chunk_title(self, doc_index: int) -> str:
+        return self.string(self.chunk_titles[doc_index])
+
+    def chunk_url(self, doc_index: int) -> str:
+        return self.string(self.chunk_urls[doc_index])
+
+    def chunk_type(self, doc_index: int) -> str:
+        return self.string(self.chunk_types[doc_index])
+
+    def chunk_school(self, doc_index: int) -> str:
+        return self.string(self.partition_names[self.chunk_partitions[doc_index]])
+
+    def chunk_text(self, doc_index: int) -> str:
+        return self.string(self.chunk_texts[doc_index])
+
+
+def _source_stamp(source_path: Optional[Path]) -> tuple[int, int]:
+    if source_path is None or not source_path.exists():
+        return 0, 0
+    stat = source_path.stat()
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _align(offset: int, boundary: int = 8) -> int:
+    return (offset + boundary - 1) // boundary * boundary
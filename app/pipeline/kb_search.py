@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import base64
+import binascii
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+
+import numpy as np
+
+from app.models import SearchResponse, SearchTiming
+from app.pipeline.uscis_knowledge import RETRIEVAL_MODES, KBSnapshot, USCISKnowledgeBase, _tokenize
+
+
+SEARCH_RESULT_TTL_SECONDS = 120.0
+SEARCH_RESULT_CACHE_SIZE = 64
+MAX_PAGE_SIZE = 50
+
+
+class RankedResult:
+    """Full ranking of one search, kept briefly so later pages are slices instead of rescoring."""
+
+    def __init__(
+        self,
+        snapshot: KBSnapshot,
+        query_tokens: set[str],
+        chunk_indexes: np.ndarray,
+        scores: np.ndarray,
+        created_at: float,
+    ) -> None:
+        self.snapshot = snapshot
+        self.query_tokens = query_tokens
+        self.chunk_indexes = chunk_indexes
+        self.scores = scores
+        self.created_at = created_at
+
+
+class KBSearch:
+    """Paginated knowledge-base search with opaque cursors.
+
+    The first page ranks every matching chunk once (KBSnapshot.rank_all) and caches the
+    ranking under a result id for ttl_seconds. A cursor carries that id, the offset and
+    the KB version, so later pages slice the cached arrays and only build hits for the
+    page itself: paging deep into a broad query costs the same as the second page.
+    The cached ranking pins its snapshot, so a cursor keeps returning a consistent
+    order across a KB reload for as long as the ranking is cached.
+    """
+
+    def __init__(
+        self,
+        kb: USCISKnowledgeBase,
+        ttl_seconds: float = SEARCH_RESULT_TTL_SECONDS,
+        cache_size: int = SEARCH_RESULT_CACHE_SIZE,
+    ) -> None:
+        self._kb = kb
+        self._ttl_seconds = ttl_seconds
+        self._cache_size = max(1, cache_size)
+        self._results: OrderedDict[tuple[str, str], RankedResult] = OrderedDict()
+        self._lock = Lock()
+
+    def search(
+        self,
+        query: str,
+        flow_id: str = "",
+        source_type: str = "",
+        school: str = "",
+        mode: Optional[str] = None,
+        page_size: int = 10,
+        cursor: str = "",
+    ) -> SearchResponse:
+        """One page of chunks matching query, best first.
+
+        school is a school id (as resolved by SchoolResolver); its partition is searched
+        alongside the global one. Raises ValueError for a malformed cursor, one issued
+        for a different query, or one whose ranking expired after a KB reload.
+        """
+        started = time.perf_counter()
+        mode = mode or self._kb.mode
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {mode!r}; expected one of {RETRIEVAL_MODES}.")
+        page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+
+        query_key = " ".join(sorted(_tokenize(query))) if mode == "lexical" else " ".join(query.lower().split())
+        result_id = hashlib.blake2b(
+            json.dumps([query_key, flow_id, source_type, school, mode]).encode(),
+            digest_size=9,
+        ).hexdigest()
+
+        offset = 0
+        version = self._kb.version
+        if cursor:
+            cursor_id, offset, version = _decode_cursor(cursor)
+            if cursor_id != result_id:
+                raise ValueError("Cursor was issued for a different query or filters.")
+
+        result = self._cached(result_id, version)
+        cached = result is not None
+        rank_ms = 0.0
+        if result is None:
+            snapshot = self._kb.snapshot
+            if snapshot.version != version:
+                raise ValueError("Cursor expired after a knowledge base reload; restart the search.")
+            rank_started = time.perf_counter()
+            query_tokens = _tokenize(query)
+            chunk_indexes, scores = snapshot.rank_all(query, query_tokens, flow_id, school, source_type, mode)
+            result = RankedResult(snapshot, query_tokens, chunk_indexes, scores, time.monotonic())
+            rank_ms = (time.perf_counter() - rank_started) * 1000
+            self._store(result_id, result)
+
+        page_started = time.perf_counter()
+        end = min(offset + page_size, len(result.chunk_indexes))
+        hits = result.snapshot.search_hits(
+            result.chunk_indexes[offset:end].tolist(),
+            result.scores[offset:end].tolist(),
+            result.query_tokens,
+        )
+        next_cursor = _encode_cursor(result_id, end, result.snapshot.version) if end < len(result.chunk_indexes) else None
+        page_ms = (time.perf_counter() - page_started) * 1000
+
+        return SearchResponse(
+            query=query,
+            total=len(result.chunk_indexes),
+            hits=hits,
+            next_cursor=next_cursor,
+            cached=cached,
+            kb_version=result.snapshot.version,
+            timing=SearchTiming(
+                rank_ms=round(rank_ms, 3),
+                page_ms=round(page_ms, 3),
+                total_ms=round((time.perf_counter() - started) * 1000, 3),
+            ),
+        )
+
+    def _cached(self, result_id: str, version: str) -> Optional[RankedResult]:
+        key = (result_id, version)
+        with self._lock:
+            result = self._results.get(key)
+            if result is None:
+                return None
+            if time.monotonic() - result.created_at > self._ttl_seconds:
+                del self._results[key]
+                return None
+            self._results.move_to_end(key)
+            return result
+
+    def _store(self, result_id: str, result: RankedResult) -> None:
+        with self._lock:
+            self._results[(result_id, result.snapshot.version)] = result
+            self._results.move_to_end((result_id, result.snapshot.version))
+            now = time.monotonic()
+            for key in [key for key, entry in self._results.items() if now - entry.created_at > self._ttl_seconds]:
+                del self._results[key]
+            while len(self._results) > self._cache_size:
+                self._results.popitem(last=False)
+
+
+def _encode_cursor(result_id: str, offset: int, version: str) -> str:
+    payload = json.dumps([result_id, offset, version], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[str, int, str]:
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        result_id, offset, version = json.loads(payload)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise ValueError("Malformed cursor.") from None
+    if not isinstance(result_id, str) or not isinstance(version, str) or not isinstance(offset, int) or offset < 0:
+        raise ValueError("Malformed cursor.")
+    return result_id, offset, version
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import os
+import re
+import zlib
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from app.pipeline.kb_index import KBIndex, _source_stamp
+
+
+VECTORS_VERSION = 1
+
+# Signed feature hashing into HASH_BUCKETS sparse dimensions, then a fixed Gaussian
+# random projection down to VECTOR_DIM dense dimensions. Everything is derived from
+# constants, so the query side needs no model files and no network.
+HASH_BITS = 14
+HASH_BUCKETS = 1 << HASH_BITS
+VECTOR_DIM = 256
+PROJECTION_SEED = 20240611
+CHAR_NGRAMS = (3, 4, 5)
+WORD_WEIGHT = 2.0
+
+NORMALIZE_RE = re.compile(r"[^a-z0-9]+")
+
+_ROLL_PRIME = np.uint64(1099511628211)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+_BUCKET_SHIFT = np.uint64(64 - HASH_BITS)
+_SIGN_SHIFT = np.uint64(17)
+
+
+def index_embedding_texts(index: KBIndex) -> list[str]:
+    """Text embedded for each chunk, in index chunk order (which groups chunks by school)."""
+    return [f"{index.chunk_title(doc_index)} {index.chunk_text(doc_index)}" for doc_index in range(index.doc_count)]
+
+
+def hashed_features(text: str) -> tuple[np.ndarray, np.ndarray]:
+    """Sparse (bucket indexes, weights) of a text's character n-grams and words.
+
+    N-grams run over the lowercased text with punctuation folded to single spaces, so
+    they straddle word boundaries and "studying" still shares most grams with "study".
+    Counts are damped with log1p so one repeated word cannot dominate a chunk.
+    """
+    normalized = f" {NORMALIZE_RE.sub(' ', text.lower()).strip()} "
+    if len(normalized) <= 2:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    codes = np.frombuffer(normalized.encode("ascii"), dtype=np.uint8).astype(np.uint64)
+    hashes: list[np.ndarray] = []
+    weights: list[np.ndarray] = []
+    for size in CHAR_NGRAMS:
+        if len(codes) < size:
+            continue
+        rolled = np.full(len(codes) - size + 1, size, dtype=np.uint64)
+        for offset in range(size):
+            rolled = rolled * _ROLL_PRIME + codes[offset : len(codes) - size + 1 + offset]
+        hashes.append(rolled)
+        weights.append(np.ones(len(rolled), dtype=np.float32))
+
+    words = normalized.split()
+    hashes.append(np.fromiter((zlib.crc32(word.encode("ascii")) for word in words), dtype=np.uint64, count=len(words)))
+    weights.append(np.full(len(words), WORD_WEIGHT, dtype=np.float32))
+
+    mixed = np.concatenate(hashes) * _MIX
+    buckets = (mixed >> _BUCKET_SHIFT).astype(np.int64)
+    signs = np.where((mixed >> _SIGN_SHIFT) & np.uint64(1), 1.0, -1.0).astype(np.float32)
+    counts = np.bincount(buckets, weights=signs * np.concatenate(weights), minlength=HASH_BUCKETS)
+    nonzero = np.flatnonzero(counts)
+    values = counts[nonzero]
+    return nonzero, (np.sign(values) * np.log1p(np.abs(values))).astype(np.float32)
+
+
+@lru_cache(maxsize=1)
+def projection_matrix() -> np.ndarray:
+    rng = np.random.default_rng(PROJECTION_SEED)
+    return rng.standard_normal((HASH_BUCKETS, VECTOR_DIM), dtype=np.float32) / np.float32(np.sqrt(VECTOR_DIM))
+
+
+def build_vectors(texts: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    """Unit-length (len(texts), VECTOR_DIM) float32 matrix plus the bucket IDF weights."""
+    features = [hashed_features(text) for text in texts]
+    document_frequency = np.zeros(HASH_BUCKETS, dtype=np.float64)
+    for buckets, _ in features:
+        document_frequency[buckets] += 1
+    idf = (np.log((1 + len(texts)) / (1 + document_frequency)) + 1).astype(np.float32)
+
+    projection = projection_matrix()
+    vectors = np.zeros((len(texts), VECTOR_DIM), dtype=np.float32)
+    for row, (buckets, values) in enumerate(features):
+        if buckets.size:
+            vectors[row] = (values * idf[buckets]) @ projection[buckets]
+    return _normalize_rows(vectors), idf
+
+
+def write_vectors(texts: list[str], vectors_path: Path, source_path: Optional[Path] = None) -> None:
+    """Write the vector matrix atomically, stamped with the chunks JSON it was built from."""
+    vectors, idf = build_vectors(texts)
+    source_size, source_mtime_ns = _source_stamp(source_path)
+    meta = np.array([VECTORS_VERSION, HASH_BITS, VECTOR_DIM, PROJECTION_SEED, source_size, source_mtime_ns], dtype=np.int64)
+    tmp_path = vectors_path.with_suffix(vectors_path.suffix + ".tmp")
+    with tmp_path.open("wb") as handle:
+        np.savez(handle, vectors=vectors, idf=idf, meta=meta)
+    os.replace(tmp_path, vectors_path)
+
+
+class VectorIndex:
+    """Dense chunk vectors searched by brute-force matrix-vector product."""
+
+    def __init__(self, vectors: np.ndarray, idf: np.ndarray, source_size: int = 0, source_mtime_ns: int = 0) -> None:
+        self.vectors = vectors
+        self.idf = idf
+        self.source_size = source_size
+        self.source_mtime_ns = source_mtime_ns
+
+    @classmethod
+    def load(cls, path: Path) -> "VectorIndex":
+        with np.load(path) as payload:
+            meta = payload["meta"]
+            version, hash_bits, dim, seed = (int(value) for value in meta[:4])
+            if (version, hash_bits, dim, seed) != (VECTORS_VERSION, HASH_BITS, VECTOR_DIM, PROJECTION_SEED):
+                raise ValueError(f"{path} was built with different vector settings")
+            return cls(payload["vectors"], payload["idf"], int(meta[4]), int(meta[5]))
+
+    @classmethod
+    def from_texts(cls, texts: list[str]) -> "VectorIndex":
+        return cls(*build_vectors(texts))
+
+    @property
+    def doc_count(self) -> int:
+        return len(self.vectors)
+
+    def is_built_from(self, source_path: Path) -> bool:
+        return (self.source_size, self.source_mtime_ns) == _source_stamp(source_path)
+
+    def embed(self, text: str) -> np.ndarray:
+        buckets, values = hashed_features(text)
+        vector = np.zeros(VECTOR_DIM, dtype=np.float32)
+        if buckets.size:
+            vector = (values * self.idf[buckets]) @ projection_matrix()[buckets]
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+    def similarities(self, text: str) -> np.ndarray:
+        """Cosine similarity of the text against every chunk, in chunk order."""
+        return self.vectors @ self.embed(text)
+
+    def range_similarities(self, text: str, ranges: list[tuple[int, int]]) -> tuple[np.ndarray, np.ndarray]:
+        """(chunk indexes, cosine similarities) for the chunks inside the given [start, end) ranges."""
+        query_vector = self.embed(text)
+        if not ranges:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        chunk_indexes = np.concatenate([np.arange(start, end) for start, end in ranges])
+        similarities = np.concatenate([self.vectors[start:end] @ query_vector for start, end in ranges])
+        return chunk_indexes, similarities
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
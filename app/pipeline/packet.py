@@ -2,12 +2,14 @@ from __future__ import annotations
 
 from datetime import datetime, timezone
 
-from app.models import SessionState, StepStatus
+from app.models import StepStatus
+from app.pipeline.session import Session
 
 
-def build_advisor_packet(session: SessionState) -> str:
-    completed_steps = [step for step in session.workflow if step.status == StepStatus.complete]
-    pending_steps = [step for step in session.workflow if step.status != StepStatus.complete]
+def build_advisor_packet(session: Session) -> str:
+    workflow = session.workflow
+    completed_steps = [step for step in workflow if step.status == StepStatus.complete]
+    pending_steps = [step for step in workflow if step.status != StepStatus.complete]
 
     packet = f"""# VisaFlow Advisor Packet
 
@@ -76,7 +78,7 @@ def _citations_md(citations) -> str:
     return "\n".join(f"- [{citation.title}]({citation.url})" for citation in citations[:6])
 
 
-def _advisor_questions(session: SessionState) -> list[str]:
+def _advisor_questions(session: Session) -> list[str]:
     questions = [
         "Which assumptions in this packet should be verified before any filing action?",
         "Which missing entities block advisor-ready preparation?",
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import time
+from typing import Callable, Optional
+
+from app.models import RefreshTrace
+
+
+# What an event can change on a session.
+INPUTS = frozenset(
+    {
+        "intent",
+        "profile",
+        "flow",
+        "fields",
+        "school",
+        "steps",
+        "micro_checks",
+        "mode",
+        "events",
+        "kb",
+    }
+)
+
+# Derived stages in run order, each with what it reads: inputs, or the output of an
+# earlier stage (named after it). A stage returns the names of what it changed, so
+# a stage whose output came out the same does not invalidate later ones. Within
+# that, the order is by importance, so a latency budget cuts from the end.
+STAGES: list[tuple[str, frozenset[str]]] = [
+    # flow: selecting a flow clears flags that only a fresh ranking restores.
+    ("rank", frozenset({"intent", "fields", "flow"})),
+    ("missing", frozenset({"flow", "fields"})),
+    ("workflow", frozenset({"flow", "fields", "steps"})),
+    ("disambiguation", frozenset({"flow", "rank"})),
+    (
+        "scores",
+        frozenset(
+            {"profile", "flow", "fields", "workflow", "micro_checks", "events", "mode", "disambiguation", "rank"}
+        ),
+    ),
+    ("checks", frozenset({"flow", "missing", "disambiguation"})),
+    ("citations", frozenset({"intent", "flow", "school", "missing", "rank", "kb"})),
+]
+
+# Stages that may be deferred (to fit a latency budget, or to run in the background):
+# nothing reads their output, and the session keeps the previous one until they run.
+OPTIONAL_STAGES = frozenset({"citations"})
+
+
+class RefreshPass:
+    """Recomputes what a trigger invalidated and records which stages ran.
+
+    With a deadline (a time.perf_counter() value), an optional stage whose estimated
+    cost would run past it is deferred instead; with defer_optional, every optional
+    stage is. deferred lists what was, and over_budget what the deadline deferred.
+    """
+
+    def __init__(
+        self,
+        trigger: str,
+        stages: dict[str, Callable[[], set[str]]],
+        deadline: Optional[float] = None,
+        estimates: Optional[dict[str, float]] = None,
+        defer_optional: bool = False,
+    ) -> None:
+        self._stages = stages
+        self._deadline = deadline
+        self._defer_optional = defer_optional
+        self._estimates = estimates or {}
+        self.trace = RefreshTrace(trigger=trigger)
+        self.deferred: set[str] = set()
+        self.over_budget: set[str] = set()
+        # Milliseconds each stage took in this pass.
+        self.stage_ms: dict[str, float] = {}
+
+    def run(self, dirty: set[str], stale: frozenset[str] = frozenset()) -> None:
+        """Run, in STAGES order, each stage that reads something dirty or whose output is stale.
+
+        May be called again for a follow-up change.
+        """
+        started = time.perf_counter()
+        dirty = set(dirty)
+        self.trace.dirty.extend(sorted(dirty - set(self.trace.dirty)))
+        for name, inputs in STAGES:
+            if not (inputs & dirty or name in stale):
+                continue
+            stage_started = time.perf_counter()
+            if name in OPTIONAL_STAGES:
+                if self._defer_optional:
+                    self.deferred.add(name)
+                    continue
+                estimate_ms = self._estimates.get(name, 0.0)
+                if self._deadline is not None and stage_started + estimate_ms / 1000 > self._deadline:
+                    self.deferred.add(name)
+                    self.over_budget.add(name)
+                    continue
+            dirty |= self._stages[name]()
+            self.deferred.discard(name)
+            self.over_budget.discard(name)
+            self.stage_ms[name] = (time.perf_counter() - stage_started) * 1000
+            self.trace.ran.append(name)
+        self.trace.skipped = [name for name, _ in STAGES if name not in self.trace.ran]
+        self.trace.deferred = [name for name, _ in STAGES if name in self.deferred]
+        self.trace.elapsed_ms = round(self.trace.elapsed_ms + (time.perf_counter() - started) * 1000, 3)
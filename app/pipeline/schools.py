@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import json
+import re
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+
+
+NORMALIZE_RE = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_school_name(name: str) -> str:
+    return NORMALIZE_RE.sub(" ", name.lower()).strip()
+
+
+class SchoolResolver:
+    """Resolves free-text school names to KB partition (school) ids from the source map.
+
+    A name resolves when it equals one of a school's aliases or contains one as a
+    whole-word run ("University of California, San Diego" contains "san diego").
+    Lookups walk the name's word windows against an alias table, so they cost the
+    same for two schools as for hundreds, and results are kept in a bounded LRU.
+    """
+
+    def __init__(self, source_map_path: str = "app/data/source_map.json", cache_size: int = 1024) -> None:
+        self._aliases: dict[str, str] = {}
+        self._max_alias_words = 0
+        self._cache_size = max(0, cache_size)
+        self._cache: OrderedDict[str, str] = OrderedDict()
+        self._lock = Lock()
+
+        path = Path(source_map_path)
+        payload = json.loads(path.read_text()) if path.exists() else {}
+        for school in payload.get("schools", []):
+            school_id = str(school["school_id"])
+            for alias in [school_id, school.get("name", ""), *school.get("aliases", [])]:
+                normalized = normalize_school_name(str(alias))
+                if normalized:
+                    self._aliases.setdefault(normalized, school_id)
+                    self._max_alias_words = max(self._max_alias_words, len(normalized.split()))
+
+    def resolve(self, school_name: str) -> str:
+        """School id for the name, or "" when it matches no school with its own partition."""
+        normalized = normalize_school_name(school_name)
+        if not normalized:
+            return ""
+
+        with self._lock:
+            cached = self._cache.get(normalized)
+            if cached is not None:
+                self._cache.move_to_end(normalized)
+                return cached
+
+        school_id = self._aliases.get(normalized, "")
+        if not school_id:
+            words = normalized.split()
+            # Longest windows first, so "uc san diego" wins over a shorter alias inside it.
+            for size in range(min(len(words), self._max_alias_words), 0, -1):
+                for start in range(len(words) - size + 1):
+                    school_id = self._aliases.get(" ".join(words[start : start + size]), "")
+                    if school_id:
+                        break
+                if school_id:
+                    break
+
+        with self._lock:
+            if self._cache_size:
+                self._cache[normalized] = school_id
+                if len(self._cache) > self._cache_size:
+                    self._cache.popitem(last=False)
+        return school_id
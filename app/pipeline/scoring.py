@@ -2,7 +2,9 @@ from __future__ import annotations
 
 from datetime import datetime
 
-from app.models import EventType, InterfaceMode, ScoreCard, SessionState, StepStatus
+from app.models import EventType, InterfaceMode
+from app.pipeline.session import Scores, Session
+from app.pipeline.workflow import completed_step_count
 
 
 CONFUSION_EVENTS = {
@@ -20,15 +22,15 @@ CRITICAL_FIELDS_BY_FLOW = {
 }
 
 
-def recompute_scores(session: SessionState, required_fields: list[str], flow_id: str) -> ScoreCard:
+def recompute_scores(session: Session, required_fields: list[str], flow_id: str) -> Scores:
     required_count = max(1, len(required_fields))
     filled_required = sum(
         1 for field in required_fields if str(session.fields.get(field, "")).strip()
     )
     field_completion = filled_required / required_count
 
-    step_total = max(1, len(session.workflow))
-    completed_steps = sum(1 for step in session.workflow if step.status == StepStatus.complete)
+    step_total = max(1, len(session.step_state))
+    completed_steps = completed_step_count(session.step_state)
     step_completion = completed_steps / step_total
 
     checks_total = len(session.micro_checks)
@@ -88,7 +90,7 @@ def recompute_scores(session: SessionState, required_fields: list[str], flow_id:
     if flow_id == "cap_gap_transition_prep" and not str(session.fields.get("petition_status", "")).strip():
         escalation += 12
 
-    return ScoreCard(
+    return Scores(
         understanding_score=_clamp(understanding),
         clarity_score=_clamp(clarity),
         completeness_score=_clamp(completeness),
@@ -103,7 +105,7 @@ def _critical_fields(flow_id: str, required_fields: list[str]) -> set[str]:
     return (flow_fields | defaults) & required_set if required_set else (flow_fields | defaults)
 
 
-def _conflict_penalty(flow_id: str, session: SessionState) -> int:
+def _conflict_penalty(flow_id: str, session: Session) -> int:
     penalty = 0
     status = str(session.fields.get("status_type", "")).strip().lower()
     stage = str(session.fields.get("program_stage", "")).strip().lower()
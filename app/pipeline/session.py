@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import sys
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Optional
+from uuid import uuid4
+
+from app.models import (
+    AdaptationEvent,
+    CaseGraph,
+    Citation,
+    DisambiguationCard,
+    EventType,
+    FlowCandidate,
+    GlossarySpan,
+    InterfaceMode,
+    MicroCheck,
+    MicroCheckResult,
+    SessionProfile,
+    SessionState,
+    WorkflowStep,
+)
+from app.pipeline.flow_packs import FlowTemplate
+
+
+# The engine mutates sessions on every event, so it works on these plain slotted
+# dataclasses: construction and attribute writes skip validation. The pydantic
+# models in app/models.py are the API contract; Session.to_model() converts at the boundary.
+
+# SessionState fields read straight off a Session; pydantic-core converts the nested
+# dataclasses (events, scores) by attribute.
+_DIRECT_FIELDS = tuple(
+    name for name in SessionState.model_fields if name not in {"case_graph", "workflow", "citations"}
+)
+
+
+def interned_keys(mapping: dict[str, Any]) -> dict[str, Any]:
+    """Copy of mapping with interned keys: field names and payload keys repeat across sessions."""
+    return {sys.intern(key): value for key, value in mapping.items()}
+
+
+@dataclass(slots=True)
+class SessionEvent:
+    event_type: EventType
+    payload: dict[str, Any]
+    created_at: datetime = field(default_factory=datetime.utcnow)
+
+
+@dataclass(slots=True)
+class SessionCitation:
+    """A KB citation (shared with the KB result cache, never mutated) and its glossary spans."""
+
+    citation: Citation
+    glossary: list[GlossarySpan]
+
+    @property
+    def kb_version(self) -> str:
+        return self.citation.kb_version
+
+    @property
+    def title(self) -> str:
+        return self.citation.title
+
+    @property
+    def url(self) -> str:
+        return self.citation.url
+
+    def to_model(self) -> Citation:
+        return self.citation.model_copy(update={"glossary": self.glossary})
+
+
+@dataclass(slots=True)
+class Scores:
+    understanding_score: int = 70
+    clarity_score: int = 70
+    completeness_score: int = 0
+    escalation_risk: int = 15
+
+
+@dataclass(slots=True)
+class Session:
+    intent: str
+    profile: SessionProfile
+    scenario: str
+    current_mode: InterfaceMode
+    session_id: str = field(default_factory=lambda: str(uuid4()))
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    updated_at: datetime = field(default_factory=datetime.utcnow)
+
+    selected_flow_id: str = ""
+    selected_flow_title: str = ""
+    flow_locked: bool = False
+    candidate_flows: list[FlowCandidate] = field(default_factory=list)
+    ambiguity_flags: list[str] = field(default_factory=list)
+    disambiguation_card: Optional[DisambiguationCard] = None
+
+    # Shared template of the selected flow, and this session's state against it
+    # (see app/pipeline/workflow.py).
+    flow_template: Optional[FlowTemplate] = None
+    step_state: bytearray = field(default_factory=bytearray)
+    # Static flow-pack text, shared with the pack.
+    flow_description: str = ""
+    doc_requirements: list[str] = field(default_factory=list)
+    common_confusions: list[str] = field(default_factory=list)
+    flow_warnings: list[str] = field(default_factory=list)
+    flow_warning_glossary: list[list[GlossarySpan]] = field(default_factory=list)
+    flow_disclaimer: str = "Workflow preparation assistant only. Not legal advice."
+
+    required_entities: list[str] = field(default_factory=list)
+    # Keys are interned (see set_field and interned_keys).
+    fields: dict[str, str] = field(default_factory=dict)
+    missing_items: list[str] = field(default_factory=list)
+
+    scores: Scores = field(default_factory=Scores)
+    citations: list[SessionCitation] = field(default_factory=list)
+
+    active_check_ids: list[str] = field(default_factory=list)
+    available_micro_checks: list[MicroCheck] = field(default_factory=list)
+    events: list[SessionEvent] = field(default_factory=list)
+    manual_mode_events_remaining: int = 0
+    adaptation_log: list[AdaptationEvent] = field(default_factory=list)
+    micro_checks: dict[str, MicroCheckResult] = field(default_factory=dict)
+
+    advisor_packet_markdown: Optional[str] = None
+    # Stages deferred by a latency budget; they run on the next refresh with time for them.
+    stale: list[str] = field(default_factory=list)
+    # Bumped by every event and micro-check refresh, so work done on a copy can tell
+    # whether the session moved on meanwhile (see PipelineEngine.adopt_stale).
+    revision: int = 0
+
+    @property
+    def workflow(self) -> list[WorkflowStep]:
+        """Read-only view of the steps in their current state."""
+        return self.flow_template.workflow(self.step_state) if self.flow_template else []
+
+    def set_field(self, name: str, value: str) -> None:
+        self.fields[sys.intern(name)] = value
+
+    def to_model(self) -> SessionState:
+        """The API model of this session.
+
+        Validation copies every container, so the result can be serialized after the
+        session's lock is released while later events mutate the session. Nested
+        pydantic instances (flow candidates, checks, steps) are reused as they are.
+        """
+        data = {name: getattr(self, name) for name in _DIRECT_FIELDS}
+        data["case_graph"] = self.flow_template.case_graph(self.step_state) if self.flow_template else CaseGraph()
+        data["workflow"] = self.workflow
+        data["citations"] = [citation.to_model() for citation in self.citations]
+        return SessionState.model_validate(data, from_attributes=True)
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+
+# Shared by every span() call made while no engine call is being traced.
+_NO_SPAN = nullcontext()
+_current: ContextVar[Optional["SpanTimes"]] = ContextVar("pipeline_spans", default=None)
+
+
+class SpanTimes:
+    """Milliseconds spent in each named span of one engine call; repeated spans add up."""
+
+    __slots__ = ("spans",)
+
+    def __init__(self) -> None:
+        self.spans: dict[str, float] = {}
+
+    def add(self, name: str, elapsed_ms: float) -> None:
+        self.spans[name] = self.spans.get(name, 0.0) + elapsed_ms
+
+    def rounded(self) -> dict[str, float]:
+        return {name: round(elapsed_ms, 3) for name, elapsed_ms in self.spans.items()}
+
+
+class _Span:
+    __slots__ = ("_times", "_name", "_started")
+
+    def __init__(self, times: SpanTimes, name: str) -> None:
+        self._times = times
+        self._name = name
+
+    def __enter__(self) -> None:
+        self._started = time.perf_counter()
+
+    def __exit__(self, *exc_info: object) -> None:
+        self._times.add(self._name, (time.perf_counter() - self._started) * 1000)
+
+
+def span(name: str) -> _Span | nullcontext:
+    """Time the with-block under name, when the current engine call is traced.
+
+    Untraced, this is one context variable lookup and a shared no-op context.
+    """
+    times = _current.get()
+    if times is None:
+        return _NO_SPAN
+    return _Span(times, name)
+
+
+@contextmanager
+def traced(enabled: bool) -> Iterator[Optional[SpanTimes]]:
+    """Collect the span() timings made in this block; nested blocks add to the outermost one.
+
+    Yields None when tracing is off.
+    """
+    outer = _current.get()
+    if not enabled or outer is not None:
+        yield outer
+        return
+    times = SpanTimes()
+    token = _current.set(times)
+    try:
+        yield times
+    finally:
+        _current.reset(token)
+
+
+def current_spans() -> dict[str, float]:
+    """Span timings collected so far in the traced block this runs in, if any."""
+    times = _current.get()
+    return times.rounded() if times is not None else {}
+
+
+def server_timing(spans: dict[str, float]) -> str:
+    """A Server-Timing header value for span timings."""
+    return ", ".join(f"{name};dur={elapsed_ms:.3f}" for name, elapsed_ms in spans.items())
@@ -1,103 +1,1084 @@
 from __future__ import annotations
 
-import json
-import re
+import heapq
+import math
+import time
+import zlib
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from concurrent.futures import Future
 from pathlib import Path
+from threading import Event, Lock, Thread
+from typing import Callable, Optional
 
-from app.models import Citation, SourceChunk
+import numpy as np
 
+from app.models import Citation, CitationFragment, SearchHit, SourceChunk
+from app.pipeline.kb_delta import KBDelta
+from app.pipeline.kb_index import TOKEN_RE, KBIndex, _source_stamp, iter_records
+from app.pipeline.kb_vectors import VectorIndex, index_embedding_texts
 
-TOKEN_RE = re.compile(r"[a-zA-Z0-9\-]{3,}")
+
+FLOW_BOOST = 1.3
+# Slack for float summation order when comparing score bounds against a threshold.
+PRUNE_EPSILON = 1e-9
+
+# Upper bound on query x chunk score cells held at once by retrieve_batch.
+BATCH_SCORE_CELLS = 4_000_000
+
+RETRIEVAL_MODES = ("lexical", "dense", "hybrid")
+# Share of the hybrid score taken by dense cosine similarity; the rest is BM25
+# (flow boost included) normalized by the query's best lexical score.
+HYBRID_DENSE_WEIGHT = 0.35
+
+# Lexical queries are keyed by their token set; dense and hybrid embed the whole
+# text (word counts, short words), so they are keyed by the normalized string.
+CacheKey = tuple[frozenset[str] | str, str, str, int, int, str]
 
 
 class USCISKnowledgeBase:
-    """Knowledge retrieval over USCIS + UCSD source chunks for demo grounding."""
+    """Knowledge retrieval over USCIS + school (ISSO) source chunks for demo grounding.
+
+    Retrieval runs against an immutable KBSnapshot. reload() builds a new snapshot
+    off to the side and swaps it in with one assignment, so queries already running
+    finish on the snapshot they started with and never see a half-built index.
+    """
 
-    def __init__(self, chunks_path: str = "data/knowledge_chunks.json") -> None:
+    def __init__(
+        self,
+        chunks_path: str = "data/knowledge_chunks.jsonl",
+        cache_size: int = 512,
+        pruning: bool = True,
+        index_path: Optional[str] = None,
+        vectors_path: Optional[str] = None,
+        mode: str = "lexical",
+        delta_path: Optional[str] = None,
+    ) -> None:
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {mode!r}; expected one of {RETRIEVAL_MODES}.")
         self._chunks_path = Path(chunks_path)
-        self._chunks: list[SourceChunk] = []
+        # Binary artifacts written next to the chunks JSON by scripts/build_uscis_kb.py.
+        self._index_path = Path(index_path) if index_path else self._chunks_path.with_suffix(".bin")
+        self._vectors_path = Path(vectors_path) if vectors_path else self._chunks_path.with_suffix(".vectors.npz")
+        # Chunks changed since the binary index was built, applied on top of it at load.
+        self._delta_path = Path(delta_path) if delta_path else self._chunks_path.with_suffix(".delta.jsonl")
+        self._pruning = pruning
+        self._mode = mode
+        self._snapshot = KBSnapshot(KBIndex.from_chunks([]), pruning=pruning)
+
+        # Reloads are serialized; readers never take this lock.
+        self._reload_lock = Lock()
+        self._reload_thread: Optional[Thread] = None
+        self._watch_thread: Optional[Thread] = None
+        self._watch_stop = Event()
+        self.last_reload_error = ""
+
+        # Query-result cache. Identical in-flight queries share one Future (single-flight).
+        self._cache_size = max(0, cache_size)
+        self._cache: OrderedDict[CacheKey, list[Citation]] = OrderedDict()
+        self._inflight: dict[CacheKey, Future] = {}
+        self._cache_lock = Lock()
+        self._cache_generation = 0
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self._cache_coalesced = 0
+        self._cache_evictions = 0
         self.reload()
 
-    def reload(self) -> None:
-        if not self._chunks_path.exists():
-            self._chunks = []
+    @property
+    def snapshot(self) -> "KBSnapshot":
+        return self._snapshot
+
+    @property
+    def version(self) -> str:
+        return self._snapshot.version
+
+    @property
+    def last_load(self) -> dict:
+        """How the current snapshot was built ("mmap", "delta" or "rebuild") and what it cost."""
+        return dict(self._snapshot.load_stats)
+
+    def reload(self) -> str:
+        """Build a snapshot from the files on disk, swap it in, and return its version."""
+        with self._reload_lock:
+            snapshot = KBSnapshot.load(
+                self._chunks_path,
+                self._index_path,
+                self._vectors_path,
+                self._delta_path,
+                pruning=self._pruning,
+            )
+            with self._cache_lock:
+                self._snapshot = snapshot
+                self._cache.clear()
+                self._inflight.clear()
+                self._cache_generation += 1
+            self.last_reload_error = ""
+        return snapshot.version
+
+    def reload_in_background(self) -> bool:
+        """Start a reload on a worker thread; False if one is already running."""
+        with self._cache_lock:
+            if self._reload_thread is not None and self._reload_thread.is_alive():
+                return False
+            self._reload_thread = Thread(target=self._reload_quietly, name="kb-reload", daemon=True)
+            self._reload_thread.start()
+        return True
+
+    def needs_reload(self) -> bool:
+        """True when the chunks JSON or a generated artifact changed since the current snapshot."""
+        return self._file_stamps() != self._snapshot.file_stamps
+
+    def start_auto_reload(self, interval: float = 5.0) -> None:
+        """Poll the KB files every interval seconds and hot-reload when they change."""
+        if self._watch_thread is not None and self._watch_thread.is_alive():
             return
+        self._watch_stop.clear()
+        self._watch_thread = Thread(target=self._watch, args=(interval,), name="kb-watch", daemon=True)
+        self._watch_thread.start()
+
+    def stop_auto_reload(self) -> None:
+        self._watch_stop.set()
+        if self._watch_thread is not None:
+            self._watch_thread.join()
+            self._watch_thread = None
 
-        payload = json.loads(self._chunks_path.read_text())
-        raw_chunks = payload.get("chunks", [])
-        self._chunks = [SourceChunk(**chunk) for chunk in raw_chunks]
+    def cache_stats(self) -> dict[str, int]:
+        with self._cache_lock:
+            return {
+                "hits": self._cache_hits,
+                "misses": self._cache_misses,
+                "coalesced": self._cache_coalesced,
+                "evictions": self._cache_evictions,
+                "size": len(self._cache),
+                "capacity": self._cache_size,
+            }
 
     def retrieve(
         self,
         query: str,
         top_k: int = 5,
         flow_id: str = "",
-        include_ucsd: bool = False,
+        school: str = "",
+        fragments: int = 0,
+        mode: Optional[str] = None,
     ) -> list[Citation]:
-        if not self._chunks:
+        """Return up to top_k citations, one per source.
+
+        Only the global (USCIS) partition and the partition of school (a school id as
+        resolved by SchoolResolver; "" for none) are searched, so the cost of a query
+        does not grow with the number of schools in the knowledge base.
+
+        With fragments > 0 each citation also carries up to that many non-overlapping
+        snippet windows with the query-term hits highlighted. mode overrides the
+        knowledge base default: "lexical" (BM25), "dense" (hashed-embedding cosine,
+        flow_id ignored) or "hybrid" (both fused).
+        """
+        mode = mode or self._mode
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {mode!r}; expected one of {RETRIEVAL_MODES}.")
+        if not self._snapshot.doc_count:
             return []
 
-        query_tokens = self._tokenize(query)
+        query_tokens = _tokenize(query)
         if not query_tokens:
             return []
 
-        scored: list[tuple[float, SourceChunk]] = []
-        for chunk in self._chunks:
-            if chunk.source_type == "ucsd_iseo" and not include_ucsd:
+        query_key = frozenset(query_tokens) if mode == "lexical" else " ".join(query.lower().split())
+        key: CacheKey = (query_key, flow_id, school, top_k, fragments, mode)
+        return self._through_cache(
+            key,
+            lambda snapshot: snapshot.retrieve(query, query_tokens, top_k, flow_id, school, fragments, mode),
+        )
+
+    def _through_cache(self, key: CacheKey, compute: Callable[["KBSnapshot"], list[Citation]]) -> list[Citation]:
+        """The cached citations for key, else compute(snapshot) cached (single-flight) for that snapshot."""
+        with self._cache_lock:
+            # Read together with the generation so a result is only cached for the
+            # snapshot that produced it.
+            snapshot = self._snapshot
+            generation = self._cache_generation
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self._cache_hits += 1
+                return list(cached)
+
+            pending = self._inflight.get(key)
+            is_owner = pending is None
+            if is_owner:
+                pending = Future()
+                self._inflight[key] = pending
+                self._cache_misses += 1
+            else:
+                self._cache_coalesced += 1
+
+        if not is_owner:
+            return list(pending.result())
+
+        try:
+            citations = compute(snapshot)
+        except BaseException as exc:
+            with self._cache_lock:
+                if self._inflight.get(key) is pending:
+                    del self._inflight[key]
+            pending.set_exception(exc)
+            raise
+
+        with self._cache_lock:
+            if self._inflight.get(key) is pending:
+                del self._inflight[key]
+            if generation == self._cache_generation and self._cache_size:
+                self._cache[key] = citations
+                if len(self._cache) > self._cache_size:
+                    self._cache.popitem(last=False)
+                    self._cache_evictions += 1
+        pending.set_result(citations)
+        return list(citations)
+
+    def retrieve_batch(
+        self,
+        queries: list[str],
+        flow_ids: Optional[list[str]] = None,
+        schools: Optional[list[str]] = None,
+        top_k: int = 5,
+    ) -> list[list[Citation]]:
+        """Lexical retrieval for many queries at once; same results as calling retrieve per query."""
+        return self._snapshot.retrieve_batch(queries, flow_ids, schools, top_k)
+
+    @property
+    def mode(self) -> str:
+        return self._mode
+
+    def stable_scores(self, text: str, flow_id: str = "", school: str = "") -> "StableScores":
+        """Score the part of a query that stays fixed across calls, for retrieve_incremental."""
+        return self._snapshot.stable_scores(_tokenize(text), flow_id, school)
+
+    def retrieve_incremental(
+        self,
+        stable_text: str,
+        delta_text: str,
+        stable_scores: Callable[[], "StableScores"],
+        top_k: int = 5,
+        flow_id: str = "",
+        school: str = "",
+        fragments: int = 0,
+    ) -> list[Citation]:
+        """Lexical retrieve() of stable_text + delta_text, through the same result cache.
+
+        On a miss, only the delta's postings are scored, on top of stable_scores(): the
+        stable_scores() of stable_text, flow_id and school, usually kept by the caller
+        across calls. Stable scores from another snapshot (a reload since) are not
+        used; the query is then scored in full.
+        """
+        if not self._snapshot.doc_count:
+            return []
+        stable_tokens = _tokenize(stable_text)
+        delta_tokens = _tokenize(delta_text)
+        if not stable_tokens | delta_tokens:
+            return []
+
+        def compute(snapshot: KBSnapshot) -> list[Citation]:
+            stable = stable_scores()
+            if stable.snapshot is snapshot:
+                return snapshot.retrieve_incremental(stable, delta_tokens, top_k, fragments)
+            query = f"{stable_text} {delta_text}"
+            return snapshot.retrieve(query, stable_tokens | delta_tokens, top_k, flow_id, school, fragments, "lexical")
+
+        key: CacheKey = (frozenset(stable_tokens | delta_tokens), flow_id, school, top_k, fragments, "lexical")
+        return self._through_cache(key, compute)
+
+    def _file_stamps(self) -> tuple[tuple[int, int], ...]:
+        return tuple(
+            _source_stamp(path) for path in (self._chunks_path, self._index_path, self._vectors_path, self._delta_path)
+        )
+
+    def _reload_quietly(self) -> None:
+        try:
+            self.reload()
+        except Exception as exc:  # noqa: BLE001 - keep serving the current snapshot
+            self.last_reload_error = f"{type(exc).__name__}: {exc}"
+
+    def _watch(self, interval: float) -> None:
+        while not self._watch_stop.wait(interval):
+            if self.needs_reload():
+                self._reload_quietly()
+
+
+class StableScores:
+    """BM25 scores (flow boost included) of a query's stable tokens, ranked once.
+
+    retrieve_incremental adds a delta query's postings on top: only chunks the delta
+    touches are rescored and merged back into the precomputed order.
+    """
+
+    def __init__(
+        self,
+        snapshot: "KBSnapshot",
+        tokens: frozenset[str],
+        flow_id: str,
+        school: str,
+        scores: dict[int, float],
+    ) -> None:
+        self.snapshot = snapshot
+        self.tokens = tokens
+        self.flow_id = flow_id
+        self.school = school
+        self.scores = scores
+        self.order = sorted(scores, key=lambda doc_index: (-scores[doc_index], doc_index))
+        # Negated, so bisect can find the prefix of order at or above a score.
+        self.negated_scores = [-scores[doc_index] for doc_index in self.order]
+        self._thresholds: dict[int, float] = {}
+
+    @property
+    def kb_version(self) -> str:
+        return self.snapshot.version
+
+    def threshold(self, top_k: int) -> float:
+        """Stable score of the top_k-th distinct source, or -inf if there are fewer.
+
+        Delta terms only add to scores, so the full query's top-k threshold is at least this.
+        """
+        cached = self._thresholds.get(top_k)
+        if cached is None:
+            cached = -math.inf
+            chunk_sources = self.snapshot.chunk_sources
+            seen: set[int] = set()
+            for doc_index in self.order:
+                seen.add(chunk_sources[doc_index])
+                if len(seen) >= top_k:
+                    cached = self.scores[doc_index]
+                    break
+            self._thresholds[top_k] = cached
+        return cached
+
+
+class KBSnapshot:
+    """One immutable version of the knowledge base plus the retrieval logic over it."""
+
+    def __init__(
+        self,
+        index: KBIndex,
+        vectors: Optional[VectorIndex] = None,
+        pruning: bool = True,
+        file_stamps: tuple[tuple[int, int], ...] = (),
+        load_stats: Optional[dict] = None,
+    ) -> None:
+        self._index = index
+        # Built lazily from the index on the first dense query when no matching file exists.
+        self._vectors = vectors
+        self._vectors_lock = Lock()
+        self._pruning = pruning
+        self.file_stamps = file_stamps
+        self.load_stats = load_stats or {}
+        # Identifies the chunks JSON the snapshot was built from, stable across restarts.
+        chunks_stamp = file_stamps[0] if file_stamps else (0, 0)
+        self.version = f"{zlib.crc32(f'{index.doc_count}:{chunks_stamp[0]}:{chunks_stamp[1]}'.encode()):08x}"
+
+    @classmethod
+    def load(
+        cls,
+        chunks_path: Path,
+        index_path: Path,
+        vectors_path: Path,
+        delta_path: Optional[Path] = None,
+        pruning: bool = True,
+    ) -> "KBSnapshot":
+        """Map the binary index when it matches the chunks JSONL, else apply a delta to it, else build one in memory.
+
+        The delta path costs what changed plus an in-memory index build from term
+        offsets already in the base; the rebuild path parses and tokenizes everything.
+        """
+        started = time.perf_counter()
+        # Stamped before reading, so a write racing the load shows up as a change next poll.
+        paths = (chunks_path, index_path, vectors_path) + ((delta_path,) if delta_path else ())
+        file_stamps = tuple(_source_stamp(path) for path in paths)
+
+        base: Optional[KBIndex] = None
+        if index_path.exists():
+            try:
+                base = KBIndex.open(index_path)
+            except (OSError, ValueError):
+                base = None
+        file_vectors: Optional[VectorIndex] = None
+        if vectors_path.exists():
+            try:
+                file_vectors = VectorIndex.load(vectors_path)
+            except (OSError, ValueError, KeyError):
+                file_vectors = None
+        base_vectors = file_vectors
+        if base is None or (
+            base_vectors is not None
+            and (
+                base_vectors.doc_count != base.doc_count
+                or (base_vectors.source_size, base_vectors.source_mtime_ns) != (base.source_size, base.source_mtime_ns)
+            )
+        ):
+            base_vectors = None
+
+        load_stats: dict = {"kind": "rebuild"}
+        index: Optional[KBIndex] = None
+        vectors: Optional[VectorIndex] = None
+        if base is not None and (not chunks_path.exists() or base.is_built_from(chunks_path)):
+            index, vectors = base, base_vectors
+            load_stats = {"kind": "mmap"}
+        elif base is not None and delta_path is not None and delta_path.exists():
+            try:
+                delta = KBDelta.read(delta_path)
+            except (OSError, ValueError):
+                delta = None
+            if delta is not None and delta.applies_to(base, chunks_path):
+                index, vectors = delta.apply(base, base_vectors)
+                load_stats = {"kind": "delta", "added": len(delta.added), "removed": len(delta.removed)}
+
+        if index is None:
+            raw_chunks: list[dict] = []
+            if chunks_path.exists():
+                raw_chunks = [SourceChunk(**chunk).model_dump() for chunk in iter_records(chunks_path)]
+            index = KBIndex.from_chunks(raw_chunks)
+            if (
+                file_vectors is not None
+                and file_vectors.doc_count == index.doc_count
+                and chunks_path.exists()
+                and file_vectors.is_built_from(chunks_path)
+            ):
+                vectors = file_vectors
+
+        load_stats["chunks"] = index.doc_count
+        load_stats["ms"] = round((time.perf_counter() - started) * 1000, 3)
+        return cls(index, vectors, pruning=pruning, file_stamps=file_stamps, load_stats=load_stats)
+
+    @property
+    def doc_count(self) -> int:
+        return self._index.doc_count
+
+    @property
+    def chunk_sources(self):
+        return self._index.chunk_sources
+
+    def retrieve(
+        self,
+        query: str,
+        query_tokens: set[str],
+        top_k: int,
+        flow_id: str,
+        school: str,
+        fragments: int = 0,
+        mode: str = "lexical",
+    ) -> list[Citation]:
+        ranges = self._index.partition_ranges(school)
+        # Pruning needs top_k distinct sources to form a threshold; with fewer it cannot skip anything.
+        eligible_sources = self._index.partition_source_count(school)
+        if mode != "lexical":
+            ranked = self._top_k_dense(query, query_tokens, top_k, flow_id, ranges, hybrid=mode == "hybrid")
+        elif self._pruning and eligible_sources > top_k:
+            ranked = self._top_k_pruned(query_tokens, top_k, flow_id, ranges)
+        else:
+            ranked = self._top_k_exhaustive(query_tokens, top_k, flow_id, ranges)
+
+        return self._build_citations(ranked, self._term_indexes(query_tokens), fragments)
+
+    def rank_all(
+        self,
+        query: str,
+        query_tokens: set[str],
+        flow_id: str = "",
+        school: str = "",
+        source_type: str = "",
+        mode: str = "lexical",
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Every matching chunk of the searched partitions, best first, as (chunk indexes, scores).
+
+        Unlike retrieve(), chunks of one source are not collapsed and flow_id filters
+        instead of boosting. Lexical scores are accumulated with NumPy over the query
+        terms' posting slices, so a broad query costs one vectorized pass per term.
+        Ties keep chunk order.
+        """
+        index = self._index
+        ranges = index.partition_ranges(school)
+        if mode == "lexical":
+            chunk_indexes, scores = self._lexical_score_arrays(query_tokens, ranges)
+        else:
+            chunk_indexes, scores = self._dense_scores(query, query_tokens, "", ranges, hybrid=mode == "hybrid")
+
+        keep = np.ones(len(chunk_indexes), dtype=bool)
+        if flow_id:
+            flow_index = index.flow_ids.get(flow_id)
+            if flow_index is None:
+                keep[:] = False
+            else:
+                flow_docs = np.frombuffer(index.flow_docs, dtype=np.uint32)
+                keep &= np.isin(chunk_indexes, flow_docs[index.flow_ptr[flow_index] : index.flow_ptr[flow_index + 1]])
+        if source_type:
+            type_id = index.source_type_id(source_type)
+            if type_id is None:
+                keep[:] = False
+            else:
+                keep &= np.frombuffer(index.chunk_types, dtype=np.uint32)[chunk_indexes] == type_id
+
+        chunk_indexes, scores = chunk_indexes[keep], scores[keep]
+        order = np.argsort(-scores, kind="stable")
+        return chunk_indexes[order], scores[order]
+
+    def search_hits(self, chunk_indexes: list[int], scores: list[float], query_tokens: set[str]) -> list[SearchHit]:
+        """Hits for one page of a rank_all() result; chunk text is only decoded here."""
+        index = self._index
+        term_indexes = self._term_indexes(query_tokens)
+        return [
+            SearchHit(
+                chunk_id=index.chunk_id(doc_index),
+                source_id=index.chunk_source(doc_index),
+                title=index.chunk_title(doc_index),
+                url=index.chunk_url(doc_index),
+                source_type=index.chunk_type(doc_index),
+                school_id=index.chunk_school(doc_index),
+                score=round(score, 6),
+                snippet=self._snippet_fragments(doc_index, term_indexes)[0],
+            )
+            for doc_index, score in zip(chunk_indexes, scores)
+        ]
+
+    def stable_scores(self, tokens: set[str], flow_id: str, school: str) -> StableScores:
+        scores = self._bm25_scores(tokens, self._index.partition_ranges(school))
+        self._apply_flow_boost(scores, flow_id)
+        return StableScores(self, frozenset(tokens), flow_id, school, scores)
+
+    def retrieve_incremental(
+        self,
+        stable: StableScores,
+        delta_tokens: set[str],
+        top_k: int,
+        fragments: int = 0,
+    ) -> list[Citation]:
+        """Same ranking as the exhaustive path over stable + delta tokens, at the cost of the delta.
+
+        Query terms are a set, so the full score of a chunk is its stable score plus the
+        impacts of the delta terms the stable part lacks. Delta terms are visited rarest
+        first (by upper bound), MaxScore style: once the ones left cannot lift a chunk
+        the stable part did not rank over the stable top-k threshold, the rest are only
+        probed for chunks still within reach. Untouched chunks keep their precomputed
+        stable rank and are merged back in order instead of being re-sorted.
+        """
+        if top_k <= 0:
+            return []
+
+        index = self._index
+        base = stable.scores
+        term_indexes = self._term_indexes(stable.tokens | delta_tokens)
+        bounds = {term: index.upper_bound(term) for term in delta_tokens - stable.tokens if term in index.term_ids}
+        terms = sorted(bounds, key=bounds.__getitem__, reverse=True)
+        remaining_bound = sum(bounds.values())
+        new_chunk_boost = FLOW_BOOST if stable.flow_id else 0.0
+        threshold = stable.threshold(top_k)
+        ranges = index.partition_ranges(stable.school)
+
+        touched: dict[int, float] = {}
+        position = 0
+        while position < len(terms) and remaining_bound + new_chunk_boost >= threshold - PRUNE_EPSILON:
+            term = terms[position]
+            position += 1
+            for doc_ids, impacts in index.partition_postings(term, ranges):
+                for doc_index, impact in zip(doc_ids, impacts):
+                    touched[doc_index] = touched.get(doc_index, 0.0) + impact
+            remaining_bound -= bounds[term]
+
+        flow_docs = index.flow_docs_set(stable.flow_id) if stable.flow_id and touched else frozenset()
+        for doc_index in touched:
+            if doc_index in base:
+                touched[doc_index] += base[doc_index]
+            elif doc_index in flow_docs:
+                # Newly matched chunks get the flow boost the stable scores already carry.
+                touched[doc_index] += FLOW_BOOST
+
+        changed = sorted((-score, doc_index) for doc_index, score in touched.items())
+        unchanged = ((-base[doc_index], doc_index) for doc_index in stable.order if doc_index not in touched)
+        leaders = self._first_per_source(heapq.merge(changed, unchanged), top_k)
+        if position == len(terms):
+            return self._build_citations([doc_index for _, doc_index in leaders], term_indexes, fragments)
+
+        # Leaders' partial scores only grow, so the k-th of them is a valid threshold too.
+        if len(leaders) >= top_k:
+            threshold = max(threshold, -leaders[-1][0])
+        cutoff = threshold - remaining_bound - PRUNE_EPSILON
+        scores = {doc_index: score for doc_index, score in touched.items() if score >= cutoff}
+        for doc_index in stable.order[: bisect_right(stable.negated_scores, -cutoff)]:
+            if doc_index not in touched:
+                scores[doc_index] = base[doc_index]
+
+        next_check = remaining_bound / 2
+        for term in terms[position:]:
+            doc_ids, impacts = index.postings(term)
+            if len(doc_ids) <= 4 * len(scores):
+                for doc_index, impact in zip(doc_ids, impacts):
+                    if doc_index in scores:
+                        scores[doc_index] += impact
+            else:
+                for doc_index in scores:
+                    slot = bisect_left(doc_ids, doc_index)
+                    if slot < len(doc_ids) and doc_ids[slot] == doc_index:
+                        scores[doc_index] += impacts[slot]
+            remaining_bound -= bounds[term]
+
+            if remaining_bound <= next_check and len(scores) > top_k:
+                next_check = remaining_bound / 2
+                threshold = max(threshold, self._source_threshold(scores, top_k))
+                scores = {
+                    doc_index: score
+                    for doc_index, score in scores.items()
+                    if score + remaining_bound >= threshold - PRUNE_EPSILON
+                }
+        return self._build_citations(self._select_per_source(scores, top_k), term_indexes, fragments)
+
+    def _first_per_source(self, ranked_pairs, top_k: int) -> list[tuple[float, int]]:
+        """First top_k (negated score, chunk) pairs of distinct sources from an ordered stream."""
+        chunk_sources = self._index.chunk_sources
+        leaders: list[tuple[float, int]] = []
+        seen: set[int] = set()
+        for pair in ranked_pairs:
+            source_id = chunk_sources[pair[1]]
+            if source_id in seen:
                 continue
-            score = self._score(query_tokens, chunk.text)
-            if flow_id and flow_id in chunk.flows:
-                score += 1.3
-            if score > 0:
-                scored.append((score, chunk))
+            leaders.append(pair)
+            seen.add(source_id)
+            if len(leaders) >= top_k:
+                break
+        return leaders
 
-        scored.sort(key=lambda item: item[0], reverse=True)
+    def retrieve_batch(
+        self,
+        queries: list[str],
+        flow_ids: Optional[list[str]] = None,
+        schools: Optional[list[str]] = None,
+        top_k: int = 5,
+    ) -> list[list[Citation]]:
+        """Retrieve citations for many queries at once; same results as calling retrieve per query.
 
-        citations: list[Citation] = []
-        seen: set[str] = set()
-        for score, chunk in scored:
-            if chunk.source_id in seen:
+        Each block of queries is scored as one sparse (query x term) @ (term x chunk)
+        product. The index postings already are the term x chunk matrix in CSR form
+        (term_ptr / post_docs / post_impacts), viewed zero-copy as NumPy arrays.
+        The cache is bypassed: batch jobs rarely repeat queries.
+        """
+        count = len(queries)
+        flow_ids = list(flow_ids) if flow_ids is not None else [""] * count
+        schools = list(schools) if schools is not None else [""] * count
+        if len(flow_ids) != count or len(schools) != count:
+            raise ValueError("flow_ids and schools must match the number of queries.")
+
+        results: list[list[Citation]] = [[] for _ in range(count)]
+        index = self._index
+        doc_count = index.doc_count
+        if not doc_count or top_k <= 0:
+            return results
+
+        post_docs = np.frombuffer(index.post_docs, dtype=np.uint32).astype(np.int64)
+        post_impacts = np.frombuffer(index.post_impacts, dtype=np.float64)
+        block_size = max(1, BATCH_SCORE_CELLS // doc_count)
+
+        for block_start in range(0, count, block_size):
+            block = range(block_start, min(count, block_start + block_size))
+            token_sets = [_tokenize(queries[query_index]) for query_index in block]
+            term_maps = [self._term_indexes(tokens) for tokens in token_sets]
+
+            # One run of posting slots per (query, term, searched partition).
+            rows: list[int] = []
+            run_starts: list[int] = []
+            run_ends: list[int] = []
+            for row, (query_index, term_map) in enumerate(zip(block, term_maps)):
+                ranges = index.partition_ranges(schools[query_index])
+                for term_index in term_map:
+                    for low, high in index.partition_slots(term_index, ranges):
+                        rows.append(row)
+                        run_starts.append(low)
+                        run_ends.append(high)
+            if not rows:
                 continue
-            snippet = self._best_snippet(chunk.text, query_tokens)
+
+            # Expand the runs into individual posting slots.
+            starts = np.asarray(run_starts, dtype=np.int64)
+            lengths = np.asarray(run_ends, dtype=np.int64) - starts
+            total = int(lengths.sum())
+            run_offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(total)
+            cells = np.repeat(np.asarray(rows, dtype=np.int64), lengths) * doc_count + post_docs[run_offsets]
+            scores = np.bincount(
+                cells,
+                weights=post_impacts[run_offsets],
+                minlength=len(block) * doc_count,
+            ).reshape(len(block), doc_count)
+
+            matched = scores > 0
+
+            block_flows = [flow_ids[query_index] for query_index in block]
+            for flow_id in set(block_flows):
+                flow_docs = sorted(index.flow_docs_set(flow_id)) if flow_id else []
+                if not flow_docs:
+                    continue
+                flow_rows = [row for row, row_flow in enumerate(block_flows) if row_flow == flow_id]
+                grid = np.ix_(flow_rows, flow_docs)
+                scores[grid] += FLOW_BOOST * matched[grid]
+
+            for row, query_index in enumerate(block):
+                candidates = np.flatnonzero(matched[row])
+                ranked = self._rank_candidates(candidates, scores[row, candidates], top_k)
+                if ranked:
+                    results[query_index] = self._build_citations(ranked, term_maps[row], fragments=0)
+
+        return results
+
+    def _term_indexes(self, query_tokens: set[str]) -> dict[int, int]:
+        """Query tokens present in the index, as term index -> term length."""
+        term_ids = self._index.term_ids
+        return {term_ids[term]: len(term) for term in query_tokens if term in term_ids}
+
+    def _build_citations(self, ranked: list[int], term_indexes: dict[int, int], fragments: int) -> list[Citation]:
+        index = self._index
+        citations: list[Citation] = []
+        for doc_index in ranked:
+            windows = self._snippet_fragments(doc_index, term_indexes, count=max(1, fragments))
             citations.append(
                 Citation(
-                    source_id=chunk.source_id,
-                    title=chunk.title,
-                    url=chunk.url,
-                    snippet=snippet,
+                    source_id=index.chunk_source(doc_index),
+                    title=index.chunk_title(doc_index),
+                    url=index.chunk_url(doc_index),
+                    snippet=windows[0].text,
+                    fragments=windows if fragments > 0 else [],
+                    kb_version=self.version,
                 )
             )
-            seen.add(chunk.source_id)
-            if len(citations) >= top_k:
+        return citations
+
+    def _top_k_exhaustive(
+        self,
+        query_tokens: set[str],
+        top_k: int,
+        flow_id: str,
+        ranges: list[tuple[int, int]],
+    ) -> list[int]:
+        """Score every matching chunk, sort, then keep the best chunk per source."""
+        scores = self._bm25_scores(query_tokens, ranges)
+        self._apply_flow_boost(scores, flow_id)
+
+        scored = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+        chunk_sources = self._index.chunk_sources
+        ranked: list[int] = []
+        seen: set[int] = set()
+        for doc_index, _ in scored:
+            source_id = chunk_sources[doc_index]
+            if source_id in seen:
+                continue
+            ranked.append(doc_index)
+            seen.add(source_id)
+            if len(ranked) >= top_k:
                 break
+        return ranked
 
-        return citations
+    def _top_k_pruned(
+        self,
+        query_tokens: set[str],
+        top_k: int,
+        flow_id: str,
+        ranges: list[tuple[int, int]],
+    ) -> list[int]:
+        """Term-at-a-time MaxScore: score rare terms fully, then only finish live candidates.
 
-    @staticmethod
-    def _tokenize(text: str) -> set[str]:
-        return {tok.lower() for tok in TOKEN_RE.findall(text)}
-
-    def _score(self, query_tokens: set[str], text: str) -> float:
-        text_tokens = self._tokenize(text)
-        overlap = len(query_tokens.intersection(text_tokens))
-        if overlap == 0:
-            return 0.0
-
-        long_terms_bonus = sum(1 for token in query_tokens if len(token) > 7 and token in text_tokens)
-        return float(overlap + (0.5 * long_terms_bonus))
-
-    def _best_snippet(self, text: str, query_tokens: set[str], width: int = 260) -> str:
-        lowered = text.lower()
-        hit_index = -1
-        for token in sorted(query_tokens, key=len, reverse=True):
-            idx = lowered.find(token)
-            if idx != -1:
-                hit_index = idx
+        Terms are visited by descending BM25 upper bound. Once the summed bound of the
+        terms not yet visited cannot lift an unseen chunk over the current top-k
+        threshold, no new chunk can enter the result: the remaining (common, long)
+        postings are only probed for the surviving candidates, and candidates whose
+        bound drops below the threshold are discarded along the way.
+        """
+        if top_k <= 0:
+            return []
+
+        index = self._index
+        bounds = {term: index.upper_bound(term) for term in query_tokens if term in index.term_ids}
+        terms = sorted(bounds, key=bounds.__getitem__, reverse=True)
+        remaining_bound = sum(bounds.values())
+        boost_bound = FLOW_BOOST if flow_id else 0.0
+
+        scores: dict[int, float] = {}
+        threshold = -math.inf
+        # Chunks at or above the last full threshold. Their partial scores only grow, so a
+        # threshold taken over them alone stays a valid lower bound and is cheap to refresh.
+        leaders: list[int] = []
+        next_check = remaining_bound / 2
+        position = 0
+        while position < len(terms):
+            term = terms[position]
+            position += 1
+            for doc_ids, impacts in index.partition_postings(term, ranges):
+                for doc_index, impact in zip(doc_ids, impacts):
+                    scores[doc_index] = scores.get(doc_index, 0.0) + impact
+            remaining_bound -= bounds[term]
+            if position >= len(terms):
+                break
+
+            if leaders:
+                threshold = self._source_threshold({doc: scores[doc] for doc in leaders}, top_k)
+            elif remaining_bound <= next_check:
+                next_check = remaining_bound / 2
+                threshold = self._source_threshold(scores, top_k)
+                if threshold > -math.inf:
+                    leaders = [doc for doc, score in scores.items() if score >= threshold]
+            if remaining_bound + boost_bound < threshold - PRUNE_EPSILON:
+                break
+
+        self._apply_flow_boost(scores, flow_id)
+        if position < len(terms):
+            threshold = self._source_threshold(scores, top_k)
+            scores = {
+                doc_index: score
+                for doc_index, score in scores.items()
+                if score + remaining_bound >= threshold - PRUNE_EPSILON
+            }
+
+        # Continue phase: finish scoring surviving candidates without visiting new chunks.
+        for term in terms[position:]:
+            doc_ids, impacts = index.postings(term)
+            if len(doc_ids) <= 4 * len(scores):
+                for doc_index, impact in zip(doc_ids, impacts):
+                    if doc_index in scores:
+                        scores[doc_index] += impact
+            else:
+                for doc_index in scores:
+                    slot = bisect_left(doc_ids, doc_index)
+                    if slot < len(doc_ids) and doc_ids[slot] == doc_index:
+                        scores[doc_index] += impacts[slot]
+            remaining_bound -= bounds[term]
+
+            if remaining_bound <= next_check and len(scores) > top_k:
+                next_check = remaining_bound / 2
+                threshold = max(threshold, self._source_threshold(scores, top_k))
+                scores = {
+                    doc_index: score
+                    for doc_index, score in scores.items()
+                    if score + remaining_bound >= threshold - PRUNE_EPSILON
+                }
+
+        return self._select_per_source(scores, top_k)
+
+    def _top_k_dense(
+        self,
+        query: str,
+        query_tokens: set[str],
+        top_k: int,
+        flow_id: str,
+        ranges: list[tuple[int, int]],
+        hybrid: bool,
+    ) -> list[int]:
+        """Brute-force cosine top-k over the searched chunk ranges, optionally fused with BM25."""
+        return self._rank_candidates(*self._dense_scores(query, query_tokens, flow_id, ranges, hybrid), top_k)
+
+    def _dense_scores(
+        self,
+        query: str,
+        query_tokens: set[str],
+        flow_id: str,
+        ranges: list[tuple[int, int]],
+        hybrid: bool,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """(ascending chunk indexes, scores) of the chunks with a positive dense or hybrid score.
+
+        Hybrid mode needs every lexical score to normalize against, so it scores
+        exhaustively instead of taking the pruned lexical path.
+        """
+        chunk_indexes, similarities = self._vector_index().range_similarities(query, ranges)
+        candidates = similarities > 0
+        scores = np.clip(similarities, 0.0, None).astype(np.float64)
+
+        if hybrid:
+            lexical = self._bm25_scores(query_tokens, ranges)
+            self._apply_flow_boost(lexical, flow_id)
+            lexical_scores = np.zeros(len(chunk_indexes), dtype=np.float64)
+            if lexical:
+                lexical_scores[np.searchsorted(chunk_indexes, list(lexical))] = list(lexical.values())
+                lexical_scores /= lexical_scores.max()
+            scores = HYBRID_DENSE_WEIGHT * scores + (1 - HYBRID_DENSE_WEIGHT) * lexical_scores
+            candidates |= lexical_scores > 0
+
+        return chunk_indexes[candidates], scores[candidates]
+
+    def _vector_index(self) -> VectorIndex:
+        vectors = self._vectors
+        if vectors is None:
+            with self._vectors_lock:
+                vectors = self._vectors
+                if vectors is None:
+                    vectors = VectorIndex.from_texts(index_embedding_texts(self._index))
+                    self._vectors = vectors
+        return vectors
+
+    def _rank_candidates(self, chunk_indexes: np.ndarray, scores: np.ndarray, top_k: int) -> list[int]:
+        """Best chunk of each of the top_k sources among ascending candidate chunks and their scores."""
+        if not chunk_indexes.size or top_k <= 0:
+            return []
+        # Stable sort keeps ties in chunk order, like the exhaustive path.
+        ordered = chunk_indexes[np.argsort(-scores, kind="stable")]
+        chunk_sources = self._index.chunk_sources
+        ranked: list[int] = []
+        seen: set[int] = set()
+        for doc_index in ordered.tolist():
+            source_id = chunk_sources[doc_index]
+            if source_id in seen:
+                continue
+            ranked.append(doc_index)
+            seen.add(source_id)
+            if len(ranked) >= top_k:
                 break
+        return ranked
 
-        if hit_index == -1:
-            return " ".join(text.split())[:width]
+    def _apply_flow_boost(self, scores: dict[int, float], flow_id: str) -> None:
+        if not flow_id:
+            return
+        flow_docs = self._index.flow_docs_set(flow_id)
+        if not flow_docs:
+            return
+        for doc_index in scores:
+            if doc_index in flow_docs:
+                scores[doc_index] += FLOW_BOOST
+
+    def _source_threshold(self, scores: dict[int, float], top_k: int) -> float:
+        """Lowest score among the best top_k distinct sources, or -inf if there are fewer."""
+        best_by_source: dict[int, float] = {}
+        doc_sources = self._index.chunk_sources
+        for doc_index, score in scores.items():
+            source_id = doc_sources[doc_index]
+            if score > best_by_source.get(source_id, -math.inf):
+                best_by_source[source_id] = score
+        if len(best_by_source) < top_k:
+            return -math.inf
+        return heapq.nlargest(top_k, best_by_source.values())[-1]
 
-        start = max(0, hit_index - width // 3)
+    def _select_per_source(self, scores: dict[int, float], top_k: int) -> list[int]:
+        """Bounded min-heap selection of the best chunk for each of the top_k sources.
+
+        Ties break towards the lower chunk index, matching a stable descending sort.
+        """
+        if top_k <= 0:
+            return []
+
+        doc_sources = self._index.chunk_sources
+        selected: list[tuple[float, int, int]] = []
+        best_by_source: dict[int, tuple[float, int]] = {}
+        for doc_index, score in scores.items():
+            rank_key = (score, -doc_index)
+            source_id = doc_sources[doc_index]
+            current = best_by_source.get(source_id)
+            if current is not None:
+                if rank_key <= current:
+                    continue
+                for slot, entry in enumerate(selected):
+                    if entry[2] == source_id:
+                        selected[slot] = (score, -doc_index, source_id)
+                        break
+                heapq.heapify(selected)
+            elif len(selected) < top_k:
+                heapq.heappush(selected, (score, -doc_index, source_id))
+            elif rank_key > selected[0][:2]:
+                evicted = heapq.heapreplace(selected, (score, -doc_index, source_id))
+                del best_by_source[evicted[2]]
+            else:
+                continue
+            best_by_source[source_id] = rank_key
+
+        selected.sort(reverse=True)
+        return [-entry[1] for entry in selected]
+
+    def _bm25_scores(self, query_tokens: set[str], ranges: list[tuple[int, int]]) -> dict[int, float]:
+        """Accumulate BM25 scores over each query term's postings inside the searched ranges."""
+        scores: dict[int, float] = {}
+        index = self._index
+        for term in query_tokens:
+            for doc_ids, impacts in index.partition_postings(term, ranges):
+                for doc_index, impact in zip(doc_ids, impacts):
+                    scores[doc_index] = scores.get(doc_index, 0.0) + impact
+        return scores
+
+    def _lexical_score_arrays(
+        self,
+        query_tokens: set[str],
+        ranges: list[tuple[int, int]],
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """(ascending chunk indexes, BM25 scores) of every chunk matching a query term in the ranges."""
+        index = self._index
+        post_docs = np.frombuffer(index.post_docs, dtype=np.uint32)
+        post_impacts = np.frombuffer(index.post_impacts, dtype=np.float64)
+        scores = np.zeros(index.doc_count, dtype=np.float64)
+        matched = np.zeros(index.doc_count, dtype=bool)
+        for term_index in self._term_indexes(query_tokens):
+            for low, high in index.partition_slots(term_index, ranges):
+                # A chunk appears at most once per term, so fancy-index += does not drop updates.
+                docs = post_docs[low:high]
+                scores[docs] += post_impacts[low:high]
+                matched[docs] = True
+        chunk_indexes = np.flatnonzero(matched)
+        return chunk_indexes, scores[chunk_indexes]
+
+    def _snippet_fragments(
+        self,
+        doc_index: int,
+        term_indexes: dict[int, int],
+        count: int = 1,
+        width: int = 260,
+    ) -> list[CitationFragment]:
+        """Pick up to count non-overlapping windows around the densest query-term hits.
+
+        Hits come from the index-time positional postings, so only whole tokens match
+        ("opt" does not hit "adopted") and the chunk text is never rescanned; it is
+        only decoded here, once the chunk has made it into the result.
+        """
+        index = self._index
+        text = index.chunk_text(doc_index)
+        hits = index.term_hits(doc_index, term_indexes)
+        if not hits:
+            end = self._snap_end(text, 0, min(len(text), width))
+            return [CitationFragment(text=text[:end].strip())]
+
+        fragments: list[CitationFragment] = []
+        while hits and len(fragments) < count:
+            first, last = self._densest_cluster(hits, width)
+            start, end = self._center_window(text, hits[first][0], hits[last][1], width)
+            window_hits = [hit for hit in hits if hit[0] >= start and hit[1] <= end]
+            fragments.append(
+                CitationFragment(
+                    text=text[start:end],
+                    highlights=[(hit_start - start, hit_end - start) for hit_start, hit_end in window_hits],
+                )
+            )
+            hits = [hit for hit in hits if hit[1] <= start or hit[0] >= end]
+        return fragments
+
+    @staticmethod
+    def _densest_cluster(hits: list[tuple[int, int]], width: int) -> tuple[int, int]:
+        """Two-pointer sweep for the widest run of hits that fits in one window."""
+        best_first, best_last = 0, 0
+        first = 0
+        for last in range(len(hits)):
+            while hits[last][1] - hits[first][0] > width:
+                first += 1
+            if last - first > best_last - best_first:
+                best_first, best_last = first, last
+        return best_first, best_last
+
+    def _center_window(self, text: str, span_start: int, span_end: int, width: int) -> tuple[int, int]:
+        slack = max(0, width - (span_end - span_start))
+        start = max(0, span_start - slack // 2)
         end = min(len(text), start + width)
-        return " ".join(text[start:end].split())
+        start = max(0, min(start, end - width))
+
+        # Snap to word boundaries without cutting into the hit span.
+        if start > 0 and text[start - 1] != " ":
+            boundary = text.find(" ", start, span_start)
+            start = boundary + 1 if boundary != -1 else span_start
+        return start, self._snap_end(text, span_end, end)
+
+    @staticmethod
+    def _snap_end(text: str, floor: int, end: int) -> int:
+        if end < len(text) and text[end] != " ":
+            boundary = text.rfind(" ", floor, end)
+            end = boundary if boundary != -1 else max(floor, end)
+        return end
+
+
+def _tokenize(text: str) -> set[str]:
+    return {tok.lower() for tok in TOKEN_RE.findall(text)}
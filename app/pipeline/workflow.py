@@ -1,6 +1,19 @@
 from __future__ import annotations
 
-from app.models import CaseGraph, StepStatus, WorkflowStep
+from typing import TYPE_CHECKING
+
+from app.models import StepStatus
+
+if TYPE_CHECKING:
+    from app.pipeline.flow_packs import FlowTemplate
+
+
+# A session's step state is one byte per step of its flow template, in template order:
+# the step's status code, plus MANUAL when the user marked it complete.
+PENDING, COMPLETE, BLOCKED = 0, 1, 2
+STATUS_MASK = 3
+MANUAL = 4
+STEP_STATUSES = (StepStatus.pending, StepStatus.complete, StepStatus.blocked)
 
 
 def compute_missing_items(required_fields: list[str], field_values: dict[str, str]) -> list[str]:
@@ -12,46 +25,40 @@ def compute_missing_items(required_fields: list[str], field_values: dict[str, st
     return missing
 
 
-def refresh_workflow_step_statuses(workflow: list[WorkflowStep], field_values: dict[str, str]) -> None:
-    step_map = {step.step_id: step for step in workflow}
-
+def refresh_workflow_step_statuses(
+    template: FlowTemplate,
+    step_state: bytearray,
+    field_values: dict[str, str],
+) -> None:
     # Flow packs are authored in dependency order for this MVP.
-    for step in workflow:
-        deps_satisfied = all(
-            step_map[dep].status == StepStatus.complete
-            for dep in step.dependencies
-            if dep in step_map
-        )
-        if not deps_satisfied:
-            step.status = StepStatus.blocked
+    for index, dependencies in enumerate(template.dependency_indexes):
+        manual = step_state[index] & MANUAL
+        if any(step_state[dep] & STATUS_MASK != COMPLETE for dep in dependencies):
+            step_state[index] = BLOCKED | manual
             continue
 
-        if step.manually_completed:
-            step.status = StepStatus.complete
+        if manual:
+            step_state[index] = COMPLETE | manual
             continue
 
-        if not step.required_fields:
-            if step.status == StepStatus.blocked:
-                step.status = StepStatus.pending
+        required_fields = template.steps[index].required_fields
+        if not required_fields:
+            if step_state[index] & STATUS_MASK == BLOCKED:
+                step_state[index] = PENDING
             continue
 
         has_required_values = all(
             str(field_values.get(field, "")).strip()
-            for field in step.required_fields
+            for field in required_fields
         )
-        step.status = StepStatus.complete if has_required_values else StepStatus.pending
+        step_state[index] = COMPLETE if has_required_values else PENDING
 
 
-def sync_graph_from_workflow(case_graph: CaseGraph, workflow: list[WorkflowStep]) -> None:
-    status_map = {step.step_id: step.status for step in workflow}
-    for node in case_graph.nodes:
-        if node.node_id in status_map:
-            node.status = status_map[node.node_id]
+def mark_step(template: FlowTemplate, step_state: bytearray, step_id: str, complete: bool) -> None:
+    index = template.step_index.get(step_id)
+    if index is not None:
+        step_state[index] = COMPLETE | MANUAL if complete else PENDING
 
 
-def mark_step(workflow: list[WorkflowStep], step_id: str, complete: bool) -> None:
-    for step in workflow:
-        if step.step_id == step_id:
-            step.manually_completed = complete
-            step.status = StepStatus.complete if complete else StepStatus.pending
-            break
+def completed_step_count(step_state: bytearray) -> int:
+    return sum(1 for value in step_state if value & STATUS_MASK == COMPLETE)
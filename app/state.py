@@ -4,32 +4,32 @@ from datetime import datetime
 from threading import Lock
 from typing import Optional
 
-from app.models import SessionState
+from app.pipeline.session import Session
 
 
 class SessionStore:
     """Thread-safe in-memory store for hackathon MVP sessions."""
 
     def __init__(self) -> None:
-        self._sessions: dict[str, SessionState] = {}
+        self._sessions: dict[str, Session] = {}
         self._lock = Lock()
 
-    def create(self, session: SessionState) -> SessionState:
+    def create(self, session: Session) -> Session:
         with self._lock:
             self._sessions[session.session_id] = session
         return session
 
-    def get(self, session_id: str) -> Optional[SessionState]:
+    def get(self, session_id: str) -> Optional[Session]:
         with self._lock:
             return self._sessions.get(session_id)
 
-    def save(self, session: SessionState) -> SessionState:
+    def save(self, session: Session) -> Session:
         session.updated_at = datetime.utcnow()
         with self._lock:
             self._sessions[session.session_id] = session
         return session
 
-    def list_all(self) -> list[SessionState]:
+    def list_all(self) -> list[Session]:
         with self._lock:
             return list(self._sessions.values())
 
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""Throughput and tail latency of the HTTP API under concurrent sessions.
+
+Each configuration is served by its own uvicorn process. Every simulated user
+starts a session and then sends a stream of events, micro-check answers and KB
+searches, each waiting for the previous response. "baseline" serves the app as
+of --baseline-ref (default: the commit before the async API) from a temporary
+git worktree, to compare with the sync-route threadpool behavior.
+
+    python3 scripts/bench_api.py --configs baseline thread process --users 32
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+# Parent of the commit that made the API async ("Serve the API async ..."): sync routes
+# on Starlette's threadpool.
+SYNC_API_REF = "d18131a^"
+
+SCENARIOS_PATH = ROOT / "data" / "scenarios" / "demo_cases.json"
+SEARCH_QUERIES = ["OPT application timeline", "CPT employer letter", "cap gap extension", "I-765 fee", "STEM OPT"]
+FIELD_VALUES = ["f1", "enrolled", "2025-06-01", "Acme", "yes", "graduated"]
+LAUNCHER = """
+import sys
+import uvicorn
+import app.main as main
+mode, workers, port = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+if mode != "baseline":
+    main.configure_executor(mode, workers=workers)
+uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+"""
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load-test the API in each executor mode.")
+    parser.add_argument(
+        "--configs",
+        nargs="+",
+        default=["baseline", "thread", "process"],
+        choices=["baseline", "inline", "thread", "process"],
+    )
+    parser.add_argument("--baseline-ref", default=SYNC_API_REF, help="Git ref served for the baseline config.")
+    parser.add_argument("--users", type=int, nargs="+", default=[8, 32])
+    parser.add_argument("--requests", type=int, default=30, help="Requests per user after session start.")
+    parser.add_argument("--workers", type=int, default=4, help="Executor threads or processes.")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    scenarios = json.loads(SCENARIOS_PATH.read_text())["scenarios"]
+    print(f"{'config':<9} {'users':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6}")
+    for config in args.configs:
+        app_dir = ROOT
+        worktree = None
+        if config == "baseline":
+            worktree = Path(tempfile.mkdtemp(prefix="visaflow-baseline-"))
+            subprocess.run(
+                ["git", "worktree", "add", "--detach", str(worktree), args.baseline_ref],
+                cwd=ROOT,
+                check=True,
+                capture_output=True,
+            )
+            app_dir = worktree
+        try:
+            for users in args.users:
+                with serve(app_dir, config, args.workers) as base_url:
+                    result = asyncio.run(run_load(base_url, users, args.requests, scenarios, args.seed))
+                print(
+                    f"{config:<9} {users:>5} {result['throughput']:>8.1f} {result['p50']:>8.1f} "
+                    f"{result['p95']:>8.1f} {result['p99']:>8.1f} {result['errors']:>6}"
+                )
+        finally:
+            if worktree is not None:
+                subprocess.run(["git", "worktree", "remove", "--force", str(worktree)], cwd=ROOT, capture_output=True)
+                shutil.rmtree(worktree, ignore_errors=True)
+
+
+class serve:
+    """Context manager running the app from app_dir in a uvicorn subprocess."""
+
+    def __init__(self, app_dir: Path, mode: str, workers: int) -> None:
+        self._app_dir = app_dir
+        self._mode = mode
+        self._workers = workers
+        self._process: subprocess.Popen | None = None
+
+    def __enter__(self) -> str:
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+        self._process = subprocess.Popen(
+            [sys.executable, "-c", LAUNCHER, self._mode, str(self._workers), str(port)],
+            cwd=self._app_dir,
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            try:
+                if httpx.get(f"{base_url}/api/health", timeout=1).status_code == 200:
+                    return base_url
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError(f"server for {self._mode} did not start")
+
+    def __exit__(self, *exc_info: object) -> None:
+        if self._process is not None:
+            self._process.terminate()
+            self._process.wait(timeout=30)
+
+
+async def run_load(base_url: str, users: int, requests: int, scenarios: list[dict], seed: int) -> dict:
+    latencies: list[float] = []
+    errors = 0
+
+    async def timed(client: httpx.AsyncClient, method: str, url: str, **kwargs) -> httpx.Response | None:
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            errors += 1
+            return None
+        latencies.append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            errors += 1
+        return response
+
+    async def user(client: httpx.AsyncClient, index: int) -> None:
+        rng = random.Random(seed + index)
+        scenario = scenarios[index % len(scenarios)]
+        response = await timed(
+            client,
+            "POST",
+            "/api/session/start",
+            json={"intent": scenario["intent"], "initial_fields": scenario.get("initial_fields", {})},
+        )
+        if response is None or response.status_code != 200:
+            return
+        session = response.json()["session"]
+        session_id = session["session_id"]
+        for _ in range(requests):
+            kind = rng.random()
+            if kind < 0.55:
+                field = rng.choice(session["required_entities"] or ["status_type"])
+                payload = {"event_type": "field_update", "payload": {"field": field, "value": rng.choice(FIELD_VALUES)}}
+                response = await timed(client, "POST", f"/api/session/{session_id}/event", json=payload)
+            elif kind < 0.75:
+                step = rng.choice(session["workflow"])["step_id"] if session["workflow"] else ""
+                payload = {"event_type": rng.choice(["mark_step", "unmark_step"]), "payload": {"step_id": step}}
+                response = await timed(client, "POST", f"/api/session/{session_id}/event", json=payload)
+            elif kind < 0.85:
+                check = rng.choice(session["available_micro_checks"])
+                payload = {"check_id": check["check_id"], "selected_option": rng.choice(check["options"])}
+                response = await timed(client, "POST", f"/api/session/{session_id}/micro-check", json=payload)
+            else:
+                await timed(client, "GET", "/api/search", params={"q": rng.choice(SEARCH_QUERIES)})
+                continue
+            if response is not None and response.status_code == 200:
+                session = response.json()["session"]
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=httpx.Limits(max_connections=users)) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(user(client, index) for index in range(users)))
+        wall = time.perf_counter() - started
+
+    ordered = sorted(latencies) or [0.0]
+    return {
+        "throughput": len(latencies) / wall if wall else 0.0,
+        "p50": statistics.median(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "p99": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+        "errors": errors,
+    }
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""CPU, allocation and memory cost of engine events, now and at earlier commits.
+
+Each tree runs in its own process (earlier refs from a temporary git worktree) and
+replays the same seeded sessions and events through PipelineEngine:
+
+- event us: mean wall time of apply_event / apply_micro_check
+- response us: mean time to turn the session into its response JSON
+- alloc KiB: mean tracemalloc peak above the starting point during one event
+- session KiB: memory still held per live session once all events ran
+
+By default the working tree is compared with the last one whose engine ran on the
+pydantic SessionState.
+
+    python3 scripts/bench_engine.py --sessions 200 --events 20
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+# Parent of the commit that moved the engine onto slotted Session dataclasses.
+PYDANTIC_SESSION_REF = "95ad703^"
+
+FIELD_VALUES = ["", "f1", "enrolled", "2025-06-01", "UCSD", "Acme", "yes", "graduated"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark engine events in this tree and at earlier refs.")
+    parser.add_argument("--refs", nargs="*", default=[PYDANTIC_SESSION_REF], help="Git refs to compare against.")
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--events", type=int, default=20, help="Events per session.")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run(args.sessions, args.events, args.seed)))
+        return
+
+    print(f"{'tree':<12} {'event us':>9} {'response us':>12} {'alloc KiB':>10} {'session KiB':>12}")
+    for ref in [*args.refs, "working"]:
+        result = measure(ref, args)
+        print(
+            f"{ref:<12} {result['event_us']:>9.1f} {result['response_us']:>12.1f} "
+            f"{result['alloc_kib']:>10.1f} {result['session_kib']:>12.1f}"
+        )
+
+
+def measure(ref: str, args: argparse.Namespace) -> dict:
+    command = [
+        sys.executable,
+        str(Path(__file__).resolve()),
+        "--worker",
+        "--sessions",
+        str(args.sessions),
+        "--events",
+        str(args.events),
+        "--seed",
+        str(args.seed),
+    ]
+    if ref == "working":
+        return json.loads(subprocess.run(command, cwd=ROOT, check=True, capture_output=True, text=True).stdout)
+
+    worktree = Path(tempfile.mkdtemp(prefix="visaflow-bench-"))
+    try:
+        subprocess.run(
+            ["git", "worktree", "add", "--detach", str(worktree), ref],
+            cwd=ROOT,
+            check=True,
+            capture_output=True,
+        )
+        output = subprocess.run(command, cwd=worktree, check=True, capture_output=True, text=True).stdout
+        return json.loads(output)
+    finally:
+        subprocess.run(["git", "worktree", "remove", "--force", str(worktree)], cwd=ROOT, capture_output=True)
+        shutil.rmtree(worktree, ignore_errors=True)
+
+
+def run(sessions: int, events: int, seed: int) -> dict:
+    # Imported here so the worker picks up the tree it runs in (its cwd).
+    sys.path.insert(0, str(Path.cwd()))
+    from app.models import EventRequest, InterfaceMode, MicroCheckRequest, StartSessionRequest
+    from app.pipeline.engine import PipelineEngine
+
+    engine = PipelineEngine()
+    scenarios = json.loads((Path.cwd() / "data" / "scenarios" / "demo_cases.json").read_text())["scenarios"]
+    flows = [pack.flow_id for pack in engine.flow_store.list()]
+
+    def response_json(session) -> str:
+        # Earlier trees keep the pydantic SessionState itself.
+        model = session.to_model() if hasattr(session, "to_model") else session
+        return model.model_dump_json()
+
+    def next_action(rng: random.Random, session):
+        kind = rng.choice(["field", "field", "field", "mark", "unmark", "mode", "help", "flow", "check"])
+        if kind == "check":
+            check = rng.choice(session.available_micro_checks)
+            request = MicroCheckRequest(check_id=check.check_id, selected_option=rng.choice(check.options))
+            return lambda: engine.apply_micro_check(session, request)
+        if kind == "field":
+            field_name = rng.choice(session.required_entities + ["school_name"])
+            event = EventRequest(
+                event_type="field_update",
+                payload={"field": field_name, "value": rng.choice(FIELD_VALUES)},
+            )
+        elif kind in ("mark", "unmark"):
+            step_id = rng.choice(session.workflow).step_id if session.workflow else ""
+            event_type = "mark_step" if kind == "mark" else "unmark_step"
+            event = EventRequest(event_type=event_type, payload={"step_id": step_id})
+        elif kind == "mode":
+            mode = rng.choice([item.value for item in InterfaceMode])
+            event = EventRequest(event_type="mode_change", payload={"mode": mode})
+        elif kind == "flow":
+            event = EventRequest(event_type="select_flow", payload={"flow_id": rng.choice(flows)})
+        else:
+            event = EventRequest(event_type="ask_help", payload={})
+        return lambda: engine.apply_event(session, event)
+
+    def replay(measure_alloc: bool) -> tuple[list, float, float, float]:
+        rng = random.Random(seed)
+        live = []
+        event_seconds = response_seconds = alloc_bytes = 0.0
+        for index in range(sessions):
+            scenario = scenarios[index % len(scenarios)]
+            request = StartSessionRequest(intent=scenario["intent"], initial_fields=scenario.get("initial_fields", {}))
+            session, _, _ = engine.start_session(request)
+            for _ in range(events):
+                action = next_action(rng, session)
+                if measure_alloc:
+                    start = tracemalloc.get_traced_memory()[0]
+                    tracemalloc.reset_peak()
+                    action()
+                    alloc_bytes += tracemalloc.get_traced_memory()[1] - start
+                    continue
+                started = time.perf_counter()
+                action()
+                event_seconds += time.perf_counter() - started
+                started = time.perf_counter()
+                response_json(session)
+                response_seconds += time.perf_counter() - started
+            live.append(session)
+        return live, event_seconds, response_seconds, alloc_bytes
+
+    total = sessions * events
+    replay(measure_alloc=False)  # warm caches
+    _, event_seconds, response_seconds, _ = replay(measure_alloc=False)
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    live, _, _, alloc_bytes = replay(measure_alloc=True)
+    # Per-session debug traces and retrieval scores are bounded engine caches, not session state.
+    for cache in (getattr(engine, "_refresh_traces", None), getattr(engine, "_stable_scores", None)):
+        if cache is not None:
+            cache.clear()
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del live
+
+    return {
+        "event_us": event_seconds / total * 1e6,
+        "response_us": response_seconds / total * 1e6,
+        "alloc_kib": alloc_bytes / total / 1024,
+        "session_kib": retained / sessions / 1024,
+    }
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from app.pipeline.kb_index import iter_records  # noqa: E402
+from app.pipeline.uscis_knowledge import TOKEN_RE, USCISKnowledgeBase  # noqa: E402
+
+
+CHUNKS_PATH = ROOT / "data" / "knowledge_chunks.jsonl"
+FLOWS = ["cpt_prep", "opt_initial_prep", "opt_stem_prep", "cap_gap_transition_prep", "f1_work_basics"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare KB retrieval strategies.")
+    parser.add_argument(
+        "--mode",
+        choices=["pruning", "batch", "schools"],
+        default="pruning",
+        help=(
+            "pruning: exhaustive vs pruned retrieve(); batch: retrieve() loop vs retrieve_batch(); "
+            "schools: latency as school partitions are added"
+        ),
+    )
+    parser.add_argument("--replicas", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--schools", type=int, nargs="+", default=[1, 10, 100, 500])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--intent-chars", type=int, nargs="+", default=[200, 1000, 5000])
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    chunks = list(iter_records(CHUNKS_PATH))
+    words = [tok for chunk in chunks for tok in TOKEN_RE.findall(chunk["text"])]
+
+    if args.mode == "batch":
+        run_batch_comparison(args, chunks, words)
+        return
+    if args.mode == "schools":
+        run_school_scaling(args, chunks, words)
+        return
+
+    print(f"{'replicas':>8} {'chunks':>7} {'intent':>7} {'exhaustive ms':>14} {'pruned ms':>10} {'speedup':>8}")
+    for replicas in args.replicas:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "chunks.json"
+            path.write_text(json.dumps({"chunks": replicate_chunks(chunks, replicas)}))
+            exhaustive = USCISKnowledgeBase(str(path), cache_size=0, pruning=False)
+            pruned = USCISKnowledgeBase(str(path), cache_size=0, pruning=True)
+
+            for intent_chars in args.intent_chars:
+                rng = random.Random(args.seed)
+                queries = [
+                    (synthetic_intent(rng, words, intent_chars), rng.choice(FLOWS))
+                    for _ in range(args.queries)
+                ]
+                exhaustive_ms = time_queries(exhaustive, queries)
+                pruned_ms = time_queries(pruned, queries)
+                print(
+                    f"{replicas:>8} {len(chunks) * replicas:>7} {intent_chars:>7} "
+                    f"{exhaustive_ms:>14.3f} {pruned_ms:>10.3f} {exhaustive_ms / pruned_ms:>7.2f}x"
+                )
+
+
+def run_batch_comparison(args: argparse.Namespace, chunks: list[dict], words: list[str]) -> None:
+    print(f"{'replicas':>8} {'chunks':>7} {'intent':>7} {'loop q/s':>10} {'batch q/s':>10} {'speedup':>8}")
+    for replicas in args.replicas:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "chunks.json"
+            path.write_text(json.dumps({"chunks": replicate_chunks(chunks, replicas)}))
+            kb = USCISKnowledgeBase(str(path), cache_size=0)
+
+            for intent_chars in args.intent_chars:
+                rng = random.Random(args.seed)
+                queries = [synthetic_intent(rng, words, intent_chars) for _ in range(args.queries)]
+                flow_ids = [rng.choice(FLOWS) for _ in queries]
+                schools = [rng.choice(["", "ucsd"]) for _ in queries]
+
+                started = time.perf_counter()
+                for query, flow_id, school in zip(queries, flow_ids, schools):
+                    kb.retrieve(query=query, top_k=5, flow_id=flow_id, school=school)
+                loop_qps = len(queries) / (time.perf_counter() - started)
+
+                started = time.perf_counter()
+                kb.retrieve_batch(queries, flow_ids, schools, top_k=5)
+                batch_qps = len(queries) / (time.perf_counter() - started)
+
+                print(
+                    f"{replicas:>8} {len(chunks) * replicas:>7} {intent_chars:>7} "
+                    f"{loop_qps:>10.0f} {batch_qps:>10.0f} {batch_qps / loop_qps:>7.2f}x"
+                )
+
+
+def run_school_scaling(args: argparse.Namespace, chunks: list[dict], words: list[str]) -> None:
+    """Add synthetic schools (copies of the school chunks under new partitions) and time UCSD queries."""
+    school_chunks = [chunk for chunk in chunks if chunk.get("school_id")]
+    print(f"{'schools':>8} {'chunks':>7} {'intent':>7} {'mean ms':>8}")
+    for schools in args.schools:
+        corpus = list(chunks)
+        for school in range(1, schools):
+            corpus.extend(
+                {
+                    **chunk,
+                    "chunk_id": f"{chunk['chunk_id']}~s{school}",
+                    "source_id": f"{chunk['source_id']}~s{school}",
+                    "school_id": f"school-{school}",
+                }
+                for chunk in school_chunks
+            )
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "chunks.json"
+            path.write_text(json.dumps({"chunks": corpus}))
+            kb = USCISKnowledgeBase(str(path), cache_size=0)
+            for intent_chars in args.intent_chars:
+                rng = random.Random(args.seed)
+                queries = [
+                    (synthetic_intent(rng, words, intent_chars), rng.choice(FLOWS))
+                    for _ in range(args.queries)
+                ]
+                print(f"{schools:>8} {len(corpus):>7} {intent_chars:>7} {time_queries(kb, queries, school='ucsd'):>8.3f}")
+
+
+def replicate_chunks(chunks: list[dict], replicas: int, seed: int = 11) -> list[dict]:
+    """Scale the corpus with distinct sources per replica.
+
+    Replicas drop a random 20% of words so they do not tie exactly with the original,
+    which would not happen in a real corpus of that size.
+    """
+    rng = random.Random(seed)
+    replicated: list[dict] = []
+    for replica in range(replicas):
+        for chunk in chunks:
+            if not replica:
+                replicated.append(chunk)
+                continue
+            suffix = f"~r{replica}"
+            words = [word for word in chunk["text"].split() if rng.random() >= 0.2]
+            replicated.append(
+                {
+                    **chunk,
+                    "chunk_id": f"{chunk['chunk_id']}{suffix}",
+                    "source_id": f"{chunk['source_id']}{suffix}",
+                    "text": " ".join(words),
+                }
+            )
+    return replicated
+
+
+def synthetic_intent(rng: random.Random, words: list[str], length: int) -> str:
+    parts: list[str] = []
+    size = 0
+    while size < length:
+        word = rng.choice(words)
+        parts.append(word)
+        size += len(word) + 1
+    return " ".join(parts)[:length]
+
+
+def time_queries(kb: USCISKnowledgeBase, queries: list[tuple[str, str]], school: str = "") -> float:
+    timings: list[float] = []
+    for query, flow_id in queries:
+        started = time.perf_counter()
+        kb.retrieve(query=query, top_k=5, flow_id=flow_id, school=school)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.mean(timings)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,105 +1,384 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
+import argparse
+import filecmp
+import hashlib
 import json
+import os
 import re
+import sys
+import time
+from contextlib import ExitStack, contextmanager
 from datetime import datetime, timezone
 from pathlib import Path
+from typing import Iterable, Iterator, Optional, TextIO
 
-import requests
 from bs4 import BeautifulSoup
 
 
 ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from app.pipeline.kb_delta import DELTA_COMPACT_RATIO, write_delta  # noqa: E402
+from app.pipeline.kb_index import KBIndex, build_index, iter_records, write_index  # noqa: E402
+from app.pipeline.kb_vectors import index_embedding_texts, write_vectors  # noqa: E402
+from kb_chunker import (  # noqa: E402
+    CHUNK_MAX_TOKENS,
+    CHUNK_MIN_TOKENS,
+    CHUNK_OVERLAP_TOKENS,
+    CHUNKER_VERSION,
+    chunk_document,
+)
+from kb_dedup import DEDUP_THRESHOLD, NearDuplicates, merge_flows  # noqa: E402
+from kb_fetch import (  # noqa: E402
+    FETCH_WORKERS,
+    PER_HOST_CONCURRENCY,
+    PER_HOST_INTERVAL_SECONDS,
+    FetchResult,
+    SourceFetcher,
+    timing_report,
+)
+
+
 SOURCES_PATH = ROOT / "app" / "data" / "source_map.json"
-OUTPUT_PATH = ROOT / "data" / "knowledge_chunks.json"
-RAW_OUTPUT_PATH = ROOT / "data" / "knowledge_raw.json"
+OUTPUT_PATH = ROOT / "data" / "knowledge_chunks.jsonl"
+RAW_OUTPUT_PATH = ROOT / "data" / "knowledge_raw.jsonl"
+INDEX_OUTPUT_PATH = OUTPUT_PATH.with_suffix(".bin")
+VECTORS_OUTPUT_PATH = OUTPUT_PATH.with_suffix(".vectors.npz")
+DELTA_OUTPUT_PATH = OUTPUT_PATH.with_suffix(".delta.jsonl")
+MANIFEST_PATH = ROOT / "data" / "knowledge_manifest.json"
+MANIFEST_VERSION = 1
+RAW_CACHE_DIR = ROOT / "data" / "raw_cache"
+# Per-document chunks before near-duplicate elimination, kept with the raw cache so
+# unchanged documents are not re-chunked.
+DOCUMENT_CHUNKS_NAME = "document_chunks.jsonl"
 
 WHITESPACE_RE = re.compile(r"\s+")
+BLOCK_BREAK_RE = re.compile(r"\n\s*\n")
+BLOCK_TAGS = ["h1", "h2", "h3", "h4", "h5", "h6", "p", "li", "dt", "dd", "tr", "blockquote", "pre", "section"]
 
 
 def main() -> None:
-    payload = json.loads(SOURCES_PATH.read_text())
-    sources = payload.get("sources", [])
+    parser = argparse.ArgumentParser(description="Fetch sources and build the USCIS knowledge base.")
+    parser.add_argument(
+        "--index-only",
+        action="store_true",
+        help="Rebuild the binary index and vectors from the existing chunks JSONL without fetching.",
+    )
+    parser.add_argument(
+        "--rechunk",
+        action="store_true",
+        help="Re-chunk the saved raw documents without fetching (e.g. after changing the token budget).",
+    )
+    parser.add_argument("--sources", type=Path, default=SOURCES_PATH, help="Source map to fetch.")
+    parser.add_argument("--cache-dir", type=Path, default=RAW_CACHE_DIR, help="On-disk raw HTML cache.")
+    parser.add_argument("--workers", type=int, default=FETCH_WORKERS)
+    parser.add_argument("--per-host", type=int, default=PER_HOST_CONCURRENCY, help="Max requests in flight per host.")
+    parser.add_argument(
+        "--host-interval",
+        type=float,
+        default=PER_HOST_INTERVAL_SECONDS,
+        help="Min seconds between request starts to one host.",
+    )
+    parser.add_argument("--no-conditional", action="store_true", help="Ignore cached validators; refetch everything.")
+    parser.add_argument("--fetch-only", action="store_true", help="Fetch and report timings without writing the KB.")
+    parser.add_argument("--max-tokens", type=int, default=CHUNK_MAX_TOKENS, help="Token budget per chunk.")
+    parser.add_argument("--overlap-tokens", type=int, default=CHUNK_OVERLAP_TOKENS)
+    parser.add_argument("--min-tokens", type=int, default=CHUNK_MIN_TOKENS, help="Smallest chunk a heading may close.")
+    parser.add_argument(
+        "--dedup-threshold",
+        type=float,
+        default=DEDUP_THRESHOLD,
+        help="Estimated Jaccard similarity of token shingles at which chunks count as near-duplicates.",
+    )
+    parser.add_argument("--no-dedup", action="store_true", help="Keep near-duplicate chunks.")
+    parser.add_argument(
+        "--dedup-report",
+        action="store_true",
+        help="Also report binary index size before and after near-duplicate elimination.",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Re-chunk every document instead of only those whose hash changed since the manifest.",
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Rewrite the binary index and vectors even when a delta would do.",
+    )
+    args = parser.parse_args()
+
+    if args.index_only:
+        chunks = list(iter_records(OUTPUT_PATH))
+        write_artifacts(chunks)
+        DELTA_OUTPUT_PATH.unlink(missing_ok=True)
+        print(f"Wrote binary index for {len(chunks)} chunks to {INDEX_OUTPUT_PATH}")
+        print(f"Wrote chunk vectors to {VECTORS_OUTPUT_PATH}")
+        return
 
-    raw_documents = []
-    chunks = []
+    if args.rechunk:
+        document_count, chunk_count = write_kb(iter_records(RAW_OUTPUT_PATH), args, raw_path=None)
+    else:
+        sources = json.loads(args.sources.read_text()).get("sources", [])
+        fetcher = SourceFetcher(
+            args.cache_dir,
+            workers=args.workers,
+            per_host=args.per_host,
+            host_interval=args.host_interval,
+            conditional=not args.no_conditional,
+        )
+        print(f"Fetching {len(sources)} sources with {args.workers} workers ({args.per_host} per host)")
+        started = time.perf_counter()
+        results: list[FetchResult] = []
+        fetched = fetcher.iter_fetch([source["url"] for source in sources])
+        if args.fetch_only:
+            results.extend(fetched)
+        else:
+            document_count, chunk_count = write_kb(source_documents(sources, fetched, results), args, RAW_OUTPUT_PATH)
+        print(timing_report([source["id"] for source in sources], results, time.perf_counter() - started))
+        if args.fetch_only:
+            return
+
+    print(f"Wrote {document_count} documents to {RAW_OUTPUT_PATH}")
+    print(f"Wrote {chunk_count} chunks to {OUTPUT_PATH}")
 
-    for source in sources:
-        source_id = source["id"]
-        title = source["title"]
-        url = source["url"]
-        source_type = source.get("source_type", "external")
-        flows = source.get("flows", [])
 
-        print(f"Fetching {source_id}: {url}")
-        text = fetch_page_text(url)
+def source_documents(sources: list[dict], fetched: Iterator[FetchResult], results: list[FetchResult]) -> Iterator[dict]:
+    """Raw documents for the sources as their pages arrive; fetch results are appended to results."""
+    for source, result in zip(sources, fetched):
+        results.append(result)
+        text = page_text(source["url"], result.body, result.content_type) if result.body else ""
+        # Only the timings are reported at the end; do not keep every page alive until then.
+        result.body = ""
         if not text:
-            print("  -> skipped (empty text)")
+            print(f"Skipped {source['id']} (empty text)")
             continue
+        yield {
+            "source_id": source["id"],
+            "title": source["title"],
+            "url": source["url"],
+            "source_type": source.get("source_type", "external"),
+            "school_id": source.get("school_id", ""),
+            "flows": source.get("flows", []),
+            "fetched_at": datetime.now(timezone.utc).isoformat(),
+            "text": text,
+        }
+
+
+def write_kb(documents: Iterable[dict], args: argparse.Namespace, raw_path: Optional[Path]) -> tuple[int, int]:
+    """Stream documents into the raw and chunk JSONL files, then bring the index artifacts up to date.
+
+    Each document is chunked and written as soon as it arrives, so only one document
+    is in memory at a time. Documents whose hash matches the manifest are not
+    re-chunked: their previous chunk lines are copied through. Near-duplicates are
+    then folded across the whole corpus. Files are written to temporaries and
+    swapped in at the end.
+    """
+    params = {"max_tokens": args.max_tokens, "overlap_tokens": args.overlap_tokens, "min_tokens": args.min_tokens}
+    chunker = {**params, "version": CHUNKER_VERSION}
+    stage_path = args.cache_dir / DOCUMENT_CHUNKS_NAME
+    previous = load_manifest()
+    previous_documents = previous.get("documents", {}) if previous.get("chunker") == chunker and not args.full else {}
+    previous_lines = _chunk_lines(stage_path) if previous_documents else {}
+
+    manifest_documents: dict[str, dict] = {}
+    document_count = 0
+    changed = 0
+    stage_path.parent.mkdir(parents=True, exist_ok=True)
+    with ExitStack() as stack:
+        raw_out = stack.enter_context(_atomic_writer(raw_path)) if raw_path else None
+        stage_out = stack.enter_context(_atomic_writer(stage_path))
+        for document in documents:
+            document_count += 1
+            if raw_out is not None:
+                raw_out.write(json.dumps(document) + "\n")
+            source_id = document["source_id"]
+            digest = document_hash(document, chunker)
+            entry = previous_documents.get(source_id)
+            chunk_ids: list[str] = entry.get("chunk_ids", []) if entry else []
+            lines = [previous_lines.get(chunk_id) for chunk_id in chunk_ids]
+            if entry is None or entry.get("document_hash") != digest or None in lines:
+                changed += 1
+                chunks = list(document_chunks(document, params))
+                chunk_ids = [chunk["chunk_id"] for chunk in chunks]
+                lines = [json.dumps(chunk) + "\n" for chunk in chunks]
+            stage_out.writelines(lines)
+            manifest_documents[source_id] = {"document_hash": digest, "chunk_ids": chunk_ids}
 
-        fetched_at = datetime.now(timezone.utc).isoformat()
-        raw_documents.append(
-            {
-                "source_id": source_id,
-                "title": title,
-                "url": url,
-                "source_type": source_type,
-                "flows": flows,
-                "fetched_at": fetched_at,
-                "text": text,
-            }
+    removed = sorted(set(previous_documents) - set(manifest_documents))
+    _write_text_atomic(
+        MANIFEST_PATH,
+        json.dumps(
+            {"manifest_version": MANIFEST_VERSION, "chunker": chunker, "documents": manifest_documents},
+            indent=2,
         )
+        + "\n",
+    )
+    print(
+        f"Documents: {changed} changed, {document_count - changed} unchanged, {len(removed)} removed"
+        + (f" ({', '.join(removed)})" if removed else "")
+    )
 
-        for idx, chunk_text in enumerate(chunk_text_by_size(text, size=960, overlap=140)):
-            chunks.append(
-                {
-                    "chunk_id": f"{source_id}-{idx}",
-                    "source_id": source_id,
-                    "title": title,
-                    "url": url,
-                    "source_type": source_type,
-                    "flows": flows,
-                    "text": chunk_text,
-                }
-            )
+    threshold = None if args.no_dedup else args.dedup_threshold
+    # Left untouched (mtime included) when nothing changed, so the index still matches it.
+    before, after = dedupe_chunks(stage_path, OUTPUT_PATH, threshold)
+    print(
+        f"Near-duplicates: {before['chunks'] - after['chunks']} chunks folded; corpus "
+        f"{before['chunks']} -> {after['chunks']} chunks, {before['tokens']} -> {after['tokens']} tokens, "
+        f"{before['text_bytes'] / 1024:.1f} -> {after['text_bytes'] / 1024:.1f} KiB of text"
+    )
+    if args.dedup_report:
+        before_bytes = len(build_index(list(iter_records(stage_path))))
+        after_bytes = len(build_index(list(iter_records(OUTPUT_PATH))))
+        print(f"Binary index: {before_bytes / 1024:.1f} -> {after_bytes / 1024:.1f} KiB")
+    update_artifacts(compact=args.compact)
+    return document_count, after["chunks"]
 
-    raw_payload = {"documents": raw_documents}
-    chunk_payload = {
-        "generated_at": datetime.now(timezone.utc).isoformat(),
-        "source_count": len(raw_documents),
-        "chunk_count": len(chunks),
-        "chunks": chunks,
-    }
 
-    RAW_OUTPUT_PATH.write_text(json.dumps(raw_payload, indent=2))
-    OUTPUT_PATH.write_text(json.dumps(chunk_payload, indent=2))
+def dedupe_chunks(stage_path: Path, output_path: Path, threshold: Optional[float]) -> tuple[dict, dict]:
+    """Copy stage_path to output_path without near-duplicates; returns corpus stats (before, after).
 
-    print(f"Wrote {len(raw_documents)} documents to {RAW_OUTPUT_PATH}")
-    print(f"Wrote {len(chunks)} chunks to {OUTPUT_PATH}")
+    Two streaming passes: the first assigns each chunk to a canonical chunk, the
+    second writes the canonical chunks with the union of their group's flows. A
+    canonical chunk whose flows grow gets a new content id. threshold None keeps
+    every chunk.
+    """
+    near = NearDuplicates(threshold) if threshold is not None else None
+    group_flows: dict[int, list[list[str]]] = {}
+    before = {"chunks": 0, "tokens": 0, "text_bytes": 0}
+    for position, chunk in enumerate(iter_records(stage_path)):
+        canonical = near.add(chunk["tokens"], str(chunk.get("school_id", ""))) if near else position
+        group_flows.setdefault(canonical, []).append(chunk.get("flows", []))
+        before["chunks"] += 1
+        before["tokens"] += chunk.get("token_count", len(chunk["tokens"]))
+        before["text_bytes"] += len(chunk["text"].encode("utf-8"))
 
+    after = {"chunks": 0, "tokens": 0, "text_bytes": 0}
+    with stage_path.open(encoding="utf-8") as stage, _atomic_writer(output_path, keep_if_unchanged=True) as out:
+        for position, line in enumerate(line for line in stage if line.strip()):
+            flow_lists = group_flows.get(position)
+            if flow_lists is None:
+                continue
+            chunk = json.loads(line)
+            if len(flow_lists) > 1:
+                flows = merge_flows(flow_lists)
+                if flows != chunk.get("flows", []):
+                    chunk["flows"] = flows
+                    chunk["chunk_id"] = content_chunk_id(chunk)
+                    line = json.dumps(chunk) + "\n"
+            out.write(line)
+            after["chunks"] += 1
+            after["tokens"] += chunk.get("token_count", len(chunk["tokens"]))
+            after["text_bytes"] += len(chunk["text"].encode("utf-8"))
+    return before, after
 
-def fetch_page_text(url: str) -> str:
-    headers = {
-        "User-Agent": (
-            "VisaFlowHackathonBot/0.2 (+local demo prototype) "
-            "for educational ingestion"
-        )
-    }
 
+def document_hash(document: dict, chunker: dict) -> str:
+    """Hash of everything that determines a document's chunks: its fields (not fetched_at) and the chunker settings."""
+    content = {key: value for key, value in document.items() if key != "fetched_at"}
+    payload = json.dumps({"document": content, "chunker": chunker}, sort_keys=True)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def document_chunks(document: dict, params: dict) -> Iterator[dict]:
+    """Chunk records for one document, with content-addressed chunk ids."""
+    seen: set[str] = set()
+    for text, tokens in chunk_document(document["text"], **params):
+        chunk = {
+            "chunk_id": "",
+            "source_id": document["source_id"],
+            "title": document["title"],
+            "url": document["url"],
+            "source_type": document.get("source_type", "external"),
+            "school_id": document.get("school_id", ""),
+            "flows": document.get("flows", []),
+            "text": text,
+            "tokens": tokens,
+            "token_count": len(tokens),
+        }
+        chunk_id = content_chunk_id(chunk)
+        # Identical text twice in one document (e.g. a repeated notice) still needs distinct ids.
+        suffix = 1
+        while chunk_id in seen:
+            suffix += 1
+            chunk_id = f"{content_chunk_id(chunk)}~{suffix}"
+        seen.add(chunk_id)
+        chunk["chunk_id"] = chunk_id
+        yield chunk
+
+
+def content_chunk_id(chunk: dict) -> str:
+    """"<source_id>-<hash>" over every field the index stores, so equal ids mean equal chunks."""
+    fields = {key: chunk.get(key) for key in ("source_id", "title", "url", "source_type", "school_id", "flows", "text")}
+    digest = hashlib.blake2b(json.dumps(fields, sort_keys=True).encode("utf-8"), digest_size=6).hexdigest()
+    return f"{chunk['source_id']}-{digest}"
+
+
+def load_manifest() -> dict:
+    if not MANIFEST_PATH.exists():
+        return {}
     try:
-        response = requests.get(url, headers=headers, timeout=30)
-        response.raise_for_status()
-    except requests.RequestException as exc:
-        print(f"  -> request failed: {exc}")
-        return ""
+        manifest = json.loads(MANIFEST_PATH.read_text())
+    except ValueError:
+        return {}
+    return manifest if manifest.get("manifest_version") == MANIFEST_VERSION else {}
+
+
+def update_artifacts(compact: bool = False) -> None:
+    """Write a delta against the existing binary index, or rebuild the artifacts when that is cheaper.
+
+    The delta holds the chunks added and removed since the base was built, so the
+    running app applies it instead of re-tokenizing the whole JSONL. Once it touches
+    more than DELTA_COMPACT_RATIO of the base, the base is rewritten and the delta dropped.
+    """
+    base: Optional[KBIndex] = None
+    if not compact and INDEX_OUTPUT_PATH.exists():
+        try:
+            base = KBIndex.open(INDEX_OUTPUT_PATH)
+        except (OSError, ValueError):
+            base = None
+
+    if base is not None and base.is_built_from(OUTPUT_PATH):
+        DELTA_OUTPUT_PATH.unlink(missing_ok=True)
+        print(f"Binary index {INDEX_OUTPUT_PATH} is up to date")
+        return
 
-    content_type = response.headers.get("content-type", "")
+    if base is not None:
+        base_ids = {base.chunk_id(doc_index) for doc_index in range(base.doc_count)}
+        target_ids = {chunk["chunk_id"] for chunk in iter_records(OUTPUT_PATH)}
+        added_ids = target_ids - base_ids
+        removed_ids = base_ids - target_ids
+        if len(added_ids) + len(removed_ids) <= DELTA_COMPACT_RATIO * base.doc_count:
+            added = (chunk for chunk in iter_records(OUTPUT_PATH) if chunk["chunk_id"] in added_ids)
+            write_delta(DELTA_OUTPUT_PATH, base, removed_ids, added, OUTPUT_PATH)
+            print(
+                f"Wrote delta (+{len(added_ids)} / -{len(removed_ids)} chunks against "
+                f"{base.doc_count}) to {DELTA_OUTPUT_PATH}"
+            )
+            return
+
+    write_artifacts(list(iter_records(OUTPUT_PATH)))
+    DELTA_OUTPUT_PATH.unlink(missing_ok=True)
+    print(f"Wrote binary index to {INDEX_OUTPUT_PATH}")
+    print(f"Wrote chunk vectors to {VECTORS_OUTPUT_PATH}")
+
+
+def write_artifacts(chunks: list[dict]) -> None:
+    write_index(chunks, INDEX_OUTPUT_PATH, source_path=OUTPUT_PATH)
+    # Vectors follow the index's chunk order, which groups chunks by school partition.
+    texts = index_embedding_texts(KBIndex.open(INDEX_OUTPUT_PATH))
+    write_vectors(texts, VECTORS_OUTPUT_PATH, source_path=OUTPUT_PATH)
+
+
+def page_text(url: str, body: str, content_type: str = "") -> str:
+    """Main-content text of a fetched HTML page, or "" for sources this MVP cannot ingest."""
     if "pdf" in content_type.lower() or url.lower().endswith(".pdf"):
-        print("  -> PDF source skipped in this MVP (HTML ingestion only)")
+        print(f"  -> {url}: PDF source skipped in this MVP (HTML ingestion only)")
         return ""
 
-    soup = BeautifulSoup(response.text, "html.parser")
+    soup = BeautifulSoup(body, "html.parser")
 
     content_root = (
         soup.find("main")
@@ -113,25 +392,44 @@ def fetch_page_text(url: str) -> str:
 
     for tag in content_root(["script", "style", "noscript", "svg", "img", "footer", "nav"]):
         tag.decompose()
+    # Blank lines around block elements let the chunker respect headings and paragraphs.
+    for tag in content_root(BLOCK_TAGS):
+        tag.insert_before("\n\n")
+        tag.insert_after("\n\n")
 
-    text = content_root.get_text(" ", strip=True)
-    text = WHITESPACE_RE.sub(" ", text).strip()
+    text = content_root.get_text(" ")
+    text = "\n\n".join(
+        block for block in (WHITESPACE_RE.sub(" ", part).strip() for part in BLOCK_BREAK_RE.split(text)) if block
+    )
     return text[:26000]
 
 
-def chunk_text_by_size(text: str, size: int = 960, overlap: int = 140) -> list[str]:
-    if len(text) <= size:
-        return [text]
+def _chunk_lines(path: Path) -> dict[str, str]:
+    """chunk_id -> its JSONL line as written, for copying unchanged documents through."""
+    if not path.exists() or path.suffix != ".jsonl":
+        return {}
+    lines: dict[str, str] = {}
+    with path.open(encoding="utf-8") as handle:
+        for line in handle:
+            if line.strip():
+                lines[json.loads(line)["chunk_id"]] = line if line.endswith("\n") else line + "\n"
+    return lines
+
+
+@contextmanager
+def _atomic_writer(path: Path, keep_if_unchanged: bool = False) -> Iterator[TextIO]:
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as handle:
+        yield handle
+    if keep_if_unchanged and path.exists() and filecmp.cmp(tmp_path, path, shallow=False):
+        tmp_path.unlink()
+        return
+    os.replace(tmp_path, path)
+
 
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = min(len(text), start + size)
-        chunks.append(text[start:end])
-        if end >= len(text):
-            break
-        start = max(0, end - overlap)
-    return chunks
+def _write_text_atomic(path: Path, text: str) -> None:
+    with _atomic_writer(path) as handle:
+        handle.write(text)
 
 
 if __name__ == "__main__":
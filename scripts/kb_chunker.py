@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Sentence-aware chunking of source documents for build_uscis_kb.py.
+
+Documents are split into blocks (blank-line separated: headings, paragraphs, list
+items), blocks into sentences, and sentences are packed into chunks up to a token
+budget. Chunks never cut a word or, unless a single sentence exceeds the budget, a
+sentence. A heading starts a new chunk once the current one has some substance,
+and consecutive chunks share a tail of whole sentences for context.
+
+Token counts use the runtime index tokenizer (kb_index.TOKEN_RE), and every chunk
+carries its lowercase token list so the index build does not tokenize again.
+"""
+from __future__ import annotations
+
+import re
+import sys
+from pathlib import Path
+from typing import Iterator
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from app.pipeline.kb_index import TOKEN_RE  # noqa: E402
+
+
+# Bump when a change to the splitting rules changes the chunks of an unchanged document,
+# so build_uscis_kb.py re-chunks every document instead of reusing the manifest's.
+CHUNKER_VERSION = 2
+CHUNK_MAX_TOKENS = 140
+CHUNK_OVERLAP_TOKENS = 20
+# A heading only closes the current chunk once it holds at least this many tokens.
+CHUNK_MIN_TOKENS = 40
+HEADING_MAX_TOKENS = 12
+
+# A period ending one of these does not end the sentence ("the U.S. Department").
+SENTENCE_ABBREVIATIONS = ("U.S.", "e.g.", "i.e.", "Dr.", "Mr.", "Mrs.", "Ms.", "No.", "vs.", "St.", "Jr.")
+
+BLOCK_SPLIT_RE = re.compile(r"\n\s*\n")
+# One lookbehind per abbreviation: Python's lookbehinds must be fixed-width.
+SENTENCE_SPLIT_RE = re.compile(
+    r"(?<=[.!?])"
+    + "".join(rf"(?<!\b{re.escape(abbreviation)})" for abbreviation in SENTENCE_ABBREVIATIONS)
+    + r"[\"')\]]*\s+(?=[\"'(\[]?[A-Z0-9])"
+)
+
+
+def tokenize(text: str) -> list[str]:
+    return [token.lower() for token in TOKEN_RE.findall(text)]
+
+
+def iter_sentences(text: str, max_tokens: int = CHUNK_MAX_TOKENS) -> Iterator[tuple[str, list[str], bool]]:
+    """(sentence, tokens, is_heading) in document order; overlong sentences are split at words."""
+    for block in BLOCK_SPLIT_RE.split(text):
+        block = " ".join(block.split())
+        if not block:
+            continue
+        block_tokens = tokenize(block)
+        if len(block_tokens) <= HEADING_MAX_TOKENS and block[-1] not in ".!?:;,":
+            yield block, block_tokens, True
+            continue
+
+        for sentence in SENTENCE_SPLIT_RE.split(block):
+            tokens = tokenize(sentence)
+            if len(tokens) <= max_tokens:
+                yield sentence, tokens, False
+                continue
+            words: list[str] = []
+            window_tokens: list[str] = []
+            for word in sentence.split():
+                word_tokens = tokenize(word)
+                if words and len(window_tokens) + len(word_tokens) > max_tokens:
+                    yield " ".join(words), window_tokens, False
+                    words, window_tokens = [], []
+                words.append(word)
+                window_tokens.extend(word_tokens)
+            if words:
+                yield " ".join(words), window_tokens, False
+
+
+def chunk_document(
+    text: str,
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+    min_tokens: int = CHUNK_MIN_TOKENS,
+) -> Iterator[tuple[str, list[str]]]:
+    """Yield (chunk text, chunk tokens) one chunk at a time."""
+    current: list[tuple[str, list[str]]] = []
+    count = 0
+    for sentence, tokens, is_heading in iter_sentences(text, max_tokens):
+        if current and (count + len(tokens) > max_tokens or (is_heading and count >= min_tokens)):
+            yield _join(current)
+            # Overlap carries context within a section, not across a heading.
+            current = [] if is_heading else _overlap_tail(current, overlap_tokens, max_tokens - len(tokens))
+            count = sum(len(part_tokens) for _, part_tokens in current)
+        current.append((sentence, tokens))
+        count += len(tokens)
+    if current:
+        yield _join(current)
+
+
+def _overlap_tail(parts: list[tuple[str, list[str]]], overlap_tokens: int, room: int) -> list[tuple[str, list[str]]]:
+    """Trailing whole sentences of the previous chunk, within the overlap and the room left."""
+    tail: list[tuple[str, list[str]]] = []
+    count = 0
+    for sentence, tokens in reversed(parts):
+        if count + len(tokens) > min(overlap_tokens, room):
+            break
+        tail.insert(0, (sentence, tokens))
+        count += len(tokens)
+    return tail
+
+
+def _join(parts: list[tuple[str, list[str]]]) -> tuple[str, list[str]]:
+    return " ".join(sentence for sentence, _ in parts), [token for _, tokens in parts for token in tokens]
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Near-duplicate chunk elimination for build_uscis_kb.py.
+
+Each chunk is reduced to the set of its token shingles (runs of SHINGLE_SIZE
+index tokens) and a MinHash signature over that set. Chunks whose signatures
+share an LSH band are candidates; a candidate whose estimated Jaccard similarity
+to an earlier canonical chunk reaches the threshold is folded into it. The
+canonical chunk keeps its text and takes the union of the flows of everything
+folded into it.
+
+Chunks are only compared within a school partition: a school's chunks are never
+folded into another school's (or USCIS's), so what each school sees is unchanged.
+"""
+from __future__ import annotations
+
+import zlib
+from typing import Iterable, Optional
+
+import numpy as np
+
+
+SHINGLE_SIZE = 5
+MINHASH_PERMUTATIONS = 128
+LSH_BANDS = 32
+DEDUP_THRESHOLD = 0.8
+
+# Universal hashing h(x) = (a * x + b) mod p over 32-bit shingle hashes. a < 2**31
+# keeps a * x inside uint64.
+_PRIME = np.uint64(4294967311)
+_rng = np.random.default_rng(20240601)
+_A = _rng.integers(1, 2**31, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.integers(0, 2**32, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+
+def shingles(tokens: list[str], size: int = SHINGLE_SIZE) -> np.ndarray:
+    """Distinct 32-bit hashes of the chunk's token runs; short chunks are one shingle."""
+    if len(tokens) <= size:
+        runs = [" ".join(tokens)]
+    else:
+        runs = [" ".join(tokens[start : start + size]) for start in range(len(tokens) - size + 1)]
+    return np.unique(np.fromiter((zlib.crc32(run.encode("utf-8")) for run in runs), dtype=np.uint64, count=len(runs)))
+
+
+def minhash(shingle_hashes: np.ndarray) -> np.ndarray:
+    """MinHash signature: per permutation, the smallest hash over the shingles."""
+    if not len(shingle_hashes):
+        return np.full(MINHASH_PERMUTATIONS, int(_PRIME), dtype=np.uint64)
+    hashed = (np.outer(_A, shingle_hashes) + _B[:, None]) % _PRIME
+    return hashed.min(axis=1)
+
+
+class NearDuplicates:
+    """Assigns each chunk, in order, to itself or to an earlier canonical near-duplicate."""
+
+    def __init__(self, threshold: float = DEDUP_THRESHOLD, bands: int = LSH_BANDS) -> None:
+        self._threshold = threshold
+        self._bands = bands
+        self._rows = MINHASH_PERMUTATIONS // bands
+        self._buckets: dict[tuple, list[int]] = {}
+        self._signatures: list[np.ndarray] = []
+        self.canonical: list[int] = []
+
+    def add(self, tokens: list[str], partition: str = "") -> int:
+        """Record the next chunk; returns the position of its canonical chunk (its own when unique)."""
+        position = len(self._signatures)
+        signature = minhash(shingles(tokens))
+        self._signatures.append(signature)
+
+        keys = [
+            (partition, band, signature[band * self._rows : (band + 1) * self._rows].tobytes())
+            for band in range(self._bands)
+        ]
+        best: Optional[int] = None
+        best_similarity = self._threshold
+        candidates = {other for key in keys for other in self._buckets.get(key, ())}
+        for other in sorted(candidates):
+            similarity = float(np.mean(self._signatures[other] == signature))
+            if similarity >= best_similarity and (best is None or similarity > best_similarity):
+                best, best_similarity = other, similarity
+
+        if best is not None:
+            self.canonical.append(best)
+            return best
+        # Only canonical chunks are bucketed, so a chain of near-duplicates cannot drift.
+        for key in keys:
+            self._buckets.setdefault(key, []).append(position)
+        self.canonical.append(position)
+        return position
+
+
+def merge_flows(flow_lists: Iterable[list[str]]) -> list[str]:
+    """Union of flow lists, in order of first appearance."""
+    merged: list[str] = []
+    for flows in flow_lists:
+        for flow in flows:
+            if flow not in merged:
+                merged.append(flow)
+    return merged
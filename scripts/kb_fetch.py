@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""Concurrent, conditional source fetching for build_uscis_kb.py.
+
+Sources are fetched on a bounded thread pool. Each host gets at most per_host
+requests in flight and a minimum gap between request starts, so adding sources
+from one site does not hammer it. Responses are cached on disk keyed by URL with
+their ETag / Last-Modified validators; the next run sends conditional requests and
+reuses the cached body on 304, or when the request fails.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterator, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+
+USER_AGENT = "VisaFlowHackathonBot/0.2 (+local demo prototype) for educational ingestion"
+FETCH_TIMEOUT_SECONDS = 30
+FETCH_WORKERS = 8
+PER_HOST_CONCURRENCY = 2
+PER_HOST_INTERVAL_SECONDS = 0.25
+
+
+class FetchResult:
+    def __init__(
+        self,
+        url: str,
+        status: str,
+        body: str = "",
+        content_type: str = "",
+        http_status: int = 0,
+        elapsed_ms: float = 0.0,
+        waited_ms: float = 0.0,
+        error: str = "",
+    ) -> None:
+        # status: "fetched" (200), "not_modified" (304, cached body), "stale" (request
+        # failed, cached body) or "failed" (request failed, nothing cached).
+        self.url = url
+        self.status = status
+        self.body = body
+        self.size = len(body.encode("utf-8"))
+        self.content_type = content_type
+        self.http_status = http_status
+        self.elapsed_ms = elapsed_ms
+        self.waited_ms = waited_ms
+        self.error = error
+
+
+class RawPageCache:
+    """Raw response bodies on disk, keyed by URL, with the validators they came with."""
+
+    def __init__(self, cache_dir: Path) -> None:
+        self._cache_dir = cache_dir
+
+    def load(self, url: str) -> Optional[dict]:
+        meta_path, body_path = self._paths(url)
+        if not meta_path.exists() or not body_path.exists():
+            return None
+        try:
+            meta = json.loads(meta_path.read_text())
+        except ValueError:
+            return None
+        if meta.get("url") != url:
+            return None
+        return {**meta, "body": body_path.read_text(encoding="utf-8")}
+
+    def store(self, url: str, body: str, etag: str, last_modified: str, content_type: str) -> None:
+        self._cache_dir.mkdir(parents=True, exist_ok=True)
+        meta_path, body_path = self._paths(url)
+        _write_atomic(body_path, body)
+        _write_atomic(
+            meta_path,
+            json.dumps(
+                {
+                    "url": url,
+                    "etag": etag,
+                    "last_modified": last_modified,
+                    "content_type": content_type,
+                    "stored_at": time.time(),
+                },
+                indent=2,
+            ),
+        )
+
+    def _paths(self, url: str) -> tuple[Path, Path]:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+        return self._cache_dir / f"{key}.json", self._cache_dir / f"{key}.html"
+
+
+class HostLimiter:
+    """Caps in-flight requests per host and spaces out their start times."""
+
+    def __init__(self, per_host: int = PER_HOST_CONCURRENCY, interval: float = PER_HOST_INTERVAL_SECONDS) -> None:
+        self._per_host = max(1, per_host)
+        self._interval = max(0.0, interval)
+        self._semaphores: dict[str, threading.Semaphore] = {}
+        self._next_start: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, host: str) -> float:
+        """Block until a request to host may start; returns the seconds waited."""
+        started = time.perf_counter()
+        with self._lock:
+            semaphore = self._semaphores.setdefault(host, threading.Semaphore(self._per_host))
+        semaphore.acquire()
+        with self._lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_start.get(host, now))
+            self._next_start[host] = start_at + self._interval
+        if start_at > now:
+            time.sleep(start_at - now)
+        return time.perf_counter() - started
+
+    def release(self, host: str) -> None:
+        with self._lock:
+            semaphore = self._semaphores[host]
+        semaphore.release()
+
+
+class SourceFetcher:
+    def __init__(
+        self,
+        cache_dir: Path,
+        workers: int = FETCH_WORKERS,
+        per_host: int = PER_HOST_CONCURRENCY,
+        host_interval: float = PER_HOST_INTERVAL_SECONDS,
+        timeout: float = FETCH_TIMEOUT_SECONDS,
+        conditional: bool = True,
+    ) -> None:
+        self._cache = RawPageCache(cache_dir)
+        self._workers = max(1, workers)
+        self._limiter = HostLimiter(per_host, host_interval)
+        self._timeout = timeout
+        self._conditional = conditional
+        self._sessions = threading.local()
+
+    def fetch_all(self, urls: list[str]) -> list[FetchResult]:
+        """Fetch every URL concurrently; results are in the order of urls."""
+        return list(self.iter_fetch(urls))
+
+    def iter_fetch(self, urls: list[str]) -> Iterator[FetchResult]:
+        """Fetch concurrently, yielding results in the order of urls as they become available."""
+        with ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="kb-fetch") as pool:
+            yield from pool.map(self.fetch, urls)
+
+    def fetch(self, url: str) -> FetchResult:
+        cached = self._cache.load(url)
+        headers = {"User-Agent": USER_AGENT}
+        if cached and self._conditional:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        host = urlsplit(url).netloc
+        waited = self._limiter.acquire(host)
+        started = time.perf_counter()
+        try:
+            response = self._session().get(url, headers=headers, timeout=self._timeout)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if response.status_code == 304 and cached:
+                return FetchResult(
+                    url,
+                    "not_modified",
+                    cached["body"],
+                    cached.get("content_type", ""),
+                    304,
+                    elapsed_ms,
+                    waited * 1000,
+                )
+            response.raise_for_status()
+        except requests.RequestException as exc:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if cached:
+                return FetchResult(
+                    url,
+                    "stale",
+                    cached["body"],
+                    cached.get("content_type", ""),
+                    elapsed_ms=elapsed_ms,
+                    waited_ms=waited * 1000,
+                    error=str(exc),
+                )
+            return FetchResult(url, "failed", elapsed_ms=elapsed_ms, waited_ms=waited * 1000, error=str(exc))
+        finally:
+            self._limiter.release(host)
+
+        content_type = response.headers.get("content-type", "")
+        self._cache.store(
+            url,
+            response.text,
+            response.headers.get("etag", ""),
+            response.headers.get("last-modified", ""),
+            content_type,
+        )
+        return FetchResult(
+            url,
+            "fetched",
+            response.text,
+            content_type,
+            response.status_code,
+            elapsed_ms,
+            waited * 1000,
+        )
+
+    def _session(self) -> requests.Session:
+        # requests.Session is not documented as thread-safe; keep one per worker.
+        session = getattr(self._sessions, "session", None)
+        if session is None:
+            session = requests.Session()
+            self._sessions.session = session
+        return session
+
+
+def timing_report(labels: list[str], results: list[FetchResult], wall_seconds: float) -> str:
+    lines = [f"{'source':<36} {'status':<13} {'http':>4} {'wait ms':>8} {'fetch ms':>9} {'KiB':>7}"]
+    for label, result in zip(labels, results):
+        lines.append(
+            f"{label[:36]:<36} {result.status:<13} {result.http_status or '-':>4} "
+            f"{result.waited_ms:>8.1f} {result.elapsed_ms:>9.1f} {result.size / 1024:>7.1f}"
+        )
+        if result.error:
+            lines.append(f"  -> {result.error}")
+
+    counts = {status: 0 for status in ("fetched", "not_modified", "stale", "failed")}
+    for result in results:
+        counts[result.status] += 1
+    request_seconds = sum(result.elapsed_ms for result in results) / 1000
+    overlap = request_seconds / wall_seconds if wall_seconds else 0.0
+    lines.append(
+        f"{len(results)} sources in {wall_seconds:.2f}s wall ({request_seconds:.2f}s of requests, {overlap:.1f}x overlap): "
+        + ", ".join(f"{count} {status.replace('_', ' ')}" for status, count in counts.items())
+    )
+    return "\n".join(lines)
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_text(text, encoding="utf-8")
+    os.replace(tmp_path, path)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""Local HTTP server with canned source pages, for running the KB fetch stage offline.
+
+Every source in app/data/source_map.json is served at /<source id> as a small HTML
+page built from its text in data/knowledge_raw.jsonl. Responses carry an ETag and a
+Last-Modified header and answer conditional requests with 304, like the real sites.
+
+    python3 scripts/kb_fixture_server.py --write-source-map /tmp/fixture_sources.json &
+    python3 scripts/build_uscis_kb.py --sources /tmp/fixture_sources.json --fetch-only
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import html
+import json
+import sys
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from threading import Thread
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from app.pipeline.kb_index import iter_records  # noqa: E402
+
+
+SOURCES_PATH = ROOT / "app" / "data" / "source_map.json"
+RAW_PATH = ROOT / "data" / "knowledge_raw.jsonl"
+
+
+class FixtureServer:
+    """Serves {path: html} pages on a background thread until stop()."""
+
+    def __init__(self, pages: dict[str, str], host: str = "127.0.0.1", port: int = 0, delay: float = 0.0) -> None:
+        last_modified = formatdate(time.time(), usegmt=True)
+        self.pages = {
+            path: (body.encode("utf-8"), f'"{hashlib.sha256(body.encode("utf-8")).hexdigest()[:16]}"', last_modified)
+            for path, body in pages.items()
+        }
+        self.delay = delay
+        self.requests: list[tuple[str, int]] = []
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FixtureServer":
+        self._thread = Thread(target=self._server.serve_forever, name="kb-fixture-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:  # noqa: N802 - http.server naming
+                if server.delay:
+                    time.sleep(server.delay)
+                page = server.pages.get(self.path)
+                if page is None:
+                    self._respond(404, b"not found")
+                    return
+                body, etag, last_modified = page
+                if self._not_modified(etag, last_modified):
+                    self._respond(304, b"", etag, last_modified)
+                    return
+                self._respond(200, body, etag, last_modified)
+
+            def _not_modified(self, etag: str, last_modified: str) -> bool:
+                if_none_match = self.headers.get("If-None-Match")
+                if if_none_match is not None:
+                    return etag in [value.strip() for value in if_none_match.split(",")]
+                if_modified_since = self.headers.get("If-Modified-Since")
+                if if_modified_since:
+                    try:
+                        return parsedate_to_datetime(if_modified_since) >= parsedate_to_datetime(last_modified)
+                    except (TypeError, ValueError):
+                        return False
+                return False
+
+            def _respond(self, status: int, body: bytes, etag: str = "", last_modified: str = "") -> None:
+                server.requests.append((self.path, status))
+                self.send_response(status)
+                if etag:
+                    self.send_header("ETag", etag)
+                    self.send_header("Last-Modified", last_modified)
+                if status != 304:
+                    self.send_header("Content-Type", "text/html; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if status != 304:
+                    self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:  # noqa: A002 - http.server signature
+                pass
+
+        return Handler
+
+
+def canned_pages() -> tuple[dict[str, str], list[dict]]:
+    """(path -> HTML page, sources rewritten to those paths) from the committed raw documents."""
+    sources = json.loads(SOURCES_PATH.read_text()).get("sources", [])
+    documents = list(iter_records(RAW_PATH)) if RAW_PATH.exists() else []
+    texts = {document["source_id"]: document["text"] for document in documents}
+
+    pages: dict[str, str] = {}
+    fixture_sources: list[dict] = []
+    for source in sources:
+        path = f"/{source['id']}"
+        text = texts.get(source["id"], f"{source['title']} fixture page.")
+        paragraphs = "".join(f"<p>{html.escape(block)}</p>" for block in text.split("\n\n"))
+        pages[path] = (
+            f"<html><head><title>{html.escape(source['title'])}</title></head><body>"
+            f"<nav>Site navigation</nav><main><h1>{html.escape(source['title'])}</h1>"
+            f"{paragraphs}</main><footer>Footer</footer></body></html>"
+        )
+        fixture_sources.append({**source, "path": path})
+    return pages, fixture_sources
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve canned KB source pages locally.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay-ms", type=float, default=50.0, help="Simulated latency per request.")
+    parser.add_argument("--write-source-map", type=Path, help="Write a source map pointing at this server.")
+    args = parser.parse_args()
+
+    pages, fixture_sources = canned_pages()
+    server = FixtureServer(pages, args.host, args.port, delay=args.delay_ms / 1000).start()
+    if args.write_source_map:
+        sources = [
+            {key: value for key, value in {**source, "url": server.base_url + source["path"]}.items() if key != "path"}
+            for source in fixture_sources
+        ]
+        args.write_source_map.write_text(json.dumps({"sources": sources}, indent=2))
+        print(f"Wrote fixture source map to {args.write_source_map}")
+    print(f"Serving {len(pages)} canned pages at {server.base_url}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""Retrieval benchmark and relevance-regression suite.
+
+Drives USCISKnowledgeBase with the citation queries PipelineEngine builds for every
+persona in data/scenarios/demo_cases.json (as-is and with a UCSD school, which
+searches the UCSD partition too), plus synthetic long intents. Reports latency
+percentiles and allocation per query across replicated corpus sizes for each path:
+"full" is retrieve(); "incremental" (lexical mode) is retrieve_incremental() on stable
+scores kept from session start, which is how sessions get citations on every event.
+Then checks recall@k of the persona queries against
+data/scenarios/retrieval_expectations.json, and that both paths rank alike.
+Exits non-zero when either fails; pass --record after an intended ranking change.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from functools import partial
+from pathlib import Path
+from typing import Callable
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from app.models import StartSessionRequest  # noqa: E402
+from app.pipeline.engine import PipelineEngine  # noqa: E402
+from app.pipeline.kb_index import iter_records  # noqa: E402
+from app.pipeline.uscis_knowledge import RETRIEVAL_MODES, TOKEN_RE, USCISKnowledgeBase  # noqa: E402
+from bench_kb_retrieval import replicate_chunks, synthetic_intent  # noqa: E402
+
+# (stable query, per-event delta query, flow_id, school partition), as the engine splits it.
+Workload = list[tuple[str, str, str, str]]
+
+
+CHUNKS_PATH = ROOT / "data" / "knowledge_chunks.jsonl"
+SCENARIOS_PATH = ROOT / "data" / "scenarios" / "demo_cases.json"
+EXPECTATIONS_PATH = ROOT / "data" / "scenarios" / "retrieval_expectations.json"
+UCSD_SCHOOL = "UC San Diego"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark KB retrieval and gate on recall@k.")
+    parser.add_argument("--mode", choices=RETRIEVAL_MODES, default="lexical")
+    parser.add_argument("--replicas", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--synthetic", type=int, default=50, help="Synthetic intents per length.")
+    parser.add_argument("--intent-chars", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--repeat", type=int, default=5, help="Timed passes over the workload.")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--record", action="store_true", help="Overwrite expectations with current results.")
+    parser.add_argument("--skip-bench", action="store_true", help="Only run the relevance check.")
+    args = parser.parse_args()
+
+    chunks = list(iter_records(CHUNKS_PATH))
+    engine = PipelineEngine(kb=USCISKnowledgeBase(str(CHUNKS_PATH), cache_size=0))
+    cases = persona_cases(engine)
+
+    if not args.skip_bench:
+        words = [tok for chunk in chunks for tok in TOKEN_RE.findall(chunk["text"])]
+        rng = random.Random(args.seed)
+        workload = [(case["stable"], case["delta"], case["flow_id"], case["school"]) for case in cases]
+        for intent_chars in args.intent_chars:
+            for _ in range(args.synthetic):
+                workload.append(citation_workload(engine, synthetic_intent(rng, words, intent_chars), {}))
+        run_benchmark(args, chunks, workload)
+
+    recall_ok = check_recall(args, engine.kb, cases)
+    paths_ok = check_paths_agree(args, engine.kb, cases)
+    sys.exit(0 if recall_ok and paths_ok else 1)
+
+
+def persona_cases(engine: PipelineEngine) -> list[dict]:
+    scenarios = json.loads(SCENARIOS_PATH.read_text()).get("scenarios", [])
+    cases: list[dict] = []
+    for scenario in scenarios:
+        fields = dict(scenario.get("initial_fields", {}))
+        for case_id, case_fields in (
+            (scenario["scenario_id"], fields),
+            (f"{scenario['scenario_id']}@ucsd", {**fields, "school_name": UCSD_SCHOOL}),
+        ):
+            stable, delta, flow_id, school = citation_workload(engine, scenario["intent"], case_fields)
+            cases.append(
+                {
+                    "case_id": case_id,
+                    "query": f"{stable} {delta}",
+                    "stable": stable,
+                    "delta": delta,
+                    "flow_id": flow_id,
+                    "school": school,
+                }
+            )
+    return cases
+
+
+def citation_workload(engine: PipelineEngine, intent: str, fields: dict) -> tuple[str, str, str, str]:
+    """The (stable, delta, flow_id, school) the engine would retrieve with for a new session."""
+    session, _, _ = engine.start_session(StartSessionRequest(intent=intent, initial_fields=fields))
+    return (
+        engine._citation_query_stable(session),
+        engine._citation_query_delta(session),
+        session.selected_flow_id,
+        engine._school_partition(session),
+    )
+
+
+def retrieval_paths(kb: USCISKnowledgeBase, workload: Workload, top_k: int) -> dict[str, list[Callable[[], list]]]:
+    """One call per workload query for each retrieval path (see the module docstring)."""
+    paths = {
+        "full": [
+            partial(kb.retrieve, query=f"{stable} {delta}", top_k=top_k, flow_id=flow_id, school=school)
+            for stable, delta, flow_id, school in workload
+        ]
+    }
+    if kb.mode == "lexical":
+        incremental = []
+        for stable, delta, flow_id, school in workload:
+            # Built once per session by the engine, so outside the timed call.
+            stable_scores = kb.stable_scores(stable, flow_id=flow_id, school=school)
+            incremental.append(
+                partial(
+                    kb.retrieve_incremental,
+                    stable,
+                    delta,
+                    lambda scores=stable_scores: scores,
+                    top_k=top_k,
+                    flow_id=flow_id,
+                    school=school,
+                )
+            )
+        paths["incremental"] = incremental
+    return paths
+
+
+def run_benchmark(args: argparse.Namespace, chunks: list[dict], workload: Workload) -> None:
+    print(f"{len(workload)} queries x {args.repeat} passes, mode={args.mode}, top_k={args.top_k}")
+    print(
+        f"{'replicas':>8} {'chunks':>7} {'path':>11} {'load ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+        f"{'peak KiB/q':>11} {'blocks/q':>9}"
+    )
+    for replicas in args.replicas:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "chunks.json"
+            path.write_text(json.dumps({"chunks": replicate_chunks(chunks, replicas)}))
+            started = time.perf_counter()
+            kb = USCISKnowledgeBase(str(path), cache_size=0, mode=args.mode)
+            load_ms = (time.perf_counter() - started) * 1000
+            for path_name, calls in retrieval_paths(kb, workload, args.top_k).items():
+                # Untimed pass so lazily built structures (flow sets, vectors) are excluded.
+                for call in calls:
+                    call()
+
+                timings: list[float] = []
+                for _ in range(args.repeat):
+                    for call in calls:
+                        started = time.perf_counter()
+                        call()
+                        timings.append((time.perf_counter() - started) * 1000)
+                percentiles = statistics.quantiles(timings, n=100, method="inclusive")
+                peak_kib, blocks = allocation_profile(calls)
+                print(
+                    f"{replicas:>8} {len(chunks) * replicas:>7} {path_name:>11} {load_ms:>8.1f} "
+                    f"{percentiles[49]:>8.3f} {percentiles[94]:>8.3f} {percentiles[98]:>8.3f} "
+                    f"{peak_kib:>11.1f} {blocks:>9.0f}"
+                )
+
+
+def allocation_profile(calls: list[Callable[[], list]]) -> tuple[float, float]:
+    """Mean peak traced KiB and mean net new memory blocks per query (tracemalloc; untimed)."""
+    peaks: list[float] = []
+    blocks: list[int] = []
+    tracemalloc.start()
+    try:
+        for call in calls:
+            tracemalloc.reset_peak()
+            before = tracemalloc.take_snapshot()
+            call()
+            _, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+            peaks.append(peak / 1024)
+            blocks.append(sum(max(0, stat.count_diff) for stat in after.compare_to(before, "traceback")))
+    finally:
+        tracemalloc.stop()
+    return statistics.mean(peaks), statistics.mean(blocks)
+
+
+def check_recall(args: argparse.Namespace, kb: USCISKnowledgeBase, cases: list[dict]) -> bool:
+    results = {
+        case["case_id"]: [
+            citation.source_id
+            for citation in kb.retrieve(
+                query=case["query"],
+                top_k=args.top_k,
+                flow_id=case["flow_id"],
+                school=case["school"],
+                mode=args.mode,
+            )
+        ]
+        for case in cases
+    }
+
+    if args.record:
+        payload = {
+            "top_k": args.top_k,
+            "mode": args.mode,
+            "cases": {case_id: {"expected_source_ids": source_ids} for case_id, source_ids in results.items()},
+        }
+        EXPECTATIONS_PATH.write_text(json.dumps(payload, indent=2) + "\n")
+        print(f"Recorded expectations for {len(results)} cases to {EXPECTATIONS_PATH}")
+        return True
+
+    expectations = json.loads(EXPECTATIONS_PATH.read_text())
+    if expectations.get("mode", "lexical") != args.mode:
+        print(f"Expectations were recorded for mode={expectations.get('mode')}; skipping recall check.")
+        return True
+
+    top_k = int(expectations.get("top_k", args.top_k))
+    recalls: list[float] = []
+    print(f"\nrecall@{top_k}")
+    for case_id, expected in expectations.get("cases", {}).items():
+        expected_ids = expected.get("expected_source_ids", [])
+        retrieved = results.get(case_id)
+        if retrieved is None:
+            print(f"  {case_id:<36} missing from scenarios")
+            recalls.append(0.0)
+            continue
+        hits = set(expected_ids) & set(retrieved[:top_k])
+        recall = len(hits) / len(expected_ids) if expected_ids else 1.0
+        recalls.append(recall)
+        missed = [source_id for source_id in expected_ids if source_id not in hits]
+        print(f"  {case_id:<36} {recall:.2f}" + (f"  missed: {', '.join(missed)}" if missed else ""))
+
+    mean_recall = statistics.mean(recalls) if recalls else 1.0
+    regressed = any(recall < 1.0 for recall in recalls)
+    print(f"  {'mean':<36} {mean_recall:.2f}")
+    if regressed:
+        print("FAIL: recall regressed against recorded expectations (re-run with --record if intended).")
+    return not regressed
+
+
+def check_paths_agree(args: argparse.Namespace, kb: USCISKnowledgeBase, cases: list[dict]) -> bool:
+    """The incremental path must rank the persona queries exactly like the full one."""
+    if kb.mode != "lexical":
+        return True
+    workload = [(case["stable"], case["delta"], case["flow_id"], case["school"]) for case in cases]
+    paths = retrieval_paths(kb, workload, args.top_k)
+    diverged = [
+        case["case_id"]
+        for case, full, incremental in zip(cases, paths["full"], paths["incremental"])
+        if [citation.source_id for citation in full()] != [citation.source_id for citation in incremental()]
+    ]
+    for case_id in diverged:
+        print(f"  {case_id:<36} incremental ranking differs from full retrieve()")
+    if diverged:
+        print("FAIL: retrieve_incremental diverged from retrieve.")
+    return not diverged
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from app.pipeline.schools import SchoolResolver  # noqa: E402
+from app.pipeline.uscis_knowledge import RETRIEVAL_MODES, USCISKnowledgeBase  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Query the KB and report per-query latency for each retrieval mode.")
+    parser.add_argument("queries", nargs="*", help="Queries to run; read one per line from stdin when omitted.")
+    parser.add_argument("--modes", nargs="+", choices=RETRIEVAL_MODES, default=list(RETRIEVAL_MODES))
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--flow-id", default="")
+    parser.add_argument("--school", default="", help="School name, resolved to its KB partition.")
+    args = parser.parse_args()
+
+    queries = args.queries or [line.strip() for line in sys.stdin if line.strip()]
+    kb = USCISKnowledgeBase(str(ROOT / "data" / "knowledge_chunks.jsonl"), cache_size=0)
+    school = SchoolResolver(str(ROOT / "app" / "data" / "source_map.json")).resolve(args.school)
+    # Warm-up so a vectors file missing on disk is built before anything is timed.
+    for mode in args.modes:
+        kb.retrieve("warm up", top_k=1, mode=mode)
+
+    for query in queries:
+        print(query)
+        for mode in args.modes:
+            started = time.perf_counter()
+            citations = kb.retrieve(
+                query=query,
+                top_k=args.top_k,
+                flow_id=args.flow_id,
+                school=school,
+                mode=mode,
+            )
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            sources = ", ".join(citation.source_id for citation in citations) or "-"
+            print(f"  {mode:<8} {elapsed_ms:8.3f} ms  {sources}")
+
+
+if __name__ == "__main__":
+    main()
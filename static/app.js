@@ -2,8 +2,21 @@ const state = {
   session: null,
   scenarios: [],
   lastReason: "Fill the input form to generate your plan.",
+  // Events not yet sent, and the field values they set, so a burst of edits builds on itself.
+  pendingEvents: [],
+  pendingFields: {},
+  flushTimer: null,
+  // Settles when the batch in flight (if any) has been answered; batches go one at a time.
+  flushing: Promise.resolve(),
+  // No batch is sent before this time (ms since epoch) after the server asked to retry later.
+  retryAt: 0,
 };
 
+// Quiet period after the last queued edit before the queue is sent as one batch.
+const EVENT_BATCH_DELAY_MS = 250;
+// Wait before resending a batch when the server gives no Retry-After.
+const EVENT_RETRY_DELAY_MS = 1000;
+
 const FIELD_LABELS = {
   school_name: "School / university",
   status_type: "Current status",
@@ -267,18 +280,69 @@ async function startSession() {
   setTab("process");
 }
 
-async function sendEvent(eventType, payload = {}) {
+function queueEvent(eventType, payload = {}) {
   if (!state.session) {
     return;
   }
 
-  const res = await fetch(`/api/session/${state.session.session_id}/event`, {
-    method: "POST",
-    headers: { "Content-Type": "application/json" },
-    body: JSON.stringify({ event_type: eventType, payload }),
-  });
+  state.pendingEvents.push({ event_type: eventType, payload });
+  if (eventType === "field_update") {
+    state.pendingFields[payload.field] = payload.value;
+  }
+  clearTimeout(state.flushTimer);
+  state.flushTimer = setTimeout(flushEvents, EVENT_BATCH_DELAY_MS);
+}
 
+async function sendEvent(eventType, payload = {}) {
+  queueEvent(eventType, payload);
+  await flushEvents();
+}
+
+function flushEvents() {
+  clearTimeout(state.flushTimer);
+  state.flushTimer = null;
+  // Chained, so batches reach the server and their responses render in queue order.
+  state.flushing = state.flushing.then(sendBatch);
+  return state.flushing;
+}
+
+async function sendBatch() {
+  const backoff = state.retryAt - Date.now();
+  if (backoff > 0) {
+    await new Promise((resolve) => setTimeout(resolve, backoff));
+  }
+  if (!state.session || !state.pendingEvents.length) {
+    return;
+  }
+
+  const events = state.pendingEvents;
+  state.pendingEvents = [];
+  let res = null;
+  try {
+    res = await fetch(`/api/session/${state.session.session_id}/events`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ events }),
+    });
+  } catch (error) {
+    res = null;
+  }
+
+  if (!res || res.status >= 500) {
+    // Busy (503) or unreachable: keep the batch ahead of anything queued since and resend it.
+    state.pendingEvents = events.concat(state.pendingEvents);
+    const retryAfter = Number(res && res.headers.get("Retry-After"));
+    const delay = retryAfter > 0 ? retryAfter * 1000 : EVENT_RETRY_DELAY_MS;
+    state.retryAt = Date.now() + delay;
+    clearTimeout(state.flushTimer);
+    state.flushTimer = setTimeout(flushEvents, delay);
+    return;
+  }
+
+  settlePendingFields(events);
   if (!res.ok) {
+    // Rejected outright (e.g. an unknown session): resending would fail the same way.
+    render();
     return;
   }
 
@@ -288,6 +352,22 @@ async function sendEvent(eventType, payload = {}) {
   render();
 }
 
+function settlePendingFields(events) {
+  // Fields a queued event sets again keep their pending value; the rest now read from the session.
+  const queued = new Set(
+    state.pendingEvents.filter((event) => event.event_type === "field_update").map((event) => event.payload.field),
+  );
+  events.forEach((event) => {
+    if (event.event_type === "field_update" && !queued.has(event.payload.field)) {
+      delete state.pendingFields[event.payload.field];
+    }
+  });
+}
+
+function fieldValue(session, field) {
+  return field in state.pendingFields ? state.pendingFields[field] : session.fields[field];
+}
+
 function render() {
   const session = state.session;
   if (!session) {
@@ -472,7 +552,7 @@ function renderMissing(missingItems, target) {
 
 function renderDocsChecklist(session) {
   const docs = getRequiredDocs(session);
-  const availableDocs = parseDocuments(session.fields.documents_available || "");
+  const availableDocs = parseDocuments(fieldValue(session, "documents_available") || "");
 
   els.docsChecklist.innerHTML = "";
 
@@ -539,7 +619,7 @@ async function updateDocumentAvailability(doc, checked) {
     return;
   }
 
-  const current = parseDocuments(state.session.fields.documents_available || "");
+  const current = parseDocuments(fieldValue(state.session, "documents_available") || "");
   if (checked) {
     current.add(doc);
   } else {
@@ -547,7 +627,9 @@ async function updateDocumentAvailability(doc, checked) {
   }
 
   const value = Array.from(current).sort().join(", ");
-  await sendEvent("field_update", { field: "documents_available", value });
+  queueEvent("field_update", { field: "documents_available", value });
+  // Show the toggle right away; the server catches up when the batch is sent.
+  render();
 }
 
 function parseDocuments(raw) {
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import json
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from app.pipeline.kb_index import iter_records  # noqa: E402
+
+CHUNKS_PATH = ROOT / "data" / "knowledge_chunks.jsonl"
+
+
+def replicate_chunks(chunks: list[dict], replicas: int, seed: int = 11) -> list[dict]:
+    """The corpus with distinct sources per replica, each dropping a random 20% of words."""
+    rng = random.Random(seed)
+    replicated: list[dict] = []
+    for replica in range(replicas):
+        for chunk in chunks:
+            if not replica:
+                replicated.append(chunk)
+                continue
+            suffix = f"~r{replica}"
+            replicated.append(
+                {
+                    **chunk,
+                    "chunk_id": f"{chunk['chunk_id']}{suffix}",
+                    "source_id": f"{chunk['source_id']}{suffix}",
+                    "text": " ".join(word for word in chunk["text"].split() if rng.random() >= 0.2),
+                }
+            )
+    return replicated
+
+
+@pytest.fixture(scope="session")
+def corpus_chunks() -> list[dict]:
+    return list(iter_records(CHUNKS_PATH))
+
+
+@pytest.fixture(scope="session")
+def replicated_chunks_path(tmp_path_factory: pytest.TempPathFactory, corpus_chunks: list[dict]) -> Path:
+    """The KB replicated x5 (about 500 chunks), so top-k pruning has sources to skip."""
+    path = tmp_path_factory.mktemp("kb") / "chunks.json"
+    path.write_text(json.dumps({"chunks": replicate_chunks(corpus_chunks, 5)}))
+    return path
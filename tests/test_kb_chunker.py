@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+sys.path.insert(0, str(ROOT / "scripts"))
+
+from kb_chunker import iter_sentences  # noqa: E402
+
+
+def sentences(text: str) -> list[str]:
+    return [sentence for sentence, _, _ in iter_sentences(text)]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "Students working in the U.S. Department of Labor programs need an EAD card before they start.",
+        "Bring a status document, e.g. Form I-20 or a DS-2019, to the appointment with the DSO.",
+        "Your medical exam must be signed by Dr. Patel or another USCIS civil surgeon before you file.",
+    ],
+)
+def test_abbreviations_do_not_end_sentences(text):
+    assert sentences(text) == [text]
+
+
+def test_sentences_still_split_at_boundaries():
+    text = "File Form I-765 online. Wait for the receipt notice! Did the U.S. embassy reply? 90 days is typical."
+    assert sentences(text) == [
+        "File Form I-765 online.",
+        "Wait for the receipt notice!",
+        "Did the U.S. embassy reply?",
+        "90 days is typical.",
+    ]
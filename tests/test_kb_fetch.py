@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+from conftest import ROOT
+
+sys.path.insert(0, str(ROOT / "scripts"))
+
+from kb_fetch import SourceFetcher  # noqa: E402
+from kb_fixture_server import FixtureServer  # noqa: E402
+
+PAGE = "<html><body><h1>Form I-485</h1><p>Adjustment of status.</p></body></html>"
+
+
+def test_fetch_revalidates_then_falls_back_to_cache(tmp_path: Path) -> None:
+    server = FixtureServer({"/i-485": PAGE}).start()
+    url = f"{server.base_url}/i-485"
+    fetcher = SourceFetcher(tmp_path / "raw", host_interval=0.0, timeout=5)
+    try:
+        first = fetcher.fetch(url)
+        second = fetcher.fetch(url)
+    finally:
+        server.stop()
+    third = fetcher.fetch(url)
+
+    assert (first.status, first.http_status, first.body) == ("fetched", 200, PAGE)
+    assert (second.status, second.http_status, second.body) == ("not_modified", 304, PAGE)
+    assert third.status == "stale"
+    assert third.body == PAGE
+    assert third.error
+    assert server.requests == [("/i-485", 200), ("/i-485", 304)]
+
+
+def test_fetch_without_cache_fails_when_server_is_down(tmp_path: Path) -> None:
+    server = FixtureServer({"/i-485": PAGE}).start()
+    url = f"{server.base_url}/i-485"
+    server.stop()
+
+    result = SourceFetcher(tmp_path / "raw", host_interval=0.0, timeout=5).fetch(url)
+
+    assert result.status == "failed"
+    assert result.body == ""
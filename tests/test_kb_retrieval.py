@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from app.pipeline.kb_index import TOKEN_RE
+from app.pipeline import uscis_knowledge
+from app.pipeline.uscis_knowledge import USCISKnowledgeBase
+
+TOP_K = 5
+QUERY_COUNT = 300
+
+
+@pytest.fixture(scope="module")
+def pruned_kb(replicated_chunks_path) -> USCISKnowledgeBase:
+    return USCISKnowledgeBase(str(replicated_chunks_path), cache_size=0, pruning=True)
+
+
+@pytest.fixture(scope="module")
+def exhaustive_kb(replicated_chunks_path) -> USCISKnowledgeBase:
+    return USCISKnowledgeBase(str(replicated_chunks_path), cache_size=0, pruning=False)
+
+
+@pytest.fixture(scope="module")
+def random_queries(corpus_chunks) -> list[tuple[str, str, str]]:
+    """(query, flow_id, school) with 1-12 corpus words, a random flow (or none) and school (or none)."""
+    rng = random.Random(5)
+    words = sorted({word for chunk in corpus_chunks for word in TOKEN_RE.findall(chunk["text"].lower())})
+    flows = sorted({flow for chunk in corpus_chunks for flow in chunk["flows"]})
+    schools = sorted({chunk.get("school_id", "") for chunk in corpus_chunks} - {""})
+    return [
+        (
+            " ".join(rng.choice(words) for _ in range(rng.randint(1, 12))),
+            rng.choice(["", *flows]),
+            rng.choice(["", *schools]),
+        )
+        for _ in range(QUERY_COUNT)
+    ]
+
+
+def ranking(citations) -> list[str]:
+    return [citation.source_id for citation in citations]
+
+
+def test_pruned_matches_exhaustive(pruned_kb, exhaustive_kb, random_queries):
+    for query, flow_id, school in random_queries:
+        pruned = pruned_kb.retrieve(query, top_k=TOP_K, flow_id=flow_id, school=school)
+        exhaustive = exhaustive_kb.retrieve(query, top_k=TOP_K, flow_id=flow_id, school=school)
+        assert ranking(pruned) == ranking(exhaustive), (query, flow_id, school)
+
+
+def test_random_queries_find_citations(pruned_kb, random_queries):
+    # Guards the comparisons above against passing on empty rankings.
+    found = sum(
+        bool(pruned_kb.retrieve(query, top_k=TOP_K, flow_id=flow_id, school=school))
+        for query, flow_id, school in random_queries
+    )
+    assert found > QUERY_COUNT * 0.9
+
+
+@pytest.mark.parametrize("block_queries", [None, 7])
+def test_batch_matches_single_queries(pruned_kb, random_queries, monkeypatch, block_queries):
+    if block_queries is not None:
+        # Score the batch in several blocks of block_queries rows.
+        monkeypatch.setattr(uscis_knowledge, "BATCH_SCORE_CELLS", pruned_kb.snapshot.doc_count * block_queries)
+    queries, flow_ids, schools = (list(column) for column in zip(*random_queries))
+    batched = pruned_kb.retrieve_batch(queries, flow_ids=flow_ids, schools=schools, top_k=TOP_K)
+    for (query, flow_id, school), citations in zip(random_queries, batched):
+        single = pruned_kb.retrieve(query, top_k=TOP_K, flow_id=flow_id, school=school)
+        assert ranking(citations) == ranking(single), (query, flow_id, school)
+
+
+def test_incremental_matches_full_query(pruned_kb, random_queries):
+    rng = random.Random(9)
+    for query, flow_id, school in random_queries:
+        words = query.split()
+        split = rng.randint(0, len(words))
+        stable, delta = " ".join(words[:split]), " ".join(words[split:])
+        stable_scores = pruned_kb.stable_scores(stable, flow_id=flow_id, school=school)
+        incremental = pruned_kb.retrieve_incremental(
+            stable, delta, lambda: stable_scores, top_k=TOP_K, flow_id=flow_id, school=school
+        )
+        full = pruned_kb.retrieve(f"{stable} {delta}", top_k=TOP_K, flow_id=flow_id, school=school)
+        assert ranking(incremental) == ranking(full), (stable, delta, flow_id, school)
+
+
+def test_incremental_shares_the_result_cache(replicated_chunks_path):
+    kb = USCISKnowledgeBase(str(replicated_chunks_path), cache_size=8)
+    calls = []
+
+    def stable_scores():
+        calls.append(1)
+        return kb.stable_scores("cpt employer letter", flow_id="cpt_prep")
+
+    kb.retrieve("cpt employer letter missing: school_name", flow_id="cpt_prep")
+    kb.retrieve_incremental("cpt employer letter", "missing: school_name", stable_scores, flow_id="cpt_prep")
+    assert kb.cache_stats()["hits"] == 1
+    assert not calls
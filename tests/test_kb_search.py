@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import pytest
+
+from app.pipeline.kb_search import KBSearch, _decode_cursor, _encode_cursor
+from app.pipeline.uscis_knowledge import USCISKnowledgeBase, _tokenize
+
+QUERY = "employment authorization training"
+PAGE_SIZE = 7
+
+
+@pytest.fixture(scope="module")
+def search(replicated_chunks_path) -> KBSearch:
+    return KBSearch(USCISKnowledgeBase(str(replicated_chunks_path), cache_size=0))
+
+
+@pytest.fixture(scope="module")
+def kb(search) -> USCISKnowledgeBase:
+    return search._kb
+
+
+def test_cursor_pages_cover_the_full_ranking(search, kb):
+    tokens = _tokenize(QUERY)
+    chunk_indexes, scores = kb.snapshot.rank_all(QUERY, tokens)
+    expected = [hit.chunk_id for hit in kb.snapshot.search_hits(chunk_indexes.tolist(), scores.tolist(), tokens)]
+
+    page = search.search(QUERY, page_size=PAGE_SIZE)
+    assert not page.cached
+    chunk_ids = [hit.chunk_id for hit in page.hits]
+    while page.next_cursor:
+        page = search.search(QUERY, page_size=PAGE_SIZE, cursor=page.next_cursor)
+        assert page.cached
+        chunk_ids.extend(hit.chunk_id for hit in page.hits)
+    assert len(expected) > PAGE_SIZE
+    assert page.total == len(expected)
+    assert chunk_ids == expected
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    ["not a cursor!", "W10", _encode_cursor("result", -1, "version"), _encode_cursor("result", 1, "version")[:-3]],
+)
+def test_malformed_cursor_is_rejected(search, cursor):
+    with pytest.raises(ValueError, match="Malformed cursor"):
+        search.search(QUERY, cursor=cursor)
+
+
+def test_cursor_for_another_query_is_rejected(search):
+    cursor = search.search("cap gap extension", page_size=1).next_cursor
+    with pytest.raises(ValueError, match="different query"):
+        search.search(QUERY, cursor=cursor)
+
+
+def test_cursor_from_another_kb_version_is_rejected(search):
+    result_id, offset, _ = _decode_cursor(search.search(QUERY, page_size=1).next_cursor)
+    with pytest.raises(ValueError, match="reload"):
+        search.search(QUERY, cursor=_encode_cursor(result_id, offset, "00000000"))
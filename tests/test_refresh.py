@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import copy
+import json
+import random
+
+import pytest
+
+from app.models import EventRequest, InterfaceMode, MicroCheckRequest, StartSessionRequest
+from app.pipeline.engine import PipelineEngine
+from app.pipeline.refresh import INPUTS
+from conftest import ROOT
+
+FIELD_VALUES = ["", "f1", "enrolled", "2025-06-01", "UCSD", "Acme", "yes", "graduated"]
+EVENTS_PER_SESSION = 25
+
+
+@pytest.fixture(scope="module")
+def engine() -> PipelineEngine:
+    return PipelineEngine()
+
+
+def derived_state(session) -> str:
+    data = session.to_model().model_dump(mode="json", exclude={"updated_at"})
+    return json.dumps(data, sort_keys=True)
+
+
+def fully_refreshed(engine: PipelineEngine, session):
+    """A copy of session with every derived stage recomputed, as if all inputs changed."""
+    recomputed = copy.deepcopy(session)
+    engine._refresh_pass(recomputed, "full").run(set(INPUTS))
+    return recomputed
+
+
+def random_action(engine: PipelineEngine, rng: random.Random, session, flows: list[str]):
+    kind = rng.choice(["field", "field", "field", "mark", "unmark", "mode", "help", "flow", "check"])
+    if kind == "check":
+        check = rng.choice(session.available_micro_checks)
+        request = MicroCheckRequest(check_id=check.check_id, selected_option=rng.choice(check.options))
+        return lambda: engine.apply_micro_check(session, request)
+    if kind == "field":
+        field_name = rng.choice(session.required_entities + ["school_name", "notes"])
+        payload = {"field": field_name, "value": rng.choice(FIELD_VALUES)}
+        event = EventRequest(event_type="field_update", payload=payload)
+    elif kind in ("mark", "unmark"):
+        step_id = rng.choice(session.workflow).step_id if session.workflow else ""
+        event = EventRequest(event_type="mark_step" if kind == "mark" else "unmark_step", payload={"step_id": step_id})
+    elif kind == "mode":
+        mode = rng.choice([item.value for item in InterfaceMode])
+        event = EventRequest(event_type="mode_change", payload={"mode": mode})
+    elif kind == "flow":
+        event = EventRequest(event_type="select_flow", payload={"flow_id": rng.choice(flows)})
+    else:
+        event = EventRequest(event_type="ask_help", payload={})
+    return lambda: engine.apply_event(session, event)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_dirty_refresh_matches_full_recompute(engine, seed):
+    rng = random.Random(seed)
+    scenarios = json.loads((ROOT / "data" / "scenarios" / "demo_cases.json").read_text())["scenarios"]
+    flows = [pack.flow_id for pack in engine.flow_store.list()]
+    for scenario in scenarios:
+        request = StartSessionRequest(intent=scenario["intent"], initial_fields=scenario.get("initial_fields", {}))
+        session, _, _ = engine.start_session(request)
+        for step in range(EVENTS_PER_SESSION):
+            random_action(engine, rng, session, flows)()
+            expected = derived_state(fully_refreshed(engine, session))
+            assert derived_state(session) == expected, (scenario["scenario_id"], step)
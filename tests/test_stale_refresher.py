@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import asyncio
+import copy
+
+import pytest
+
+from app.executor import EngineExecutor, StaleRefresher
+from app.models import EventRequest, StartSessionRequest
+from app.pipeline.engine import PipelineEngine
+from app.state import SessionStore
+
+
+@pytest.fixture(scope="module")
+def engine() -> PipelineEngine:
+    return PipelineEngine()
+
+
+def field_update(field_name: str, value: str) -> EventRequest:
+    return EventRequest(event_type="field_update", payload={"field": field_name, "value": value})
+
+
+def select_flow(flow_id: str) -> EventRequest:
+    return EventRequest(event_type="select_flow", payload={"flow_id": flow_id})
+
+
+def caught_up(engine: PipelineEngine, session):
+    """A copy of session with its deferred stages run, as the refresher should leave it."""
+    refreshed = copy.deepcopy(session)
+    engine.refresh_stale(refreshed)
+    return refreshed
+
+
+def deferred_session(engine: PipelineEngine, store: SessionStore):
+    session, _, _ = engine.start_session(StartSessionRequest(intent="I am on F-1 OPT and starting a new job"))
+    engine.apply_events(session, [field_update("school_name", "UCSD")], defer_optional=True)
+    assert session.stale == ["citations"]
+    return store.create(session)
+
+
+class GatedExecutor(EngineExecutor):
+    """Inline executor whose refresh_stale() calls wait for open, so events can land meanwhile.
+
+    Each call puts the flow of the snapshot it got on entered, in order.
+    """
+
+    def __init__(self, engine: PipelineEngine) -> None:
+        super().__init__(engine, mode="inline")
+        self.open = asyncio.Event()
+        self.entered: asyncio.Queue[str] = asyncio.Queue()
+        self.refreshed_flows: list[str] = []
+
+    async def refresh_stale(self, session):
+        self.refreshed_flows.append(session.selected_flow_id)
+        self.entered.put_nowait(session.selected_flow_id)
+        await self.open.wait()
+        return await super().refresh_stale(session)
+
+
+def test_result_of_a_superseded_snapshot_is_dropped(engine, monkeypatch):
+    store = SessionStore()
+    session = deferred_session(engine, store)
+    first_flow = session.selected_flow_id
+    other_flow = next(pack.flow_id for pack in engine.flow_store.list() if pack.flow_id != first_flow)
+    adopted: list[bool] = []
+    adopt_stale = engine.adopt_stale
+
+    def recording_adopt(current, refreshed):
+        adopted.append(adopt_stale(current, refreshed))
+        return adopted[-1]
+
+    monkeypatch.setattr(engine, "adopt_stale", recording_adopt)
+
+    async def scenario() -> None:
+        executor = GatedExecutor(engine)
+        refresher = StaleRefresher(executor, store)
+        refresher.schedule(session.session_id)
+        assert await executor.entered.get() == first_flow
+
+        # The job has its snapshot and released the lock; an event lands before it adopts.
+        async with executor.session_lock(session.session_id):
+            await executor.apply_events(session, [select_flow(other_flow)], defer_optional=True)
+            store.save(session)
+        assert session.stale == ["citations"]
+        refresher.schedule(session.session_id)
+        assert await executor.entered.get() == other_flow
+
+        # Both refreshes are in flight; the older one finishes first and must not be adopted.
+        executor.open.set()
+        await refresher.wait(session.session_id)
+
+    asyncio.run(scenario())
+
+    assert adopted == [False, True]
+    assert session.stale == []
+    assert session.citations == caught_up(engine, session).citations
+
+
+def test_schedules_before_a_job_starts_coalesce(engine):
+    store = SessionStore()
+    session = deferred_session(engine, store)
+    expected = caught_up(engine, session).citations
+
+    async def scenario() -> None:
+        executor = GatedExecutor(engine)
+        executor.open.set()
+        refresher = StaleRefresher(executor, store)
+        for _ in range(3):
+            refresher.schedule(session.session_id)
+        await refresher.wait(session.session_id)
+        assert executor.refreshed_flows == [session.selected_flow_id]
+
+        # Nothing is stale any more, so a later job drops out without refreshing.
+        refresher.schedule(session.session_id)
+        await refresher.wait(session.session_id)
+        assert executor.refreshed_flows == [session.selected_flow_id]
+
+    asyncio.run(scenario())
+
+    assert session.stale == []
+    assert session.citations == expected